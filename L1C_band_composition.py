@@ -27,7 +27,7 @@ import os
 import os.path as op
 import sys
 
-import otbApplication
+import otb_factory
 import importlib.util
 import string
 import secrets
@@ -60,7 +60,7 @@ def create_composit_band(bands_full_paths, out_tif, resolution=60, composit_type
         if len(bands_full_paths) != 2:
             print('Impossible to continue: 2 bands needs to be given for the ND')
         else:
-            BandMathX = otbApplication.Registry.CreateApplication("BandMathX")
+            BandMathX = otb_factory.create_application("BandMathX")
             BandMathX.SetParameterStringList("il", temp_bands_full_paths)
             BandMathX.SetParameterString("out", str(out_tif))
             # 0.01 avoid having NaN in the result
@@ -73,7 +73,7 @@ def create_composit_band(bands_full_paths, out_tif, resolution=60, composit_type
         if len(bands_full_paths) != 2:
             print('Impossible to continue: 2 bands needs to be given for the D')
         else:
-            BandMathX = otbApplication.Registry.CreateApplication("BandMathX")
+            BandMathX = otb_factory.create_application("BandMathX")
             BandMathX.SetParameterStringList("il", temp_bands_full_paths)
             BandMathX.SetParameterString("out", str(out_tif))
             BandMathX.SetParameterString("exp", "(im1b1-im2b1)")
@@ -85,7 +85,7 @@ def create_composit_band(bands_full_paths, out_tif, resolution=60, composit_type
         if len(bands_full_paths) != 2:
             print('Impossible to continue: 2 bands needs to be given for the R')
         else:
-            BandMathX = otbApplication.Registry.CreateApplication("BandMathX")
+            BandMathX = otb_factory.create_application("BandMathX")
             BandMathX.SetParameterStringList("il", temp_bands_full_paths)
             BandMathX.SetParameterString("out", str(out_tif))
             BandMathX.SetParameterString("exp", "(im1b1+0.01)/(im2b1+0.01)")
@@ -181,7 +181,7 @@ def create_contours_density(in_tif, in_channel, out_tif, radius=3, resolution=60
     resize_band(in_tif, out_band=temp_tif, pixelresX=resolution, pixelresY=resolution)
 
     # Compute the contours of the image
-    EdgeExtraction = otbApplication.Registry.CreateApplication("EdgeExtraction")
+    EdgeExtraction = otb_factory.create_application("EdgeExtraction")
     EdgeExtraction.SetParameterString("in", str(temp_tif))
     EdgeExtraction.SetParameterInt("channel", int(in_channel))
     EdgeExtraction.SetParameterString("filter", "gradient")
@@ -189,7 +189,7 @@ def create_contours_density(in_tif, in_channel, out_tif, radius=3, resolution=60
     EdgeExtraction.Execute()
 
     # Mean and others moments of the contours
-    LocalStatisticExtraction = otbApplication.Registry.CreateApplication("LocalStatisticExtraction")
+    LocalStatisticExtraction = otb_factory.create_application("LocalStatisticExtraction")
     LocalStatisticExtraction.SetParameterInputImage(
         "in", EdgeExtraction.GetParameterOutputImage("out"))
     LocalStatisticExtraction.SetParameterInt("channel", 1)
@@ -198,7 +198,7 @@ def create_contours_density(in_tif, in_channel, out_tif, radius=3, resolution=60
     LocalStatisticExtraction.Execute()
 
     # Only take the mean (1st channel)
-    MeanOnly = otbApplication.Registry.CreateApplication("BandMathX")
+    MeanOnly = otb_factory.create_application("BandMathX")
     MeanOnly.SetParameterString("out", str(out_tif))
     MeanOnly.AddImageToParameterInputImageList(
         "il", LocalStatisticExtraction.GetParameterOutputImage("out"))
@@ -216,7 +216,7 @@ def create_variation_coeff(in_tif, in_channel, out_tif, radius=3, resolution=60)
     resize_band(in_tif, out_band=temp_tif, pixelresX=resolution, pixelresY=resolution)
 
     # Mean and others moments of the contours
-    LocalStatisticExtraction = otbApplication.Registry.CreateApplication("LocalStatisticExtraction")
+    LocalStatisticExtraction = otb_factory.create_application("LocalStatisticExtraction")
     LocalStatisticExtraction.SetParameterString("in", str(temp_tif))
     LocalStatisticExtraction.SetParameterInt("channel", int(in_channel))
     LocalStatisticExtraction.SetParameterInt("radius", radius)
@@ -224,7 +224,7 @@ def create_variation_coeff(in_tif, in_channel, out_tif, radius=3, resolution=60)
     LocalStatisticExtraction.Execute()
 
     # Variation coeff is the variance over the mean
-    MeanOnly = otbApplication.Registry.CreateApplication("BandMathX")
+    MeanOnly = otb_factory.create_application("BandMathX")
     MeanOnly.SetParameterString("out", str(out_tif))
     MeanOnly.AddImageToParameterInputImageList(
         "il", LocalStatisticExtraction.GetParameterOutputImage("out"))
@@ -254,7 +254,7 @@ def compose_bands_heavy(bands_full_paths, out_tif):
 
     # Stack all the bands into one TIF
     print('  Creation of the main TIF heavy')
-    ConcatenateImages = otbApplication.Registry.CreateApplication("ConcatenateImages")
+    ConcatenateImages = otb_factory.create_application("ConcatenateImages")
     ConcatenateImages.SetParameterStringList("il", bands_text)
     ConcatenateImages.SetParameterString("out", str(out_tif))
     ConcatenateImages.UpdateParameters()
@@ -579,14 +579,14 @@ def create_no_data_tif(global_parameters, paths_parameters, out_tif, dilation_ra
     clear_band = glob.glob(op.join(clear_dir, (clear_band_prefix + band_num_str + '.jp2')))[0]
 
     # Selection of the no_data pixels
-    BandMathX = otbApplication.Registry.CreateApplication("BandMathX")
+    BandMathX = otb_factory.create_application("BandMathX")
     BandMathX.SetParameterStringList("il", [str(cloudy_band), str(clear_band)])
     expression = "(im1b1 <= 0 or im2b1 <= 0) ? 1 : 0"
     BandMathX.SetParameterString("exp", expression)
     BandMathX.UpdateParameters()
     BandMathX.Execute()
     # Dilatation of the zones, to have some margin. radius in pixels
-    Dilatation = otbApplication.Registry.CreateApplication("BinaryMorphologicalOperation")
+    Dilatation = otb_factory.create_application("BinaryMorphologicalOperation")
     Dilatation.SetParameterInputImage("in", BandMathX.GetParameterOutputImage("out"))
     Dilatation.SetParameterString("out", str(out_tif))
     Dilatation.SetParameterString("filter", "dilate")
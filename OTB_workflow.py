@@ -26,28 +26,30 @@ https://www.gnu.org/licenses/gpl-3.0.fr.html
 import os
 import os.path as op
 import json
-import sqlite3
-from typing import Optional
+from typing import List, Optional
 
-import xarray as xr
-
-import rasterio
-import rioxarray
-import pandas as pd
-
-import otbApplication
+import otb_factory
+from osgeo import gdal
 import numpy as np
 import csv
-import subprocess
-import pickle
+import time
 import xml.etree.ElementTree as ET
-from sklearn import svm
+from sklearn import naive_bayes, svm
 import contour_from_labeled
 import confidence_map_exploitation
+import image_inference
+import incremental_model
+import model_compression
+import model_store
+import sample_extraction
+import sample_store
 import sklearn.ensemble as sk
 
 from alcd_params.params_reader import read_global_parameters
 
+# label of the pixels the regularization cannot decide on
+UNDECIDED_LABEL = 20
+
 
 # -------- 0. DIRECTORIES CREATION---------------------
 
@@ -75,6 +77,68 @@ def create_directories(global_parameters):
     print('Done')
 
 
+def intermediate_output(global_parameters, sub_dir, name, shell=False):
+    '''
+    Path of an intermediate output of the OTB applications
+    In pipelined mode, the outputs which are not kept are passed
+    in memory, through GDAL /vsimem/, and their previous file is removed
+    The memory of a process does not survive it, so the outputs of the
+    applications run through the shell are always written
+    '''
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    out_file = op.join(main_dir, sub_dir, global_parameters["general"][name])
+
+    pipeline = global_parameters["pipeline"]
+    if pipeline["pipelined"] and name not in pipeline["keep"] and not shell:
+        if op.exists(out_file):
+            os.remove(out_file)
+        return '/vsimem/' + global_parameters["general"][name]
+    return out_file
+
+
+def release_intermediate(path):
+    '''
+    Free the memory of an intermediate output passed in memory
+    The file is written by the GDAL of OTB: it can only be freed if the
+    GDAL Python bindings are the same library, it is kept until the end of
+    the process otherwise
+
+    Returns
+    -------
+    bool
+        Whether some memory was freed.
+    '''
+    if not path.startswith('/vsimem/'):
+        return False
+    if gdal.VSIStatL(path) is None:
+        print('{} is not seen by the GDAL Python bindings, it is freed at the end of the process'.format(path))
+        return False
+    gdal.Unlink(path)
+    return True
+
+
+def get_method(global_parameters):
+    '''
+    Classification method of the run: the online method while labelling
+    if the online mode is set, the configured method otherwise
+    '''
+    if global_parameters["classification"]["online"]:
+        return global_parameters["classification"]["online_method"]
+    return global_parameters["classification"]["method"]
+
+
+def get_img_labeled(global_parameters, shell=False):
+    '''
+    Path of the labeled image, before regularization
+    The scikit classification writes it with rasterio, which has its own
+    GDAL, so only the OTB one can pass it in memory
+    '''
+    if "otb" in get_method(global_parameters):
+        return intermediate_output(global_parameters, 'Out', "img_labeled", shell)
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    return op.join(main_dir, 'Out', global_parameters["general"]["img_labeled"])
+
+
 # -------- 1. PREPROCESSING---------------------
 # ------------ image statistics
 def compute_image_stats(global_parameters, proceed=True):
@@ -87,7 +151,7 @@ def compute_image_stats(global_parameters, proceed=True):
     img_stats = op.join(main_dir, 'Statistics', global_parameters["general"]["img_stats"])
 
     print("  Compute Images Statistics")
-    ComputeImagesStatistics = otbApplication.Registry.CreateApplication("ComputeImagesStatistics")
+    ComputeImagesStatistics = otb_factory.create_application("ComputeImagesStatistics")
     ComputeImagesStatistics.SetParameterStringList("il", [str(raw_img)])
     ComputeImagesStatistics.SetParameterString("out.xml", str(img_stats))
     ComputeImagesStatistics.ExecuteAndWriteOutput()
@@ -114,7 +178,7 @@ def compute_samples_stats(global_parameters, proceed=True):
                           global_parameters["general"]["no_data_mask"])
     no_data_mask = no_data_shp[0:-4] + '.tif'
 
-    PolygonClassStatistics = otbApplication.Registry.CreateApplication("PolygonClassStatistics")
+    PolygonClassStatistics = otb_factory.create_application("PolygonClassStatistics")
     PolygonClassStatistics.SetParameterString("in", str(raw_img))
     PolygonClassStatistics.SetParameterString("vec", str(training_shp))
     PolygonClassStatistics.SetParameterString("out", str(class_stats))
@@ -163,6 +227,23 @@ def get_samples_nb(class_stats):
     return nbSamples
 
 
+def get_samples_per_class(class_stats):
+    '''
+    Parse the XML file returned by compute_samples_stats to get the
+    samples number of each class, as a dict
+    '''
+    tree = ET.parse(class_stats)
+    root = tree.getroot()
+
+    samples_per_class = {}
+    for k in range(0, len(root)):
+        if root[k].attrib["name"] == "samplesPerClass":
+            for c in range(0, len(root[k])):
+                samples_per_class[int(root[k][c].attrib["key"])] = int(root[k][c].attrib["value"])
+
+    return samples_per_class
+
+
 def select_samples(global_parameters, strategy="smallest"):
     '''
     2. Select the samples
@@ -171,8 +252,7 @@ def select_samples(global_parameters, strategy="smallest"):
     main_dir = global_parameters["user_choices"]["main_dir"]
     raw_img = op.join(main_dir, 'In_data', 'Image', global_parameters["user_choices"]["raw_img"])
 
-    training_samples_location = op.join(
-        main_dir, 'Samples', global_parameters["general"]["training_samples_location"])
+    training_samples_location = intermediate_output(global_parameters, 'Samples', "training_samples_location")
     class_stats = op.join(main_dir, 'Statistics', global_parameters["general"]["class_stats"])
     training_shp = op.join(main_dir, 'Intermediate',
                            global_parameters["general"]["training_shp_extended"])
@@ -184,7 +264,7 @@ def select_samples(global_parameters, strategy="smallest"):
     no_data_mask = no_data_shp[0:-4] + '.tif'
 
     print("  Training Samples Selection")
-    SampleSelection = otbApplication.Registry.CreateApplication("SampleSelection")
+    SampleSelection = otb_factory.create_application("SampleSelection")
     SampleSelection.SetParameterString("in", str(raw_img))
     SampleSelection.SetParameterString("vec", str(training_shp))
     SampleSelection.SetParameterString("mask", str(no_data_mask))
@@ -195,7 +275,21 @@ def select_samples(global_parameters, strategy="smallest"):
     SampleSelection.SetParameterString("outrates", str(rates))
     SampleSelection.SetParameterString("sampler", "random")  # default is periodic
 
-    if strategy == "smallest":
+    class_caps = global_parameters["training_parameters"]["max_samples_per_class"]
+    if strategy.split('_')[0] in ["proportional", "sqrt"] or class_caps:
+        # numbers of samples computed as the raster engine does, given to OTB by class
+        samples_per_class = get_samples_per_class(class_stats)
+        samples_nb = sample_extraction.get_samples_nb_per_class(
+            samples_per_class, strategy, class_caps, global_parameters["training_parameters"]["min_samples_per_class"])
+        samples_nb_csv = op.join(main_dir, 'Statistics', 'samples_nb_per_class.csv')
+        with open(samples_nb_csv, 'w') as csv_file:
+            for class_name, nb in sorted(samples_nb.items()):
+                csv_file.write('{} {}\n'.format(class_name, nb))
+        SampleSelection.SetParameterString("strategy", "byclass")
+        SampleSelection.SetParameterString("strategy.byclass.in", str(samples_nb_csv))
+    elif strategy == "all":
+        SampleSelection.SetParameterString("strategy", "all")
+    elif strategy == "smallest":
         SampleSelection.SetParameterString("strategy", "smallest")
     elif strategy == "constant":
         SampleSelection.SetParameterString("strategy", "constant")
@@ -222,11 +316,10 @@ def extract_samples(global_parameters, proceed=True):
 
     training_samples_extracted = op.join(
         main_dir, 'Samples', global_parameters["general"]["training_samples_extracted"])
-    training_samples_location = op.join(
-        main_dir, 'Samples', global_parameters["general"]["training_samples_location"])
+    training_samples_location = intermediate_output(global_parameters, 'Samples', "training_samples_location")
 
     print("  Training Samples Extraction")
-    SampleExtraction = otbApplication.Registry.CreateApplication("SampleExtraction")
+    SampleExtraction = otb_factory.create_application("SampleExtraction")
     SampleExtraction.SetParameterString("in", str(raw_img))
     SampleExtraction.SetParameterString("vec", str(training_samples_location))
     SampleExtraction.SetParameterString("outfield", "prefix")
@@ -235,16 +328,17 @@ def extract_samples(global_parameters, proceed=True):
     SampleExtraction.UpdateParameters()
     SampleExtraction.SetParameterStringList("field", ["class"])
     SampleExtraction.ExecuteAndWriteOutput()
+    release_intermediate(training_samples_location)
     print('Done')
 
     return training_samples_extracted
 
 # -------- 2. MODEL TRAINING ---------------------
 
-def otb_train(training_samples_extracted : str, method : str, model_parameters : dict, model_out : str, shell : bool, random_seed:Optional[int]=None):
-    connex = sqlite3.connect(str(training_samples_extracted))
-    train_data = pd.read_sql_query("SELECT * FROM output", connex)
-    features_API = list(train_data.columns)[4:]
+def otb_train(training_samples_extracted : str, method : str, model_parameters : dict, model_out : str, shell : bool, random_seed:Optional[int]=None,
+              features : Optional[List[str]] = None):
+    # only the schema is read, OTB reads the samples
+    features_API = features or sample_store.get_feature_columns(training_samples_extracted)
 
     if shell == True:
         features = ' '.join(features_API)
@@ -261,12 +355,12 @@ def otb_train(training_samples_extracted : str, method : str, model_parameters :
             model_options = model_options + ' -classifier.{}.{} {}'.format(otb_method[method], key, value)
 
         command = command + model_options
-        subprocess.call(command, shell=True)
+        otb_factory.run_shell("TrainVectorClassifier", command)
 
     else:
         otb_method = {"rf_otb" : "rf", "svm_otb" : "libsvm", "boost_otb" : "boost", "dt_otb" : "dt", "gbt_otb" : "gbt", "knn_otb" : "knn"}
 
-        TrainVectorClassifier = otbApplication.Registry.CreateApplication(
+        TrainVectorClassifier = otb_factory.create_application(
             "TrainVectorClassifier")
         TrainVectorClassifier.SetParameterStringList("io.vd", [str(training_samples_extracted)])
         # ~ TrainVectorClassifier.SetParameterString("io.stats", str(img_stats))
@@ -287,43 +381,69 @@ def otb_train(training_samples_extracted : str, method : str, model_parameters :
         TrainVectorClassifier.ExecuteAndWriteOutput()
 
 
-def scikit_train(training_samples_extracted : str, method : str, model_parameters : dict, model_out : str, shell : False):
-    if not(shell) :
-        # Read sqlite query results into a pandas DataFrame
-        connex = sqlite3.connect(str(training_samples_extracted))
-        train_data = pd.read_sql_query("SELECT * FROM output", connex)
-        features_API = list(train_data.columns)[4:]
-
-        # Split features and labels
-        x_train = train_data[features_API]
-        y_train = train_data["class"]
-
-        dict_model = {"rf_scikit" : sk.RandomForestClassifier, "svm_scikit" : svm.SVC, "ada_scikit" : sk.AdaBoostClassifier,
-                      "xtree_scikit" : sk.ExtraTreesClassifier, "grad_scikit" : sk.GradientBoostingClassifier,
-                      "hist_grad_scikit" : sk.HistGradientBoostingClassifier}
+def get_scikit_classifier(method : str, model_parameters : dict):
+    '''
+    Untrained scikit classifier of a method, with its parameters
+    '''
+    dict_model = {"rf_scikit" : sk.RandomForestClassifier, "svm_scikit" : svm.SVC, "ada_scikit" : sk.AdaBoostClassifier,
+                  "xtree_scikit" : sk.ExtraTreesClassifier, "grad_scikit" : sk.GradientBoostingClassifier,
+                  "hist_grad_scikit" : sk.HistGradientBoostingClassifier, "sgd_scikit" : incremental_model.ScaledSGDClassifier,
+                  "nb_scikit" : naive_bayes.GaussianNB}
+    return dict_model[method](**model_parameters[method])
 
-        classifier = dict_model[method](**model_parameters[method])
 
-        # Train the model
-        classifier.fit(x_train, y_train)
+def scikit_train(training_samples_extracted : str, method : str, model_parameters : dict, model_out : str, shell : False,
+                 training_samples_store : Optional[str] = None, classification : Optional[dict] = None,
+                 features : Optional[List[str]] = None):
+    if not(shell) :
+        # Memory-map the float32 samples store, converted from the sqlite table if needed
+        if training_samples_store is None:
+            training_samples_store = op.splitext(training_samples_extracted)[0] + '_store'
+        if not sample_store.is_up_to_date(training_samples_store, training_samples_extracted):
+            sample_store.sqlite_to_sample_store(training_samples_extracted, training_samples_store)
+        x_train, y_train, feature_names = sample_store.load_sample_store(training_samples_store)
+        if features is not None:
+            # only the selected columns, in their order in the stack
+            x_train = x_train[:, [feature_names.index(name) for name in features]]
+            feature_names = list(features)
+
+        classifier = get_scikit_classifier(method, model_parameters)
+
+        # Train the model, or update the one of the previous iteration
+        start = time.time()
+        if classification is not None and classification["incremental"] and \
+                method in incremental_model.INCREMENTAL_METHODS:
+            classifier = incremental_model.incremental_fit(classifier, method, model_parameters[method],
+                                                           x_train, y_train, str(model_out), classification)
+        elif classification is not None and method in incremental_model.ONLINE_METHODS:
+            classifier = incremental_model.online_fit(classifier, method, model_parameters[method],
+                                                      x_train, y_train, str(model_out), classification)
+        else:
+            classifier.fit(x_train, y_train)
 
-        # Save the trained model to the specified output file
-        pickle.dump(classifier, open(str(model_out), 'wb'))
+        # Save the trained model to the specified output file, with the metadata of its training
+        model_store.save_model(classifier, str(model_out), {
+            "method": method, "parameters": model_parameters[method], "samples_nb": int(len(y_train)),
+            "features": feature_names, "classes": [int(value) for value in classifier.classes_],
+            "training_time_s": round(time.time() - start, 3)})
 
 
-def train_model(global_parameters, model_parameters, shell=True, proceed=True):
+def train_model(global_parameters, model_parameters, shell=True, proceed=True, incremental=True, features=None):
     '''
     5. Train the model
+    If incremental is False, the model is trained from scratch even if the
+    incremental mode is set in the configuration
+    features are the samples columns to train on, all of them if None
     '''
     main_dir = global_parameters["user_choices"]["main_dir"]
-    method = global_parameters["classification"]["method"]
+    method = get_method(global_parameters)
     training_samples_extracted = op.join(
         main_dir, 'Samples', global_parameters["general"]["training_samples_extracted"])
 
-    model_out = op.join(main_dir, 'Models', ('model.' +
-                                             global_parameters["classification"]["method"]))
+    model_out = op.join(main_dir, 'Models', ('model.' + method))
 
-    kwargs = {"training_samples_extracted" : training_samples_extracted, "method" : method, "model_parameters" : model_parameters, "model_out" : model_out, "shell" : shell}
+    kwargs = {"training_samples_extracted" : training_samples_extracted, "method" : method, "model_parameters" : model_parameters, "model_out" : model_out, "shell" : shell,
+              "features" : features}
 
     if proceed == True:
         print("  Train Vector Classifier")
@@ -331,7 +451,9 @@ def train_model(global_parameters, model_parameters, shell=True, proceed=True):
             otb_train(random_seed=global_parameters["training_parameters"]["random_seed"], **kwargs)
         else:
             assert "scikit" in method
-            scikit_train(**kwargs)
+            classification = global_parameters["classification"] if incremental else None
+            scikit_train(training_samples_store=sample_store.get_store_path(global_parameters),
+                         classification=classification, **kwargs)
         print('Done')
     else:
         print("Training not done this time")
@@ -348,12 +470,12 @@ def otb_class(raw_img : str, model : str, img_labeled : str, confidence_map : st
         print("  Image Classification (shell)")
         command = 'otbcli_ImageClassifier -in {} -model {} -out {} -confmap {} -mask {}'.format(
             raw_img, model, img_labeled, confidence_map, mask_tif)
-        subprocess.call(command, shell=True)
+        otb_factory.run_shell("ImageClassifier", command)
 
     else:
         print("  Image Classification (API)")
 
-        ImageClassifier = otbApplication.Registry.CreateApplication("ImageClassifier")
+        ImageClassifier = otb_factory.create_application("ImageClassifier")
         ImageClassifier.SetParameterString("in", str(raw_img))
         ImageClassifier.SetParameterString("model", str(model))
         ImageClassifier.SetParameterString("out", str(img_labeled))
@@ -363,51 +485,20 @@ def otb_class(raw_img : str, model : str, img_labeled : str, confidence_map : st
 
         ImageClassifier.ExecuteAndWriteOutput()
 
-def scikit_class(raw_img : xr.DataArray, model : str, img_labeled : str, confidence_map : str, mask_tif : str, shell : bool):
+def scikit_class(raw_img : str, model : str, img_labeled : str, confidence_map : str, mask_tif : str, shell : bool,
+                 ram : int = 512, workers : int = 1,
+                 tile_size : Optional[int] = None, uncertainty_map : Optional[str] = None):
     if not (shell):
-        raw_arr = rioxarray.open_rasterio(raw_img)
-
-        with rasterio.open(mask_tif) as mask_src:
-            mask_data = mask_src.read(1)  # Mask is a 2D array
-
-        # Apply mask
-        masked_img = np.where(mask_data == 0, np.nan, raw_arr)
-
-        # Reshape image for classification
-        n_bands, height, width = masked_img.shape
-        X = masked_img.reshape(n_bands, -1).T  # Shape: (pixels, bands)
-
-        # Remove no-data pixels
-        valid_pixels = ~np.isnan(X).any(axis=1)
-        X_valid = X[valid_pixels]
-
         # Load the trained model
-        model = pickle.load(open(model, 'rb'))
-
-        # Classify the data
-        predictions = model.predict(X_valid)
-        probs = model.predict_proba(X_valid)
-
-        # Reconstruct the classified image
-        classified_img = np.full((height * width), np.nan)
-        classified_img[valid_pixels] = predictions
-        classified_img = classified_img.reshape(height, width)
-
-        # Reconstruct the confidence map
-        confidence = np.full((height * width), np.nan)
-        confidence[valid_pixels] = np.max(probs, axis=1)  # Confidence = max probability
-        confidence = confidence.reshape(height, width)
-
-        # Save the classified image using rasterio
-        with rasterio.open(img_labeled, 'w', driver='GTiff', height=height, width=width,
-                           count=1, dtype=classified_img.dtype, crs=raw_arr.rio.crs, transform=raw_arr.rio.transform()) as dst:
-            dst.write(classified_img, 1)
-
-        # Save the confidence map using rasterio
-        with rasterio.open(confidence_map, 'w', driver='GTiff', height=height, width=width,
-                           count=1, dtype=confidence.dtype, crs=raw_arr.rio.crs, transform=raw_arr.rio.transform()) as dst:
-            dst.write(confidence, 1)
+        model = model_store.load_model(model)
 
+        # Classify the stack by windows fitting in the RAM budget, on several
+        # processes if asked, the labels being written as uint8 and the
+        # confidence and the uncertainty as float32, from a single
+        # computation of the probabilities
+        image_inference.classify_image(model, raw_img, mask_tif, img_labeled, confidence_map, ram=ram,
+                                       workers=workers, tile_size=tile_size,
+                                       uncertainty_map=uncertainty_map)
 
 
 def image_classification(global_parameters, shell=True, proceed=True, additional_name=''):
@@ -417,11 +508,16 @@ def image_classification(global_parameters, shell=True, proceed=True, additional
     main_dir = global_parameters["user_choices"]["main_dir"]
     raw_img = op.join(main_dir, 'In_data', 'Image', global_parameters["user_choices"]["raw_img"])
 
-    method = global_parameters["classification"]["method"]
-    model = op.join(main_dir, 'Models', ('model.'+global_parameters["classification"]["method"]))
+    method = get_method(global_parameters)
+    model = op.join(main_dir, 'Models', ('model.' + method))
+    if "scikit" in method:
+        model = model_compression.get_classification_model(global_parameters, model)
 
-    img_labeled = op.join(main_dir, 'Out', global_parameters["general"]["img_labeled"])
+    img_labeled = get_img_labeled(global_parameters, shell)
     confidence_map = op.join(main_dir, 'Out', "confidence{}.tif".format(additional_name))
+    uncertainty_map = None
+    if global_parameters["classification"]["uncertainty"]:
+        uncertainty_map = op.join(main_dir, 'Out', "uncertainty{}.tif".format(additional_name))
 
     mask_shp = op.join(main_dir, 'In_data', 'Masks', global_parameters["general"]["no_data_mask"])
     mask_tif = mask_shp[0:-4] + '.tif'
@@ -434,7 +530,10 @@ def image_classification(global_parameters, shell=True, proceed=True, additional
             otb_class(**kwargs)
         else :
             assert "scikit" in method
-            scikit_class(**kwargs)
+            scikit_class(ram=global_parameters["classification"]["inference_ram"],
+                         workers=global_parameters["classification"]["inference_workers"],
+                         tile_size=global_parameters["classification"]["inference_tile_size"],
+                         uncertainty_map=uncertainty_map, **kwargs)
         print('Done')
     else:
         print("Classification not done this time")
@@ -471,7 +570,7 @@ def fancy_classif_viz(global_parameters, proceed=True):
     color_table = global_parameters["color_tables"]["otb"]
     out_image_colorized = op.join(main_dir, 'Out', 'colorized_classif.png')
 
-    ColorMapping = otbApplication.Registry.CreateApplication("ColorMapping")
+    ColorMapping = otb_factory.create_application("ColorMapping")
     ColorMapping.SetParameterString("in", str(img_labeled))
     ColorMapping.SetParameterString("method", "custom")
     ColorMapping.SetParameterString("method.custom.lut", str(color_table))
@@ -497,7 +596,7 @@ def compute_mat_conf(global_parameters, show=True, proceed=True):
 
     print(' Confusion matrix computing')
     print(conf_matrix)
-    ComputeConfusionMatrix = otbApplication.Registry.CreateApplication("ComputeConfusionMatrix")
+    ComputeConfusionMatrix = otb_factory.create_application("ComputeConfusionMatrix")
     ComputeConfusionMatrix.SetParameterString("in", str(img_labeled))
     ComputeConfusionMatrix.SetParameterString("ref", "vector")
     ComputeConfusionMatrix.SetParameterString("ref.vector.in", str(validation_shp))
@@ -526,18 +625,29 @@ def compute_mat_conf(global_parameters, show=True, proceed=True):
     return conf_matrix
 
 
-def classification_regularization(global_parameters, proceed=True, radius=2):
+def classification_regularization(global_parameters, proceed=True, radius=2, img_labeled=None):
     '''
     9. Regularization of the classification map
+    img_labeled is the path returned by image_classification, the one of
+    the Python API if None
     '''
 
     main_dir = global_parameters["user_choices"]["main_dir"]
 
-    img_labeled = op.join(main_dir, 'Out', global_parameters["general"]["img_labeled"])
+    if img_labeled is None:
+        img_labeled = get_img_labeled(global_parameters)
     img_regularized = op.join(
         main_dir, 'Out', global_parameters["general"]["img_labeled_regularized"])
 
-    ClassificationMapRegularization = otbApplication.Registry.CreateApplication(
+    regularize(img_labeled, img_regularized, radius)
+    release_intermediate(img_labeled)
+
+
+def regularize(img_labeled, img_regularized, radius=2):
+    '''
+    Majority voting of the labels of an image in a ball of the radius
+    '''
+    ClassificationMapRegularization = otb_factory.create_application(
         "ClassificationMapRegularization")
 
     # The following lines set all the application parameters:
@@ -547,7 +657,7 @@ def classification_regularization(global_parameters, proceed=True, radius=2):
     ClassificationMapRegularization.EnableParameter("ip.suvbool")
     ClassificationMapRegularization.EnableParameter("ip.onlyisolatedpixels")
     ClassificationMapRegularization.SetParameterInt("ip.nodatalabel", 0)
-    ClassificationMapRegularization.SetParameterInt("ip.undecidedlabel", 20)
+    ClassificationMapRegularization.SetParameterInt("ip.undecidedlabel", UNDECIDED_LABEL)
     ClassificationMapRegularization.UpdateParameters()
     ClassificationMapRegularization.ExecuteAndWriteOutput()
 
@@ -1,4 +1,5 @@
-from typing import Dict, List, Optional
+import re
+from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel, FilePath, field_validator, ValidationInfo
 from datetime import datetime
@@ -12,8 +13,126 @@ class Classification(BaseModel):
     ----------
     method : str
         The method of classification to be used, e.g., "rf" for random forest.
+    incremental : bool
+        Update the model of the previous iteration instead of training from
+        scratch, for the rf_scikit, xtree_scikit and grad_scikit methods,
+        default = False
+    incremental_trees : int
+        Number of trees (or boosting stages) added at each incremental
+        update, default = 10
+    max_deleted_proportion : float
+        The trees of a forest trained on samples deleted since above this
+        proportion are retired at the incremental update, default = 0.5
+    full_retrain_every : int
+        Number of iterations after which the model is trained from scratch
+        again, default = 5
+    online : bool
+        Train and classify with online_method instead of method, for a fast
+        feedback while labelling, default = False
+    online_method : str
+        Method updated online with the new samples of each iteration, among
+        "sgd_scikit" and "nb_scikit", default = "sgd_scikit"
+    inference_ram : int
+        RAM budget of the classification of the image with the scikit
+        models, in MB, default = 512
+    inference_workers : int
+        Number of processes classifying the tiles of the image with the
+        scikit models, default = 1
+    inference_tile_size : Optional[int]
+        Size in pixels of the square tiles classified, default = None
+        (blocks of rows fitting in inference_ram)
+    uncertainty : bool
+        Write the confidence, the margin between the two most probable
+        classes and the entropy of the probabilities in
+        Out/uncertainty.tif, with the scikit methods only, default = False
+    preview_factor : Optional[int]
+        Decimation factor of the preview of the classification, written in
+        Out/preview_labeled.tif before the full resolution classification,
+        default = None (no preview)
+    preview_only : bool
+        Stop after the preview, the full resolution classification being
+        done by the step 2, default = False
     """
     method: str
+    incremental: bool = False
+    incremental_trees: int = 10
+    max_deleted_proportion: float = 0.5
+    full_retrain_every: int = 5
+    online: bool = False
+    online_method: Literal["sgd_scikit", "nb_scikit"] = "sgd_scikit"
+    inference_ram: int = 512
+    inference_workers: int = 1
+    inference_tile_size: Optional[int] = None
+    uncertainty: bool = False
+    preview_factor: Optional[int] = None
+    preview_only: bool = False
+
+    @field_validator("uncertainty")
+    def check_uncertainty(cls, value: bool, info: ValidationInfo) -> bool:
+        """
+        Validates that the uncertainty map is asked with a scikit method,
+        before the sampling and the training.
+
+        Parameters
+        ----------
+        value : bool
+            Uncertainty choice to validate.
+        info : ValidationInfo
+            Information about the fields already validated.
+
+        Returns
+        -------
+        bool
+            Validated uncertainty choice.
+
+        Raises
+        ------
+        ValueError
+            If the uncertainty map is asked with an OTB method.
+        """
+        method = info.data.get("method", "")
+        if value and "scikit" not in method:
+            raise ValueError("the uncertainty map is only computed with the scikit methods, not with {}.".format(method))
+        return value
+
+
+class Compression(BaseModel):
+    """
+    Compression of the scikit forests after their training.
+
+    Attributes
+    ----------
+    enabled : bool
+        Derive the compressed models of the rf_scikit and xtree_scikit
+        forests and report their accuracy and speed, default = False
+    trees : int
+        Number of trees of the pruned forest, default = 20
+    max_depth : int
+        Maximum depth of the trees of the depth-capped and distilled
+        forests, default = 12
+    distilled_trees : int
+        Number of trees of the distilled forest, default = 10
+    apply : str
+        Model used for the classification: "none" for the trained forest,
+        "pruned", "depth", "distilled", or "auto" for the fastest one
+        losing at most max_accuracy_loss of validation accuracy,
+        default = "none"
+    max_accuracy_loss : float
+        Validation accuracy the "auto" choice can lose, default = 0.005
+    repeats : int
+        Number of timed predictions of each model, default = 3
+    report : str
+        File name for the report of the compressed models,
+        default = "model_compression.json"
+    """
+    enabled: bool = False
+    trees: int = 20
+    max_depth: int = 12
+    distilled_trees: int = 10
+    apply: Literal["none", "pruned", "depth", "distilled", "auto"] = "none"
+    max_accuracy_loss: float = 0.005
+    repeats: int = 3
+    report: str = "model_compression.json"
 
 
 class Features(BaseModel):
@@ -34,6 +153,15 @@ class Features(BaseModel):
         Whether or not to include texture analysis in feature extraction.
     time_difference_bands : List[int]
         List of bands for which time-difference calculations will be performed.
+    importance : str
+        Importance of the features computed after the training: "none",
+        "impurity" (mean decrease of impurity of the forests) or
+        "permutation" (validation accuracy lost when a feature is
+        shuffled), default = "none"
+    top_n : Optional[int]
+        Number of most important features kept: the model is trained again
+        and the image classified on a stack of these bands only,
+        default = None (all the features)
     """
     DTM: str
     original_bands: List[int]
@@ -41,6 +169,8 @@ class Features(BaseModel):
     special_indices: List[str]
     textures: bool
     time_difference_bands: List[int]
+    importance: Literal["none", "impurity", "permutation"] = "none"
+    top_n: Optional[int] = None
 
 
 class General(BaseModel):
@@ -51,28 +181,52 @@ class General(BaseModel):
     ----------
     class_stats : str
         File name for storing class statistics.
+    feature_cache : str
+        File name for the cache of the pixels extracted around each point by
+        the raster sampling engine, default = "feature_cache.npz"
     img_labeled : str
         File name for the labeled image output.
     img_labeled_regularized : str
         File name for the regularized labeled image output.
     img_stats : str
         File name for image statistics.
+    labels_report : str
+        File name for the report of the duplicated and conflicting label
+        points, default = "labels_report.json"
+    labels_state : str
+        File name for the state of the labels at the last masks
+        preprocessing, default = "labels_state.json"
     merged_layers : str
         File name for storing merged layer shapefile.
+    merged_polygons : str
+        File name for the merged polygons of the class layers,
+        default = "merged_polygons.shp"
     no_data_mask : str
         File name for no-data mask shapefile.
     training_samples_extracted : str
         File name for the extracted training samples.
     training_samples_location : str
         File name for the location of training samples.
+    training_samples_store : str
+        Directory name for the columnar store of the extracted training
+        samples, default = "training_samples_store"
+    sample_budget : str
+        File name for the number of samples per class chosen by the
+        "adaptive_<nb>" sampling, default = "sample_budget.json"
     training_sampling : str
-        Sampling strategy for training data, e.g., "smallest".
+        Sampling strategy for training data: "smallest", "constant_<nb>",
+        "all", "proportional_<budget>", "sqrt_<budget>" or "adaptive_<nb>",
+        e.g., "constant_8000".
     training_shp : str
         File name for the training shapefile.
+    training_polygons : str
+        File name for the training polygons, default = "training_polygons.shp"
     training_shp_extended : str
         File name for the extended training shapefile.
     validation_shp : str
         File name for the validation shapefile.
+    validation_polygons : str
+        File name for the validation polygons, default = "validation_polygons.shp"
     validation_shp_extended : str
         File name for the extended validation shapefile.
     """
@@ -89,6 +243,39 @@ class General(BaseModel):
     training_shp_extended: str
     validation_shp: str
     validation_shp_extended: str
+    feature_cache: str = "feature_cache.npz"
+    training_samples_store: str = "training_samples_store"
+    labels_report: str = "labels_report.json"
+    labels_state: str = "labels_state.json"
+    merged_polygons: str = "merged_polygons.shp"
+    training_polygons: str = "training_polygons.shp"
+    validation_polygons: str = "validation_polygons.shp"
+    sample_budget: str = "sample_budget.json"
+
+    @field_validator("training_sampling")
+    def check_training_sampling(cls, value: str) -> str:
+        """
+        Validates the name of the sampling strategy.
+
+        Parameters
+        ----------
+        value : str
+            Sampling strategy to validate.
+
+        Returns
+        -------
+        str
+            Validated sampling strategy.
+
+        Raises
+        ------
+        ValueError
+            If the strategy is unknown or its number is not an integer.
+        """
+        if re.fullmatch(r"smallest|constant|all|(constant|proportional|sqrt|adaptive)_[0-9]+", value) is None:
+            raise ValueError("training_sampling must be smallest, constant_<nb>, all, "
+                             "proportional_<budget>, sqrt_<budget> or adaptive_<nb>.")
+        return value
 
 
 class LocalPaths(BaseModel):
@@ -121,6 +308,51 @@ class Mask(BaseModel):
     shp: str
 
 
+class OTBParameters(BaseModel):
+    """
+    Resources and outputs of the OTB applications.
+
+    Attributes
+    ----------
+    ram : Optional[int]
+        RAM budget of each application, in MB, default = None (OTB default)
+    threads : Optional[int]
+        Number of threads of the applications, default = None (all the cores)
+    compression : Optional[str]
+        GeoTIFF compression of the output images, e.g. "DEFLATE",
+        default = None
+    tiled : bool
+        Write tiled GeoTIFF output images, default = False
+    report : str
+        File name for the report of the wall time, pixels and peak memory
+        of each application, default = "otb_report.json"
+    """
+    ram: Optional[int] = None
+    threads: Optional[int] = None
+    compression: Optional[str] = None
+    tiled: bool = False
+    report: str = "otb_report.json"
+
+
+class Pipeline(BaseModel):
+    """
+    Configuration of the pipelined mode of the OTB steps.
+
+    Attributes
+    ----------
+    pipelined : bool
+        Pass the intermediate outputs of the OTB applications of the samples
+        extraction and of the classification in memory (GDAL /vsimem/) instead
+        of writing them, default = False
+    keep : List[str]
+        Intermediate outputs still written in pipelined mode, among
+        "training_samples_location" (output of SampleSelection) and
+        "img_labeled" (labeled image before regularization), default = []
+    """
+    pipelined: bool = False
+    keep: List[Literal["training_samples_location", "img_labeled"]] = []
+
+
 class PostProcessing(BaseModel):
     """
     Configuration for post-processing steps in ALCD.
@@ -139,6 +371,33 @@ class PostProcessing(BaseModel):
     model_metrics: str
 
 
+class Suggestions(BaseModel):
+    """
+    Suggestions of locations to label after the classification.
+
+    Attributes
+    ----------
+    enabled : bool
+        Write the suggestions layer after each classification,
+        default = False
+    number : int
+        Maximum number of suggested points, default = 50
+    cell_size : int
+        Size in pixels of the cells of the grid, one point being suggested
+        at most in each cell, default = 64
+    max_confidence : float
+        Highest confidence of the suggested pixels, default = 0.7
+    layer : str
+        File name of the suggestions layer, in In_data/Masks,
+        default = "suggestions.shp"
+    """
+    enabled: bool = False
+    number: int = 50
+    cell_size: int = 64
+    max_confidence: float = 0.7
+    layer: str = "suggestions.shp"
+
+
 class TrainingParameters(BaseModel):
     """
     Parameters for training models in ALCD.
@@ -157,6 +416,40 @@ class TrainingParameters(BaseModel):
         Proportion of the dataset to be used for training.
     random_seed : Optional[int]
         random seed value, default = None
+    sampling_engine : str
+        Engine used to extract the training samples: "otb" for the OTB
+        sampling applications, "raster" for the raster-native engine of
+        sample_extraction.py, default = "otb"
+    collapse_duplicate_labels : bool
+        Remove from the merged labels the points of a pixel already labelled
+        with the same class, and the points of the pixels labelled with
+        different classes, default = False
+    incremental_preprocess : bool
+        Only redo the masks preprocessing needed by the changes of the class
+        layers and of the no-data mask since the last run, the labelled
+        points keeping their training or validation assignment, default = False
+    max_samples_per_polygon : int
+        Maximum number of samples drawn in each labelled polygon by the raster
+        sampling engine, and of pixels of each validation polygon, default = 1000
+    max_samples_per_class : Dict[int, int]
+        Maximum number of training samples of some classes, default = {}
+    min_samples_per_class : int
+        Minimum number of training samples of each class with candidates,
+        with the "proportional_<budget>" and "sqrt_<budget>" sampling,
+        default = 1
+    budget_fractions : List[float]
+        Fractions of the maximum number of samples per class trained on by
+        the "adaptive_<nb>" sampling, default = [0.05, 0.1, 0.2, 0.4, 0.7, 1.0]
+    budget_tolerance : float
+        Validation accuracy the adaptive budget can lose compared to the
+        maximum one, default = 0.005
+    kfold_evaluation : str
+        Evaluation of the folds of the K-fold: "full_image" to classify the
+        full image, "validation_pixels" to classify only the neighbourhood
+        of the validation pixels, default = "full_image"
+    kfold_last_full_image : bool
+        Classify the full image at the last fold of a "validation_pixels"
+        evaluation, default = False
     """
     Kfold: int
     dilatation_radius: int
@@ -164,6 +457,16 @@ class TrainingParameters(BaseModel):
     regularization_radius: int
     training_proportion: float
     random_seed: Optional[int] = None
+    sampling_engine: Literal["otb", "raster"] = "otb"
+    collapse_duplicate_labels: bool = False
+    incremental_preprocess: bool = False
+    max_samples_per_polygon: int = 1000
+    max_samples_per_class: Dict[int, int] = {}
+    min_samples_per_class: int = 1
+    budget_fractions: List[float] = [0.05, 0.1, 0.2, 0.4, 0.7, 1.0]
+    budget_tolerance: float = 0.005
+    kfold_evaluation: Literal["full_image", "validation_pixels"] = "full_image"
+    kfold_last_full_image: bool = False
 
 
 class UserChoices(BaseModel):
@@ -239,14 +542,22 @@ class ALCDConfig(BaseModel):
         Configuration for the classification method used.
     color_tables : Dict[str, FilePath]
         Dictionary of paths for color tables, with keys representing table names.
+    compression : Compression
+        Compression of the scikit forests.
     features : Features
         Feature extraction settings.
     general : General
         General operational configurations.
     masks : Dict[str, Mask]
         Dictionary of mask configurations, with mask names as keys.
+    otb : OTBParameters
+        Resources and outputs of the OTB applications.
+    pipeline : Pipeline
+        Pipelined mode of the OTB steps.
     postprocessing : PostProcessing
         Settings for post-processing outputs and metrics.
+    suggestions : Suggestions
+        Suggestions of locations to label.
     training_parameters : TrainingParameters
         Training configuration and parameters.
     user_choices : UserChoices
@@ -254,10 +565,14 @@ class ALCDConfig(BaseModel):
     """
     classification: Classification
     color_tables: Dict[str, FilePath]
+    compression: Compression = Compression()
     features: Features
     general: General
     masks: Dict[str, Mask]
+    otb: OTBParameters = OTBParameters()
+    pipeline: Pipeline = Pipeline()
     postprocessing: PostProcessing
+    suggestions: Suggestions = Suggestions()
     training_parameters: TrainingParameters
     user_choices: UserChoices
     local_paths: LocalPaths
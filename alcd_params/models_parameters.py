@@ -283,6 +283,34 @@ class HISTConfig(BaseModel):
     loss : str
     max_iter: int
 
+class SGDConfig(BaseModel):
+    """
+    Configuration parameters for the SGDClassifier of scikit-learn, updated online.
+
+    Attributes
+    ----------
+    loss : str
+        The loss function, among the ones giving probabilities ("log_loss" or "modified_huber").
+    alpha : float
+        Constant that multiplies the regularization term.
+    random_state : int
+        Controls the shuffling of the samples and ensures reproducibility of results.
+    """
+    loss: Literal["log_loss", "modified_huber"]
+    alpha: float
+    random_state: int
+
+class NBConfig(BaseModel):
+    """
+    Configuration parameters for the GaussianNB classifier of scikit-learn, updated online.
+
+    Attributes
+    ----------
+    var_smoothing : float
+        Portion of the largest variance of all features added to the variances for calculation stability.
+    """
+    var_smoothing: float
+
 class MLConfig(BaseModel):
     """
     Configuration for multiple machine learning models.
@@ -315,6 +343,10 @@ class MLConfig(BaseModel):
         Configuration parameters for the GradientBoostingClassifier of scikit-learn.
     hist_scikit: HISTConfig
         Configuration parameters for the HistGradientBoostingClassifier of scikit-learn.
+    sgd_scikit: SGDConfig
+        Configuration parameters for the SGDClassifier of scikit-learn.
+    nb_scikit: NBConfig
+        Configuration parameters for the GaussianNB classifier of scikit-learn.
     """
     svm_otb: Optional[LibSVMConfig] = None
     boost_otb: Optional[BoostConfig] = None
@@ -328,4 +360,6 @@ class MLConfig(BaseModel):
     ada_scikit: Optional[ADAConfig] = None
     xtree_scikit: Optional[XTREEConfig] = None
     grad_scikit: Optional[GRADConfig] = None
-    hist_scikit: Optional[HISTConfig] = None
\ No newline at end of file
+    hist_scikit: Optional[HISTConfig] = None
+    sgd_scikit: Optional[SGDConfig] = None
+    nb_scikit: Optional[NBConfig] = None
\ No newline at end of file
@@ -35,10 +35,19 @@ import tempfile
 import OTB_workflow
 import masks_preprocessing
 import layers_creation
+import labeling_suggestions
 import L1C_band_composition
+import feature_importance
 import OTB_workflow as OTB_wf
 import metrics_exploitation
+import model_compression
+import otb_factory
+import preview_classification
+import sample_budget
+import sample_extraction
+import sample_store
 import find_directory_names
+import kfold_evaluation
 import confidence_map_exploitation
 
 from alcd_params.params_reader import read_global_parameters, read_models_parameters, read_paths_parameters
@@ -122,6 +131,7 @@ def run_all(part, global_parameters, paths_parameters, model_parameters, first_i
             # Initialize the parameters with them
             global_parameters = initialization_global_parameters(
                 main_dir, global_parameters, paths_parameters, raw_img_name, location, current_date, clear_date)
+            otb_factory.configure(global_parameters)
 
             if first_iteration == True:
                 first_it_worklfow(current_date, force, global_parameters, location, paths_parameters)
@@ -138,45 +148,128 @@ def run_all(part, global_parameters, paths_parameters, model_parameters, first_i
 
     elif part == 3:
         # Compute the statistics of the image and samples, and extract the later
-        if first_iteration == True:
-            # needs to be done only once
-            OTB_wf.compute_image_stats(global_parameters)
-
-        proceed = True
-        OTB_wf.compute_samples_stats(global_parameters, proceed=True)
-        OTB_wf.select_samples(global_parameters, strategy="constant_8000")
-        OTB_wf.extract_samples(global_parameters, proceed=proceed)
+        # the stack of the selected features if any
+        with feature_importance.selected_stack(global_parameters):
+            samples_extraction_workflow(first_iteration, global_parameters, model_parameters, k_fold_step)
 
     elif part == 4:
         # Train the model and classify the image
-        OTB_wf.train_model(global_parameters, model_parameters, shell=False, proceed=True)
-        additional_name = ''
-        OTB_wf.image_classification(global_parameters, shell=False,
-                                    proceed=True, additional_name=additional_name)
-        OTB_wf.confidence_map_viz(global_parameters, additional_name=additional_name)
-        # regularization_radius in pixel
-        regularization_radius = int(
-            global_parameters["training_parameters"]["regularization_radius"])
-        OTB_wf.classification_regularization(
-            global_parameters, proceed=True, radius=regularization_radius)
+        # the folds of the K-fold are trained independently
+        return train_and_classify(global_parameters, model_parameters, k_fold_step)
 
     elif part == 5:
         # Compute some metrics
-        OTB_wf.compute_mat_conf(global_parameters)
-        OTB_wf.fancy_classif_viz(global_parameters, proceed=True)
-        try:
-            confidence_map_exploitation.compute_all_confidence_stats(global_parameters)
-            confidence_map_exploitation.plot_confidence_evolution(global_parameters)
-            confidence_map_exploitation.plot_samples_evolution(global_parameters)
-        except:
-            pass
+        # the folds evaluated on the validation pixels have their confusion matrix already
+        if not kfold_evaluation.is_pixels_evaluation(global_parameters, k_fold_step):
+            OTB_wf.compute_mat_conf(global_parameters)
+            OTB_wf.fancy_classif_viz(global_parameters, proceed=True)
+            try:
+                confidence_map_exploitation.compute_all_confidence_stats(global_parameters)
+                confidence_map_exploitation.plot_confidence_evolution(global_parameters)
+                confidence_map_exploitation.plot_samples_evolution(global_parameters)
+            except:
+                pass
         metrics_exploitation.get_model_metrics(global_parameters)
         metrics_exploitation.save_model_metrics(global_parameters)
         metrics_exploitation.retrieve_Kfold_data(global_parameters)
 
     elif part == 6:
         # Create the contours for a better visualisation
-        OTB_wf.create_contour_from_labeled(global_parameters, proceed=True)
+        if not kfold_evaluation.is_pixels_evaluation(global_parameters, k_fold_step):
+            OTB_wf.create_contour_from_labeled(global_parameters, proceed=True)
+        # and the points to label at the next iteration
+        if k_fold_step == None and global_parameters["suggestions"]["enabled"]:
+            labeling_suggestions.labeling_suggestions(global_parameters)
+
+    elif part == 7:
+        # Classify the image at full resolution with the trained model, after
+        # a preview only
+        with feature_importance.selected_stack(global_parameters):
+            classify_full_resolution(global_parameters)
+
+
+def train_and_classify(global_parameters, model_parameters, k_fold_step=None):
+    with feature_importance.selected_stack(global_parameters) as selection:
+        model_out = OTB_wf.train_model(global_parameters, model_parameters, shell=False, proceed=True,
+                                       incremental=k_fold_step == None)
+        features = global_parameters["features"]
+        if k_fold_step == None and (features["importance"] != "none" or features["top_n"] is not None):
+            selected_features = feature_importance.feature_importance(global_parameters, model_out, selection)
+            if selected_features is not None:
+                # trained again and classified on the selected features only
+                model_out = OTB_wf.train_model(global_parameters, model_parameters, shell=False, proceed=True,
+                                               incremental=False, features=selected_features)
+                global_parameters["user_choices"]["raw_img"] = \
+                    feature_importance.load_selection(global_parameters)["stack"]
+        if global_parameters["compression"]["enabled"]:
+            model_compression.compress_model(global_parameters, model_out)
+        if k_fold_step == None and global_parameters["classification"]["preview_factor"] is not None:
+            preview_classification.preview_classification(global_parameters)
+            if global_parameters["classification"]["preview_only"]:
+                print('  Full resolution classification not done, run the step 2 for it')
+                return False
+        if kfold_evaluation.is_pixels_evaluation(global_parameters, k_fold_step):
+            kfold_evaluation.evaluate_fold(global_parameters)
+            return True
+        classify_full_resolution(global_parameters)
+    return True
+
+
+def classify_full_resolution(global_parameters):
+    additional_name = ''
+    img_labeled = OTB_wf.image_classification(global_parameters, shell=False,
+                                              proceed=True, additional_name=additional_name)
+    OTB_wf.confidence_map_viz(global_parameters, additional_name=additional_name)
+    # regularization_radius in pixel
+    regularization_radius = int(
+        global_parameters["training_parameters"]["regularization_radius"])
+    OTB_wf.classification_regularization(
+        global_parameters, proceed=True, radius=regularization_radius, img_labeled=img_labeled)
+
+
+def copy_fold_outputs(global_parameters, k_fold_step):
+    '''
+    Copy also the classification maps of the fold, or the ones of the
+    patches around the validation pixels if only they were classified
+    '''
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    current_kfold_dir_step = op.join(
+        main_dir, 'Statistics', 'K_fold_{}'.format(k_fold_step))
+    out_files = [op.join(main_dir, 'Out', name) for name in
+                 ['labeled_img.tif', 'labeled_img_regular.tif', 'contours_superposition.png', 'colorized_classif.png']]
+    if kfold_evaluation.is_pixels_evaluation(global_parameters, k_fold_step):
+        out_files = [op.join(main_dir, 'Intermediate', name) for name in
+                     ['kfold_patches_labeled.tif', 'kfold_patches_regularized.tif']]
+    for src in out_files:
+        dst = op.join(current_kfold_dir_step, op.basename(src))
+        # not written in pipelined mode if not kept
+        if op.exists(src):
+            shutil.copy(src, dst)
+
+
+def samples_extraction_workflow(first_iteration, global_parameters, model_parameters=None, k_fold_step=None):
+    if first_iteration == True:
+        # needs to be done only once
+        OTB_wf.compute_image_stats(global_parameters)
+
+    proceed = True
+    raw_img = op.join(global_parameters["user_choices"]["main_dir"], 'In_data', 'Image',
+                      global_parameters["user_choices"]["raw_img"])
+    stack_id = sample_extraction.get_stack_id(raw_img)
+    strategy, compute_budget = sample_budget.get_strategy(global_parameters, stack_id)
+    if global_parameters["training_parameters"]["sampling_engine"] == "raster":
+        sample_extraction.extract_samples(global_parameters, strategy=strategy)
+    else:
+        OTB_wf.compute_samples_stats(global_parameters, proceed=True)
+        OTB_wf.select_samples(global_parameters, strategy=strategy)
+        training_samples_extracted = OTB_wf.extract_samples(global_parameters, proceed=proceed)
+        # Converted once, the training memory-maps the store
+        sample_store.sqlite_to_sample_store(training_samples_extracted,
+                                            sample_store.get_store_path(global_parameters))
+    if compute_budget and model_parameters is not None and k_fold_step is None:
+        # the budget of the adaptive sampling, used from the next iteration,
+        # not computed on the folds of the K-fold
+        sample_budget.compute_budget(global_parameters, model_parameters, stack_id)
 
 
 def first_it_worklfow(current_date, force, global_parameters, location, paths_parameters):
@@ -218,7 +311,8 @@ def getarguments():
     parser.add_argument('-f', action='store', default=None,
                         dest='first_iteration', help='Bool, is it the first iteration?')
     parser.add_argument('-s', action='store', type=int, default=-1, dest='user_input',
-                        help='Int, The step: 0 to modify the masks, 1 to run the algorithm')
+                        help='Int, The step: 0 to modify the masks, 1 to run the algorithm, '
+                             '2 to classify the image at full resolution after a preview only')
     parser.add_argument('-l', action='store', default=None,
                         dest='location', help='Location (e.g. Orleans)')
     parser.add_argument('-d', action='store', default=None, dest='wanted_date',
@@ -249,6 +343,7 @@ def all_run_alcd(global_parameters_file, paths_parameters_file, model_parameters
     model_parameters = read_models_parameters(model_parameters_file)
 
     global_parameters["json_file"] = global_parameters_file
+    otb_factory.configure(global_parameters)
     get_dates = str2bool(get_dates)
     if get_dates:
         available_dates = find_directory_names.get_all_dates(location, paths_parameters)
@@ -274,39 +369,42 @@ def all_run_alcd(global_parameters_file, paths_parameters_file, model_parameters
     kfold = str2bool(kfold)
 
     if kfold:
-        tmp_name = next(tempfile._get_candidate_names())
-        k_fold_dir = op.join('tmp', 'kfold_{}'.format(tmp_name))
-        if not op.exists(k_fold_dir):
-            os.makedirs(k_fold_dir)
-            print(k_fold_dir + ' created')
-
-        K = int(global_parameters["training_parameters"]["Kfold"])
-        for k_fold_step in range(K):
-            run_all(part=2, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
-                    first_iteration=first_iteration, k_fold_step=k_fold_step, k_fold_dir=k_fold_dir)
-            run_all(part=3, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
-                    first_iteration=first_iteration, k_fold_step=k_fold_step, k_fold_dir=k_fold_dir)
-            run_all(part=4, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
-                    first_iteration=first_iteration, k_fold_step=k_fold_step, k_fold_dir=k_fold_dir)
-            run_all(part=5, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
-                    first_iteration=first_iteration, k_fold_step=k_fold_step, k_fold_dir=k_fold_dir)
-            run_all(part=6, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
-                    first_iteration=first_iteration, k_fold_step=k_fold_step, k_fold_dir=k_fold_dir)
-
-            # Copy also the classification maps of the fold
-            main_dir = global_parameters["user_choices"]["main_dir"]
-            current_kfold_dir_step = op.join(
-                main_dir, 'Statistics', 'K_fold_{}'.format(k_fold_step))
-            out_files_names = ['labeled_img.tif', 'labeled_img_regular.tif',
-                               'contours_superposition.png', 'colorized_classif.png']
-            for name in out_files_names:
-                src = op.join(main_dir, 'Out', name)
-                dst = op.join(current_kfold_dir_step, name)
-                shutil.copy(src, dst)
-
-        metrics_exploitation.retrieve_Kfold_data(global_parameters, metrics_plotting=True)
+        run_kfold(global_parameters, paths_parameters, model_parameters, first_iteration)
         return
 
+    run_step(user_input, global_parameters, paths_parameters, model_parameters, first_iteration,
+             location=location, wanted_date=wanted_date, clear_date=clear_date, force=force)
+
+
+def run_kfold(global_parameters, paths_parameters, model_parameters, first_iteration):
+    '''
+    K-fold cross-validation: the parts 2 to 6 are run on each fold
+    '''
+    tmp_name = next(tempfile._get_candidate_names())
+    k_fold_dir = op.join('tmp', 'kfold_{}'.format(tmp_name))
+    if not op.exists(k_fold_dir):
+        os.makedirs(k_fold_dir)
+        print(k_fold_dir + ' created')
+
+    K = int(global_parameters["training_parameters"]["Kfold"])
+    for k_fold_step in range(K):
+        for part in [2, 3, 4, 5, 6]:
+            run_all(part=part, global_parameters=global_parameters, paths_parameters=paths_parameters,
+                    model_parameters=model_parameters, first_iteration=first_iteration, k_fold_step=k_fold_step,
+                    k_fold_dir=k_fold_dir)
+
+        copy_fold_outputs(global_parameters, k_fold_step)
+
+    metrics_exploitation.retrieve_Kfold_data(global_parameters, metrics_plotting=True)
+
+
+def run_step(user_input, global_parameters, paths_parameters, model_parameters, first_iteration, location=None,
+             wanted_date=None, clear_date=None, force=False):
+    '''
+    Run the parts of a step: 0 for the initialization, 1 for the training
+    and the classification, 2 for the full resolution classification after
+    a preview only
+    '''
     if user_input == 0:
         run_all(part=1, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
                 first_iteration=first_iteration, location=location, wanted_date=wanted_date, clear_date=clear_date, force=force)
@@ -315,14 +413,20 @@ def all_run_alcd(global_parameters_file, paths_parameters_file, model_parameters
                 first_iteration=first_iteration, force=force)
         run_all(part=3, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
                 first_iteration=first_iteration, force=force)
-        run_all(part=4, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
-                first_iteration=first_iteration, force=force)
-        run_all(part=5, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
-                first_iteration=first_iteration, force=force)
-        run_all(part=6, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
-                first_iteration=first_iteration, force=force)
+        classified = run_all(part=4, global_parameters=global_parameters, paths_parameters=paths_parameters,
+                             model_parameters=model_parameters, first_iteration=first_iteration, force=force)
+        # the metrics and contours need the full resolution classification
+        if classified:
+            run_all(part=5, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
+                    first_iteration=first_iteration, force=force)
+            run_all(part=6, global_parameters=global_parameters, paths_parameters=paths_parameters, model_parameters=model_parameters,
+                    first_iteration=first_iteration, force=force)
+    elif user_input == 2:
+        for part in [7, 5, 6]:
+            run_all(part=part, global_parameters=global_parameters, paths_parameters=paths_parameters,
+                    model_parameters=model_parameters, first_iteration=first_iteration, force=force)
     else:
-        print('Please enter a valid step value [0 or 1]')
+        print('Please enter a valid step value [0, 1 or 2]')
 
 def main():
     """
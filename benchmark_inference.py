@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (benchmark_inference.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Benchmark of the classification of the image by several processes.
+
+The image is classified with each number of workers, and the time, the
+speedup and the efficiency compared to one worker are printed. The stack,
+the mask and the model of a run can be given, otherwise a random stack of
+the size of a tile at 60 m (1830 x 1830 pixels) and a random forest are
+generated. The outputs of every number of workers are checked to be the
+same as the ones of one worker.
+
+Example:
+python benchmark_inference.py -workers 1,2,4,8 -tile_size 512
+"""
+import argparse
+import os
+import os.path as op
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+import sklearn.ensemble as sk
+from rasterio.transform import from_origin
+
+import image_inference
+import model_store
+
+
+def generate_inputs(out_dir: str, size: int, bands_nb: int, trees: int, seed: int = 0):
+    """
+    Random stack, mask and forest for the benchmark.
+    """
+    rng = np.random.default_rng(seed)
+    raw_img, mask_tif = op.join(out_dir, 'stack.tif'), op.join(out_dir, 'mask.tif')
+    profile = {"driver": "GTiff", "width": size, "height": size, "transform": from_origin(0, size * 60, 60, 60),
+               "tiled": True, "blockxsize": 256, "blockysize": 256}
+    with rasterio.open(raw_img, 'w', count=bands_nb, dtype='int16', **profile) as dst:
+        dst.write(rng.integers(0, 10000, (bands_nb, size, size)).astype(np.int16))
+    with rasterio.open(mask_tif, 'w', count=1, dtype='uint8', **profile) as dst:
+        dst.write((rng.random((size, size)) > 0.05).astype(np.uint8), 1)
+
+    x_train = rng.integers(0, 10000, (20000, bands_nb)).astype(np.float32)
+    y_train = (x_train[:, 0] > 5000).astype(np.int32) + 2 * (x_train[:, 1] > 3000).astype(np.int32) + 1
+    model = sk.RandomForestClassifier(n_estimators=trees, random_state=seed).fit(x_train, y_train)
+    return raw_img, mask_tif, model
+
+
+def benchmark(raw_img: str, mask_tif: str, model, workers_list, tile_size=None, ram=512, out_dir='tmp'):
+    '''
+    Classify the image with each number of workers, and print the times
+    '''
+    reference = None
+    times = {}
+    for workers in workers_list:
+        img_labeled = op.join(out_dir, 'labeled_{}.tif'.format(workers))
+        confidence_map = op.join(out_dir, 'confidence_{}.tif'.format(workers))
+        start = time.perf_counter()
+        image_inference.classify_image(model, raw_img, mask_tif, img_labeled, confidence_map, ram=ram,
+                                       workers=workers, tile_size=tile_size)
+        times[workers] = time.perf_counter() - start
+
+        with rasterio.open(img_labeled) as src:
+            labels = src.read(1)
+        if reference is None:
+            reference = labels
+        elif not np.array_equal(labels, reference):
+            raise ValueError('The labels of {} workers differ from the ones of {}'.format(workers, workers_list[0]))
+
+    base = times[workers_list[0]] * workers_list[0]
+    print('{} cores'.format(os.cpu_count()))
+    print('workers   time (s)   speedup   efficiency')
+    for workers in workers_list:
+        speedup = base / times[workers]
+        print('{:7}   {:8.2f}   {:7.2f}   {:10.2f}'.format(workers, times[workers], speedup, speedup / workers))
+    return times
+
+
+def getarguments():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-workers', dest='workers', default='1,2,4',
+                        help='Numbers of workers to compare, separated by a comma (e.g. "1,2,4,8")')
+    parser.add_argument('-tile_size', dest='tile_size', type=int, default=None,
+                        help='Int, size of the tiles, blocks of rows fitting in the RAM budget if not set')
+    parser.add_argument('-ram', dest='ram', type=int, default=512, help='Int, RAM budget in MB')
+    parser.add_argument('-raw_img', dest='raw_img', default=None, help='str, stack to classify')
+    parser.add_argument('-mask', dest='mask_tif', default=None, help='str, no-data mask of the stack')
+    parser.add_argument('-model', dest='model', default=None, help='str, scikit model of a run')
+    parser.add_argument('-size', dest='size', type=int, default=1830,
+                        help='Int, size of the random stack generated if no stack is given')
+    parser.add_argument('-bands', dest='bands_nb', type=int, default=28,
+                        help='Int, number of bands of the random stack')
+    parser.add_argument('-trees', dest='trees', type=int, default=100,
+                        help='Int, number of trees of the random forest generated if no model is given')
+    results = parser.parse_args()
+    return vars(results)
+
+
+def main():
+    """
+    It parses the command line arguments and runs the benchmark.
+    """
+    args = getarguments()
+    workers_list = [int(workers) for workers in args["workers"].split(',')]
+    with tempfile.TemporaryDirectory() as out_dir:
+        if args["raw_img"] is None:
+            raw_img, mask_tif, model = generate_inputs(out_dir, args["size"], args["bands_nb"], args["trees"])
+        else:
+            raw_img, mask_tif = args["raw_img"], args["mask_tif"]
+            model = model_store.load_model(args["model"])
+        benchmark(raw_img, mask_tif, model, workers_list, args["tile_size"], args["ram"], out_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,6 @@
 import sys 
 import os
 import os.path as op
-import otbApplication
 import subprocess
 import sqlite3
 from osgeo import ogr
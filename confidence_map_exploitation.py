@@ -29,7 +29,7 @@ import sys
 import os.path as op
 import json
 import glob
-import otbApplication
+import otb_factory
 import numpy as np
 import tempfile
 from collections import defaultdict
@@ -46,7 +46,7 @@ def confidence_map_change(in_tif, out_tif, median_radius=5):
     if median_radius % 2 == 0:
         median_radius = median_radius+1
 
-    MedianFilter = otbApplication.Registry.CreateApplication("BandMathX")
+    MedianFilter = otb_factory.create_application("BandMathX")
     MedianFilter.SetParameterStringList("il", [str(in_tif)])
     MedianFilter.SetParameterString("out", str(out_tif))
     MedianFilter.SetParameterString(
@@ -66,7 +66,7 @@ def shapefile_rasterization(raw_img_tif, in_shps, out_tif):
     layers (water.shp, land.shp, etc)
     '''
     if len(in_shps) == 1:
-        Rasterization = otbApplication.Registry.CreateApplication("Rasterization")
+        Rasterization = otb_factory.create_application("Rasterization")
         Rasterization.SetParameterString("in", str(in_shps[0]))
         Rasterization.SetParameterString("im", str(raw_img_tif))
         Rasterization.SetParameterString("mode", "attribute")
@@ -76,7 +76,7 @@ def shapefile_rasterization(raw_img_tif, in_shps, out_tif):
         Rasterization.UpdateParameters()
         Rasterization.ExecuteAndWriteOutput()
     elif len(in_shps) == 2:
-        Rasterization1 = otbApplication.Registry.CreateApplication("Rasterization")
+        Rasterization1 = otb_factory.create_application("Rasterization")
         Rasterization1.SetParameterString("in", str(in_shps[0]))
         Rasterization1.SetParameterString("im", str(raw_img_tif))
         Rasterization1.SetParameterString("mode", "attribute")
@@ -85,7 +85,7 @@ def shapefile_rasterization(raw_img_tif, in_shps, out_tif):
         Rasterization1.UpdateParameters()
         Rasterization1.Execute()
 
-        Rasterization2 = otbApplication.Registry.CreateApplication("Rasterization")
+        Rasterization2 = otb_factory.create_application("Rasterization")
         Rasterization2.SetParameterString("in", str(in_shps[1]))
         Rasterization2.SetParameterString("im", str(raw_img_tif))
         Rasterization2.SetParameterString("mode", "attribute")
@@ -94,7 +94,7 @@ def shapefile_rasterization(raw_img_tif, in_shps, out_tif):
         Rasterization2.UpdateParameters()
         Rasterization2.Execute()
 
-        Combination = otbApplication.Registry.CreateApplication("BandMathX")
+        Combination = otb_factory.create_application("BandMathX")
         Combination.AddImageToParameterInputImageList(
             "il", Rasterization1.GetParameterOutputImage("out"))
         Combination.AddImageToParameterInputImageList(
@@ -169,7 +169,7 @@ def confidence_map_mean(global_parameters, mode='all', samples_set='train', exte
 
     temp_out = op.join(main_dir, 'Intermediate', 'confidence_selected.tif')
 
-    ConfMapSelection = otbApplication.Registry.CreateApplication("BandMathX")
+    ConfMapSelection = otb_factory.create_application("BandMathX")
     if mode == 'all':
         ConfMapSelection.SetParameterStringList("il",
                                                 [str(confidence_map)])
@@ -27,7 +27,7 @@ https://www.gnu.org/licenses/gpl-3.0.fr.html
 import os
 import os.path as op
 import glob
-import otbApplication
+import otb_factory
 from osgeo import gdal
 from PIL import Image
 import numpy as np
@@ -39,7 +39,7 @@ def single_contour_from_labeled_dilatation(in_tif, out_tif, class_nb, radius=5,
     '''
     class_nb = str(class_nb)
     # Extract the class
-    ClassExtract = otbApplication.Registry.CreateApplication("BandMathX")
+    ClassExtract = otb_factory.create_application("BandMathX")
     ClassExtract.SetParameterStringList("il", [str(in_tif)])
     ClassExtract.SetParameterString("exp", "(im1b1 == {} ?  1 : 0)".format(class_nb))
 
@@ -49,7 +49,7 @@ def single_contour_from_labeled_dilatation(in_tif, out_tif, class_nb, radius=5,
     # Erode before allows to remove small elements of 1 pixel
     if erode_before:
         # Erosion
-        Erosion = otbApplication.Registry.CreateApplication("BinaryMorphologicalOperation")
+        Erosion = otb_factory.create_application("BinaryMorphologicalOperation")
         Erosion.SetParameterInputImage("in", ClassExtract.GetParameterOutputImage("out"))
         Erosion.SetParameterString("filter", "erode")
         Erosion.SetParameterString("structype", "ball")
@@ -59,7 +59,7 @@ def single_contour_from_labeled_dilatation(in_tif, out_tif, class_nb, radius=5,
         Erosion.Execute()
 
     # Dilatation
-    Dilatation = otbApplication.Registry.CreateApplication("BinaryMorphologicalOperation")
+    Dilatation = otb_factory.create_application("BinaryMorphologicalOperation")
     if erode_before:
         Dilatation.SetParameterInputImage("in", Erosion.GetParameterOutputImage("out"))
         radius += 1  # to compensate for the erosion
@@ -73,7 +73,7 @@ def single_contour_from_labeled_dilatation(in_tif, out_tif, class_nb, radius=5,
     Dilatation.Execute()
 
     # Substract the two
-    Substract = otbApplication.Registry.CreateApplication("BandMathX")
+    Substract = otb_factory.create_application("BandMathX")
     Substract.SetParameterString("out", str(out_tif))
 
     # The 1st band is the dilatation, the 2nd the original extracted class
@@ -103,7 +103,7 @@ def create_labelisation_contours(in_tif, out_tif, dilatation_radius=5, cloud_fus
 
     # Fuse the low clouds and high clouds classes, to make it more readable
     fused_in_tif = op.join(working_dir, 'fused_in_tif.tif')
-    ClassFusion = otbApplication.Registry.CreateApplication("BandMathX")
+    ClassFusion = otb_factory.create_application("BandMathX")
     ClassFusion.SetParameterStringList("il", [str(in_tif)])
     ClassFusion.SetParameterString("out", str(fused_in_tif))
     if cloud_fusion:
@@ -125,7 +125,7 @@ def create_labelisation_contours(in_tif, out_tif, dilatation_radius=5, cloud_fus
     # the overwritting of the classes)
     for k in range(len(temp_files)):
         current_class = classes[k]
-        StackingApp = otbApplication.Registry.CreateApplication("BandMathX")
+        StackingApp = otb_factory.create_application("BandMathX")
 
         if k == 0:
             # first layer, so write directly the image
@@ -147,7 +147,7 @@ def create_labelisation_contours(in_tif, out_tif, dilatation_radius=5, cloud_fus
             StackingApp.ExecuteAndWriteOutput()
 
     # Converts the 2 bands tif into a 1 band (drop the 2nd)
-    MonoBand = otbApplication.Registry.CreateApplication("BandMathX")
+    MonoBand = otb_factory.create_application("BandMathX")
     MonoBand.SetParameterStringList("il", [str(out_tif), str(in_tif)])
     MonoBand.SetParameterString("out", str(out_tif))
     MonoBand.SetParameterString("exp", "(im2b1 == 0 ? -1 : im1b1)")
@@ -30,6 +30,9 @@ import os.path as op
 import subprocess
 from osgeo import ogr
 import numpy as np
+import rasterio
+
+import sample_extraction
 
 
 def create_squares(in_shp, out_shp, max_dist_X, max_dist_Y):
@@ -71,8 +74,9 @@ def create_squares(in_shp, out_shp, max_dist_X, max_dist_Y):
     # Create the feature and set values
     for point in inLayer:
         current_class = point.GetField("class")
-        if current_class != None:
-            ingeom = point.GetGeometryRef()
+        ingeom = point.GetGeometryRef()
+        # the polygons are labelled areas by themselves, they are not expanded
+        if current_class != None and ogr.GT_Flatten(ingeom.GetGeometryType()) == ogr.wkbPoint:
 
             Xpoint = ingeom.GetX(0)
             Ypoint = ingeom.GetY(0)
@@ -106,4 +110,69 @@ def create_squares(in_shp, out_shp, max_dist_X, max_dist_Y):
     inDataSource.Destroy()
     outDataSource.Destroy()
 
-    return
\ No newline at end of file
+    return
+
+
+def append_polygons(in_shp, out_shp, raw_img=None, max_pixels=None, seed=None):
+    '''
+    Append the polygons of in_shp, with their class, to the polygon
+    shapefile out_shp (e.g. the squares created by create_squares)
+    If raw_img and max_pixels are given, a polygon with more than max_pixels
+    pixels of raw_img is replaced by small squares around max_pixels of its
+    pixels, randomly drawn with sample_extraction.cap_pixels, so that it
+    counts as many pixels as a capped polygon of the training side
+    '''
+    inDriver = ogr.GetDriverByName("ESRI Shapefile")
+    inDataSource = inDriver.Open(in_shp, 0)
+    inLayer = inDataSource.GetLayer()
+
+    outDataSource = inDriver.Open(out_shp, 1)
+    outLayer = outDataSource.GetLayer()
+
+    capped = {}
+    if raw_img is not None and max_pixels is not None:
+        polygons, _ = sample_extraction.read_polygons(in_shp)
+        _, pixels = sample_extraction.polygons_pixels(raw_img, polygons)
+        sizes = {k: len(rows) for k, (rows, _) in pixels.items()}
+        pixels = sample_extraction.cap_pixels(pixels, range(len(polygons)), max_pixels, seed)
+        capped = {k: pixels[k] for k in pixels if len(pixels[k][0]) < sizes[k]}
+        with rasterio.open(raw_img) as src:
+            transform = src.transform
+
+    for k, polygon in enumerate(inLayer):
+        feature = ogr.Feature(outLayer.GetLayerDefn())
+        if k in capped:
+            feature.SetGeometry(pixels_squares(transform, *capped[k]))
+        else:
+            feature.SetGeometry(polygon.GetGeometryRef())
+        feature.SetField("class", polygon.GetField("class"))
+        outLayer.CreateFeature(feature)
+    print('{} polygons appended to {}'.format(len(inLayer), out_shp))
+    if capped:
+        print('{} of them capped to {} pixels'.format(len(capped), max_pixels))
+
+    inDataSource.Destroy()
+    outDataSource.Destroy()
+
+
+def pixels_squares(transform, rows, cols):
+    '''
+    Multipolygon of squares of half a pixel side centred on some pixels,
+    each square containing the centre of its pixel only
+    '''
+    half_X = abs(transform.a) / 4.
+    half_Y = abs(transform.e) / 4.
+    xs, ys = sample_extraction.pixels_centres(transform, rows, cols)
+
+    multipolygon = ogr.Geometry(ogr.wkbMultiPolygon)
+    for x, y in zip(xs, ys):
+        border = ogr.Geometry(ogr.wkbLinearRing)
+        border.AddPoint(x - half_X, y + half_Y)
+        border.AddPoint(x + half_X, y + half_Y)
+        border.AddPoint(x + half_X, y - half_Y)
+        border.AddPoint(x - half_X, y - half_Y)
+        border.AddPoint(x - half_X, y + half_Y)
+        square = ogr.Geometry(ogr.wkbPolygon)
+        square.AddGeometry(border)
+        multipolygon.AddGeometry(square)
+    return multipolygon
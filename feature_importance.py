@@ -0,0 +1,274 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (feature_importance.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Importance of the features and selection of the most important ones.
+
+After the training, the importance of each band of the stack is computed,
+either as the mean decrease of impurity of the trees, or as the validation
+accuracy lost when the band is shuffled (permutation). The OTB models cannot
+be evaluated from Python: a scikit random forest is trained on the same
+samples as a surrogate. The importances are written in
+Statistics/features/feature_importances.csv.
+
+With top_n, the model is trained again on the top_n most important bands
+only, and a stack of these bands (<stack>_top<N>.tif) is written next to the
+full one. The selection is kept in Statistics/features/selected_features.json:
+the following iterations sample and classify the smaller stack, until the
+full stack or top_n changes.
+"""
+import contextlib
+import json
+import os
+import os.path as op
+from typing import List, Optional
+
+import numpy as np
+import rasterio
+import sklearn.ensemble as sk
+from sklearn.inspection import permutation_importance
+
+import model_compression
+import model_store
+import OTB_workflow
+import sample_extraction
+import sample_store
+
+IMPORTANCES_FILE = "feature_importances.csv"
+SELECTION_FILE = "selected_features.json"
+SURROGATE_TREES = 100
+MAX_PERMUTATION_SAMPLES = 20000
+PERMUTATION_REPEATS = 5
+
+
+def get_features_dir(global_parameters) -> str:
+    """
+    Directory of the feature importances and selection.
+    """
+    return op.join(global_parameters["user_choices"]["main_dir"], 'Statistics', 'features')
+
+
+def get_full_stack(global_parameters) -> str:
+    """
+    Path of the stack of all the features.
+    """
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    return op.join(main_dir, 'In_data', 'Image', global_parameters["user_choices"]["raw_img"])
+
+
+def get_selected_stack_name(raw_img_name: str, top_n: int) -> str:
+    """
+    File name of the stack of the top_n selected bands.
+    """
+    return op.splitext(raw_img_name)[0] + '_top{}.tif'.format(top_n)
+
+
+def read_band_names(raw_img: str) -> List[str]:
+    '''
+    Name of each band of a stack, from the <stack>_bands.txt file written
+    with it ("B<n> : <path>" lines), band_<n> if there is none
+    '''
+    with rasterio.open(raw_img) as src:
+        names = ['band_{}'.format(band) for band in range(src.count)]
+    bands_txt = op.splitext(raw_img)[0] + '_bands.txt'
+    if op.exists(bands_txt):
+        with open(bands_txt, 'r') as txt_file:
+            paths = [line.strip().split(" : ", 1)[-1] for line in txt_file if line.strip()]
+        if len(paths) == len(names):
+            names = [op.splitext(op.basename(path))[0] for path in paths]
+    return names
+
+
+def load_selection(global_parameters) -> Optional[dict]:
+    """
+    The selection of bands if it is valid for the full stack and top_n of
+    the configuration, None otherwise.
+    """
+    selection_file = op.join(get_features_dir(global_parameters), SELECTION_FILE)
+    top_n = global_parameters["features"]["top_n"]
+    if top_n is None or not op.exists(selection_file):
+        return None
+    with open(selection_file, 'r') as json_file:
+        selection = json.load(json_file)
+    full_stack = get_full_stack(global_parameters)
+    selected_stack = op.join(op.dirname(full_stack), selection["stack"])
+    if selection["top_n"] != top_n or selection["source"] != op.basename(full_stack) \
+            or not op.exists(selected_stack) \
+            or selection["source_id"] != sample_extraction.get_stack_id(full_stack):
+        return None
+    return selection
+
+
+@contextlib.contextmanager
+def selected_stack(global_parameters):
+    """
+    Sample and classify the stack of the selected bands if there is a valid
+    selection, the full stack being given back afterwards.
+    """
+    raw_img_name = global_parameters["user_choices"]["raw_img"]
+    selection = load_selection(global_parameters)
+    if selection is not None:
+        print('  {} selected features: {}'.format(len(selection["bands"]), ', '.join(selection["names"])))
+        global_parameters["user_choices"]["raw_img"] = selection["stack"]
+    try:
+        yield selection
+    finally:
+        global_parameters["user_choices"]["raw_img"] = raw_img_name
+
+
+def compute_importances(model, x: np.ndarray, y: np.ndarray, kind: str, seed=None) -> np.ndarray:
+    '''
+    Importance of each feature of a model
+
+    Parameters
+    ----------
+    model
+        Trained scikit model.
+    x, y : np.ndarray
+        Samples to compute the permutation importances on.
+    kind : str
+        "impurity", for the models having feature_importances_ (the
+        permutation importances are computed for the others), or
+        "permutation".
+    seed
+        Random seed of the subsampling and of the permutations.
+    '''
+    if kind == "impurity" and hasattr(model, "feature_importances_"):
+        return np.asarray(model.feature_importances_, dtype=np.float64)
+    if len(y) > MAX_PERMUTATION_SAMPLES:
+        drawn = np.sort(np.random.default_rng(seed).choice(len(y), MAX_PERMUTATION_SAMPLES, replace=False))
+        x, y = x[drawn], y[drawn]
+    result = permutation_importance(model, x, y, n_repeats=PERMUTATION_REPEATS, random_state=seed)
+    return result.importances_mean
+
+
+def select_top_features(importances: np.ndarray, top_n: int) -> List[int]:
+    """
+    Indexes of the top_n most important features, in the order of the stack.
+    """
+    ranking = np.argsort(-importances, kind="stable")
+    return sorted(int(index) for index in ranking[:top_n])
+
+
+def write_importances(csv_path: str, names: List[str], bands: List[int], importances: np.ndarray):
+    """
+    Write the importances of the features, from the most important one.
+    """
+    with open(csv_path, 'w') as csv_file:
+        csv_file.write('rank,band,name,importance\n')
+        for rank, index in enumerate(np.argsort(-importances, kind="stable")):
+            csv_file.write('{},{},{},{:.6f}\n'.format(rank + 1, bands[index] + 1, names[index], importances[index]))
+
+
+def write_selected_stack(raw_img: str, bands: List[int], out_tif: str):
+    '''
+    Write the stack of some bands of a stack, by blocks, with the lines of
+    the selected bands in its _bands.txt file
+
+    Parameters
+    ----------
+    raw_img : str
+        Full stack.
+    bands : List[int]
+        0-based indexes of the bands to keep, in their order in the stack.
+    out_tif : str
+        Stack written.
+    '''
+    with rasterio.open(raw_img) as src:
+        profile = src.profile
+        profile.update(count=len(bands))
+        with rasterio.open(out_tif, 'w', **profile) as dst:
+            for _, window in src.block_windows(1):
+                dst.write(src.read([band + 1 for band in bands], window=window), window=window)
+
+    bands_txt = op.splitext(raw_img)[0] + '_bands.txt'
+    if op.exists(bands_txt):
+        with open(bands_txt, 'r') as txt_file:
+            paths = [line.strip().split(" : ", 1)[-1] for line in txt_file if line.strip()]
+        with open(op.splitext(out_tif)[0] + '_bands.txt', 'w') as txt_file:
+            for number, band in enumerate(bands):
+                txt_file.write('B{} : {}\n'.format(number + 1, paths[band]))
+
+
+def feature_importance(global_parameters, model_out: str, selection: Optional[dict] = None) -> Optional[List[str]]:
+    '''
+    Compute and write the importances of the features of the trained model,
+    and select the top_n ones if the model was trained on more features
+
+    Parameters
+    ----------
+    global_parameters : dict
+        Configuration, its raw_img being the stack the model was trained on.
+    model_out : str
+        Trained model.
+    selection : Optional[dict]
+        Selection of bands of the stack the model was trained on, returned
+        by selected_stack, None for the full stack.
+
+    Returns
+    -------
+    Optional[List[str]]
+        The samples columns of the newly selected features, to train the
+        model again on, None if no new selection was made.
+    '''
+    features = global_parameters["features"]
+    method = OTB_workflow.get_method(global_parameters)
+    seed = global_parameters["training_parameters"]["random_seed"]
+    kind = features["importance"] if features["importance"] != "none" else "impurity"
+    raw_img = op.join(global_parameters["user_choices"]["main_dir"], 'In_data', 'Image',
+                      global_parameters["user_choices"]["raw_img"])
+    full_stack = raw_img if selection is None else op.join(op.dirname(raw_img), selection["source"])
+
+    x_train, y_train, columns = sample_store.load_sample_store(sample_store.get_store_path(global_parameters))
+    if "otb" in method:
+        print('  Importance of the features of a scikit random forest trained as a surrogate of the OTB model')
+        model = sk.RandomForestClassifier(n_estimators=SURROGATE_TREES, random_state=seed).fit(x_train, y_train)
+    else:
+        model = model_store.load_model(model_out, mmap=False, cache=False)
+
+    x, y = x_train, y_train
+    if kind == "permutation":
+        x, y = model_compression.read_validation_samples(global_parameters)
+        if not len(y):
+            print('  No validation samples, permutation importances computed on the training samples')
+            x, y = x_train, y_train
+    importances = compute_importances(model, x, y, kind, seed)
+
+    os.makedirs(get_features_dir(global_parameters), exist_ok=True)
+    bands = list(range(len(columns))) if selection is None else selection["bands"]
+    names = [read_band_names(full_stack)[band] for band in bands]
+    write_importances(op.join(get_features_dir(global_parameters), IMPORTANCES_FILE), names, bands, importances)
+
+    top_n = features["top_n"]
+    if top_n is None or top_n >= len(columns):
+        return None
+    selected = select_top_features(importances, top_n)
+    selected_name = get_selected_stack_name(op.basename(full_stack), top_n)
+    print('  Stack of the {} most important features: {}'.format(top_n, selected_name))
+    write_selected_stack(raw_img, selected, op.join(op.dirname(full_stack), selected_name))
+    with open(op.join(get_features_dir(global_parameters), SELECTION_FILE), 'w') as json_file:
+        json.dump({"top_n": top_n, "source": op.basename(full_stack),
+                   "source_id": sample_extraction.get_stack_id(full_stack), "stack": selected_name,
+                   "bands": [bands[index] for index in selected], "names": [names[index] for index in selected]},
+                  json_file, indent=3)
+    return [columns[index] for index in selected]
@@ -0,0 +1,319 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (image_inference.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Classification of the image with a scikit model, by windows.
+
+Each block of the stack is read in its own type, its pixels outside the
+no-data mask are dropped by index, and only the remaining ones are converted
+to float32 and classified. The labels are written as uint8, 0 being the
+no-data value as for the OTB ImageClassifier, and the confidence (highest
+class probability) as float32, 0 outside the mask. The height of the blocks
+is computed from a RAM budget, so that the memory used does not depend on
+the size of the image.
+
+The probabilities of the classes are computed once per pixel, the label
+being the most probable class. With an uncertainty map, a float32 image of
+three bands is also written from the same probabilities: the confidence,
+the margin between the two most probable classes and the entropy of the
+probabilities normalized by the one of uniform probabilities (1 for the most
+uncertain pixels), NaN outside the mask. The OTB models give their
+probabilities in a probability map, from which the same bands are computed.
+
+With several workers, the image is split in tiles classified by a pool of
+processes. Each worker opens the stack and receives the model once, when it
+starts: with the fork start method the model is shared copy-on-write, and
+the memory-mapped arrays of a model stored with joblib are shared through
+the page cache. The tiles classified are written by the main process only,
+a few tiles per worker being in flight at most.
+"""
+import contextlib
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+
+NODATA_LABEL = 0
+TILES_PER_WORKER = 2
+UNCERTAINTY_BANDS = ["confidence", "margin", "entropy"]
+
+# state of the classification in a worker, set by init_worker
+_worker = {}
+
+
+def get_block_rows(width: int, bands_nb: int, itemsize: int, classes_nb: int, ram: int,
+                   block_height: int = 1) -> int:
+    '''
+    Number of rows of the blocks fitting in a RAM budget
+
+    Parameters
+    ----------
+    width : int
+        Width of the image.
+    bands_nb, itemsize : int
+        Number of bands of the stack, and size in bytes of their values.
+    classes_nb : int
+        Number of classes of the model.
+    ram : int
+        RAM budget, in MB.
+    block_height : int
+        Height of the internal blocks of the stack, the blocks of rows being
+        a multiple of it when it fits.
+    '''
+    # the block read, the float32 features and their transposed copy, the
+    # float64 probabilities, the labels, the confidence, the uncertainty
+    # bands and the mask
+    pixel_bytes = bands_nb * (itemsize + 8) + classes_nb * 8 + 28
+    rows = max(1, int(ram * 1024 * 1024 // (pixel_bytes * width)))
+    if rows >= block_height:
+        rows -= rows % block_height
+    return rows
+
+
+def row_windows(width: int, height: int, rows: int) -> Iterator[Window]:
+    """
+    Full-width windows of the given number of rows covering an image.
+    """
+    for row in range(0, height, rows):
+        yield Window(0, row, width, min(rows, height - row))
+
+
+def tile_windows(width: int, height: int, tile_size: int) -> Iterator[Window]:
+    """
+    Square windows of tile_size pixels covering an image, row by row.
+    """
+    for row in range(0, height, tile_size):
+        for col in range(0, width, tile_size):
+            yield Window(col, row, min(tile_size, width - col), min(tile_size, height - row))
+
+
+def uncertainty_bands(probabilities: np.ndarray) -> np.ndarray:
+    '''
+    Confidence, margin between the two most probable classes, and normalized
+    entropy of the probabilities of pixels
+
+    Parameters
+    ----------
+    probabilities : np.ndarray
+        (pixels, classes) probabilities, summing to 1.
+
+    Returns
+    -------
+    np.ndarray
+        (3, pixels) float32 array.
+    '''
+    classes_nb = probabilities.shape[1]
+    bands = np.zeros((len(UNCERTAINTY_BANDS), len(probabilities)), dtype=np.float32)
+    if probabilities.shape[1] > 1:
+        top_two = np.partition(probabilities, -2, axis=1)[:, -2:]
+        bands[0], bands[1] = top_two[:, 1], top_two[:, 1] - top_two[:, 0]
+    else:
+        bands[0] = bands[1] = probabilities[:, 0]
+    if classes_nb > 1:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            entropy = -np.where(probabilities > 0, probabilities * np.log(probabilities), 0.).sum(axis=1)
+        bands[2] = entropy / np.log(classes_nb)
+    return bands
+
+
+def classify_block(model, block: np.ndarray, mask: np.ndarray,
+                   uncertainty: bool = False) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    '''
+    Labels, confidence and uncertainty of a block of the stack, from a single
+    computation of the probabilities
+
+    Parameters
+    ----------
+    model
+        Trained scikit model.
+    block : np.ndarray
+        (bands, rows, cols) block of the stack, in its own type.
+    mask : np.ndarray
+        (rows, cols) no-data mask, the pixels at 0 not being classified.
+    uncertainty : bool
+        Compute the uncertainty bands.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]
+        The (rows, cols) uint8 labels and float32 confidence, 0 for the
+        pixels not classified, and the (3, rows, cols) float32 uncertainty
+        bands, NaN for the pixels not classified, None if not computed.
+    '''
+    bands_nb = block.shape[0]
+    valid = np.flatnonzero(mask.ravel() != 0)
+    features = block.reshape(bands_nb, -1)[:, valid].T.astype(np.float32)
+    if np.issubdtype(block.dtype, np.floating):
+        # the no-data pixels of a float stack
+        finite = ~np.isnan(features).any(axis=1)
+        valid, features = valid[finite], features[finite]
+
+    labels = np.full(mask.size, NODATA_LABEL, dtype=np.uint8)
+    confidence = np.zeros(mask.size, dtype=np.float32)
+    bands = np.full((len(UNCERTAINTY_BANDS), mask.size), np.nan, dtype=np.float32) if uncertainty else None
+    if len(valid):
+        probabilities = model.predict_proba(features)
+        predictions = model.classes_.take(np.argmax(probabilities, axis=1), axis=0)
+        labels[valid] = predictions
+        confidence[valid] = probabilities.max(axis=1)
+        if uncertainty:
+            bands[:, valid] = uncertainty_bands(probabilities)
+    if uncertainty:
+        bands = bands.reshape((len(UNCERTAINTY_BANDS),) + mask.shape)
+    return labels.reshape(mask.shape), confidence.reshape(mask.shape), bands
+
+
+def init_worker(model, raw_img: str, mask_tif: str, uncertainty: bool = False):
+    """
+    Open the stack and the mask, and keep the model, for the windows
+    classified by the process.
+    """
+    _worker.update(model=model, src=rasterio.open(raw_img), mask_src=rasterio.open(mask_tif),
+                   uncertainty=uncertainty)
+
+
+def close_worker():
+    """
+    Close the stack and the mask of the process.
+    """
+    for name in ["src", "mask_src"]:
+        _worker.pop(name).close()
+    _worker.clear()
+
+
+def classify_window(window: Window) -> Tuple[Window, np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """
+    Labels, confidence and uncertainty of a window of the stack, in a process
+    initialized by init_worker.
+    """
+    labels, confidence, bands = classify_block(_worker["model"], _worker["src"].read(window=window),
+                                               _worker["mask_src"].read(1, window=window),
+                                               _worker["uncertainty"])
+    return window, labels, confidence, bands
+
+
+def bounded_map(executor, function, items: Iterable, max_pending: int) -> Iterator:
+    """
+    Results of a function on items run by an executor, in their order of
+    completion, with at most max_pending items submitted and not yet given.
+    """
+    pending = set()
+    for item in items:
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(executor.submit(function, item))
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+
+def get_pool_context():
+    """
+    Start method of the workers, fork when available for the model to be
+    shared copy-on-write.
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def open_uncertainty_map(uncertainty_map: str, profile: dict):
+    """
+    Open the float32 uncertainty map for writing, with the names of its bands.
+    """
+    dst = rasterio.open(uncertainty_map, 'w', **dict(profile, count=len(UNCERTAINTY_BANDS), dtype='float32',
+                                                    nodata=np.nan))
+    for band, name in enumerate(UNCERTAINTY_BANDS):
+        dst.set_band_description(band + 1, name)
+    return dst
+
+
+def classify_image(model, raw_img: str, mask_tif: str, img_labeled: str, confidence_map: str, ram: int = 512,
+                   workers: int = 1,
+                   tile_size: Optional[int] = None, uncertainty_map: Optional[str] = None):
+    '''
+    Classify the stack by windows, and write the labels, the confidence and
+    optionally the uncertainty
+
+    Parameters
+    ----------
+    model
+        Trained scikit model.
+    raw_img : str
+        Stack of the features.
+    mask_tif : str
+        No-data mask, on the grid of the stack.
+    img_labeled, confidence_map : str
+        Labels and confidence written.
+    ram : int
+        RAM budget of the classification, in MB, shared by the workers.
+    workers : int
+        Number of processes classifying the windows, the classification
+        being done in the main process if 1.
+    tile_size : Optional[int]
+        Size in pixels of the square windows, full-width blocks of rows
+        fitting in the RAM budget if None.
+    uncertainty_map : Optional[str]
+        Confidence, margin and entropy written, not computed if None.
+    '''
+    workers = max(1, workers)
+    with rasterio.open(raw_img) as src:
+        if tile_size is None:
+            rows = get_block_rows(src.width, src.count, np.dtype(src.dtypes[0]).itemsize, len(model.classes_),
+                                  ram / workers, src.block_shapes[0][0])
+            windows = row_windows(src.width, src.height, rows)
+        else:
+            windows = tile_windows(src.width, src.height, tile_size)
+        profile = {"driver": "GTiff", "width": src.width, "height": src.height, "count": 1,
+                   "crs": src.crs, "transform": src.transform}
+
+    initargs = (model, raw_img, mask_tif, uncertainty_map is not None)
+    with contextlib.ExitStack() as stack:
+        labels_dst = stack.enter_context(rasterio.open(img_labeled, 'w', dtype='uint8', nodata=NODATA_LABEL,
+                                                       **profile))
+        confidence_dst = stack.enter_context(rasterio.open(confidence_map, 'w', dtype='float32', **profile))
+        uncertainty_dst = None
+        if uncertainty_map is not None:
+            uncertainty_dst = stack.enter_context(open_uncertainty_map(uncertainty_map, profile))
+        if workers == 1:
+            init_worker(*initargs)
+            stack.callback(close_worker)
+            results = map(classify_window, windows)
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers, mp_context=get_pool_context(),
+                                                               initializer=init_worker, initargs=initargs))
+            results = bounded_map(executor, classify_window, windows, TILES_PER_WORKER * workers)
+
+        # the main process is the only writer
+        for window, labels, confidence, bands in results:
+            labels_dst.write(labels, 1, window=window)
+            confidence_dst.write(confidence, 1, window=window)
+            if uncertainty_dst is not None:
+                uncertainty_dst.write(bands, window=window)
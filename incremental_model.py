@@ -0,0 +1,341 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (incremental_model.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Incremental update of the scikit tree ensembles between the iterations of
+the active learning.
+
+Instead of training from scratch, the model of the previous iteration is
+loaded and updated with warm_start:
+ - for the forests (rf_scikit, xtree_scikit), the trees trained on samples
+   mostly deleted since are retired, the oldest trees are retired first to
+   keep the size of the forest, and new trees are trained on the current
+   samples;
+ - for the gradient boosting (grad_scikit), new stages are fitted on the
+   current samples.
+A full retrain is done every few iterations to bound the drift.
+
+The online methods (sgd_scikit, nb_scikit) are updated with partial_fit on
+the samples added since the previous iteration only. The features of
+sgd_scikit are standardized by a scaler updated with the same samples, and
+saved with the model.
+
+Each sample is identified by the hash of its features and class. The
+iteration which built each tree is stored in a JSON file next to the model
+(<model>.json), and the hashes of the samples of each of these iterations in
+a .npz file (<model>_rows.npz).
+"""
+import hashlib
+import json
+import os.path as op
+from typing import Dict, List, Optional
+
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+import model_store
+
+FOREST_METHODS = ["rf_scikit", "xtree_scikit"]
+BOOSTING_METHODS = ["grad_scikit"]
+INCREMENTAL_METHODS = FOREST_METHODS + BOOSTING_METHODS
+ONLINE_METHODS = ["sgd_scikit", "nb_scikit"]
+
+
+def get_metadata_path(model_out: str) -> str:
+    """
+    Path of the metadata of a model.
+    """
+    return model_out + '.json'
+
+
+def get_rows_path(model_out: str) -> str:
+    """
+    Path of the hashes of the samples of the iterations of a model.
+    """
+    return model_out + '_rows.npz'
+
+
+def row_hashes(features: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """
+    64 bits hash of the float32 features and of the class of each sample.
+    """
+    features = np.ascontiguousarray(features, dtype=np.float32)
+    labels = np.ascontiguousarray(labels, dtype=np.int32)
+    return np.array([int.from_bytes(hashlib.blake2b(row.tobytes() + label.tobytes(), digest_size=8).digest(), 'little')
+                     for row, label in zip(features, labels)], dtype=np.uint64)
+
+
+def load_metadata(model_out: str) -> Optional[dict]:
+    """
+    Load the metadata of a model, None if there is none.
+    """
+    metadata_file = get_metadata_path(model_out)
+    if not op.exists(metadata_file) or not op.exists(model_out):
+        return None
+    with open(metadata_file, 'r') as json_file:
+        return json.load(json_file)
+
+
+def save_metadata(model_out: str, metadata: dict, rows: Dict[int, np.ndarray]):
+    """
+    Save the metadata of a model, and the hashes of the samples of the
+    iterations which built its trees.
+    """
+    with open(get_metadata_path(model_out), 'w') as json_file:
+        json.dump(metadata, json_file, indent=3)
+    with open(get_rows_path(model_out), 'wb') as rows_file:
+        np.savez(rows_file, **{'g{}'.format(generation): hashes for generation, hashes in rows.items()})
+
+
+def load_rows(model_out: str) -> Dict[int, np.ndarray]:
+    """
+    Load the hashes of the samples of the iterations of a model.
+    """
+    rows_file = get_rows_path(model_out)
+    if not op.exists(rows_file):
+        return {}
+    with np.load(rows_file) as rows:
+        return {int(name[1:]): rows[name] for name in rows.files}
+
+
+def get_trees_nb(classifier) -> int:
+    """
+    Number of trees of a forest, or of boosting stages.
+    """
+    if hasattr(classifier, "n_estimators_"):
+        return int(classifier.n_estimators_)
+    return len(classifier.estimators_)
+
+
+def kept_proportions(rows: Dict[int, np.ndarray], current_hashes: np.ndarray) -> Dict[int, float]:
+    """
+    Proportion of the samples of each iteration still in the current samples.
+    """
+    return {generation: float(np.isin(hashes, current_hashes).mean()) if len(hashes) else 0.
+            for generation, hashes in rows.items()}
+
+
+def select_trees(generations: List[int], proportions: Dict[int, float], n_estimators: int,
+                 incremental_trees: int, max_deleted_proportion: float):
+    '''
+    Select the trees of a forest to keep, and the number of trees to add
+
+    The trees of the iterations whose samples were deleted above the given
+    proportion are retired, then the oldest trees so that the forest, with
+    the new trees, has n_estimators trees
+
+    Returns
+    -------
+    Tuple[List[int], int]
+        The indexes of the kept trees, oldest first, and the number of
+        trees to add.
+    '''
+    kept = [k for k, generation in enumerate(generations)
+            if 1. - proportions.get(generation, 0.) <= max_deleted_proportion]
+    new_trees_nb = min(n_estimators, max(incremental_trees, n_estimators - len(kept)))
+    kept = kept[max(0, len(kept) + new_trees_nb - n_estimators):]
+    return kept, new_trees_nb
+
+
+def needs_full_retrain(metadata: Optional[dict], previous_model, method: str, parameters: dict,
+                       features_nb: int, classes: List[int], iteration: int, full_retrain_every: int) -> bool:
+    """
+    Whether the previous model cannot be updated: missing, trained with
+    other parameters, features or classes, or too many iterations since its
+    last full retrain.
+    """
+    if metadata is None or previous_model is None:
+        return True
+    return (metadata["method"] != method or metadata["parameters"] != parameters
+            or metadata["features_nb"] != features_nb or metadata["classes"] != classes
+            or len(metadata["generations"]) != get_trees_nb(previous_model)
+            or iteration - metadata["last_full_retrain"] >= full_retrain_every)
+
+
+def load_previous_model(model_out: str):
+    """
+    Load the model of the previous iteration, None if there is none.
+    """
+    if not op.exists(model_out):
+        return None
+    # modified in place, so neither memory-mapped nor shared with the cache
+    return model_store.load_model(model_out, mmap=False, cache=False)
+
+
+def update_forest(classifier, metadata: dict, rows: Dict[int, np.ndarray], current_hashes: np.ndarray,
+                  classification: dict, iteration: int):
+    '''
+    Retire the trees of the forest trained on deleted samples and the
+    oldest ones, then add new trees trained on the current samples
+
+    Returns
+    -------
+    Tuple[List[int], int, int]
+        The iteration of each tree of the updated forest, and the numbers of
+        retired and added trees.
+    '''
+    generations = metadata["generations"]
+    n_estimators = metadata["parameters"].get("n_estimators", len(generations))
+    kept, new_trees_nb = select_trees(generations, kept_proportions(rows, current_hashes), n_estimators,
+                                      classification["incremental_trees"],
+                                      classification["max_deleted_proportion"])
+    classifier.estimators_ = [classifier.estimators_[k] for k in kept]
+    classifier.set_params(n_estimators=len(kept) + new_trees_nb, warm_start=True)
+    return [generations[k] for k in kept] + [iteration] * new_trees_nb, len(generations) - len(kept), new_trees_nb
+
+
+def incremental_fit(classifier, method: str, parameters: dict, x_train: np.ndarray, y_train: np.ndarray,
+                    model_out: str, classification: dict):
+    '''
+    Train a scikit tree ensemble, updating the model of the previous
+    iteration when possible, and save its metadata
+
+    Parameters
+    ----------
+    classifier
+        Unfitted classifier, trained from scratch at a full retrain.
+    method : str
+        Name of the method, among INCREMENTAL_METHODS.
+    parameters : dict
+        Parameters of the method in the model parameters.
+    x_train, y_train : np.ndarray
+        Current training samples.
+    model_out : str
+        Path of the model of the previous iteration, overwritten by the caller.
+    classification : dict
+        "classification" section of the global parameters.
+
+    Returns
+    -------
+    The trained classifier.
+    '''
+    metadata = load_metadata(model_out)
+    previous_model = load_previous_model(model_out) if metadata is not None else None
+    iteration = metadata["iteration"] + 1 if metadata is not None else 0
+    classes = sorted(int(value) for value in np.unique(y_train))
+    current_hashes = row_hashes(x_train, y_train)
+
+    if needs_full_retrain(metadata, previous_model, method, parameters, int(x_train.shape[1]), classes,
+                          iteration, classification["full_retrain_every"]):
+        print('  Full retrain of the model')
+        classifier.fit(x_train, y_train)
+        last_full_retrain = iteration
+        generations = [iteration] * get_trees_nb(classifier)
+    else:
+        classifier = previous_model
+        last_full_retrain = metadata["last_full_retrain"]
+        # new trees differ from the ones of the previous iterations
+        if parameters.get("random_state") is not None:
+            classifier.set_params(random_state=int(parameters["random_state"]) + iteration)
+        if method in FOREST_METHODS:
+            generations, retired_nb, added_nb = update_forest(
+                classifier, metadata, load_rows(model_out), current_hashes, classification, iteration)
+        else:
+            added_nb = classification["incremental_trees"]
+            retired_nb = 0
+            classifier.set_params(n_estimators=get_trees_nb(classifier) + added_nb, warm_start=True)
+            generations = metadata["generations"] + [iteration] * added_nb
+        classifier.fit(x_train, y_train)
+        classifier.set_params(warm_start=False)
+        print('  Incremental update of the model: {} trees retired, {} trees added'.format(retired_nb, added_nb))
+
+    rows = load_rows(model_out) if last_full_retrain != iteration else {}
+    rows = {generation: hashes for generation, hashes in rows.items() if generation in generations}
+    rows[iteration] = current_hashes
+    save_metadata(model_out, {"method": method, "parameters": parameters, "iteration": iteration,
+                              "last_full_retrain": last_full_retrain, "features_nb": int(x_train.shape[1]),
+                              "classes": classes, "generations": generations}, rows)
+    return classifier
+
+
+class ScaledSGDClassifier(SGDClassifier):
+    """
+    SGDClassifier on standardized features, the bands of the stack having
+    very different scales. The scaler is fitted with the classifier, and
+    updated by partial_fit with the same samples.
+    """
+
+    def fit(self, X, y, coef_init=None, intercept_init=None, sample_weight=None):
+        self.scaler_ = StandardScaler().fit(X)
+        return super().fit(self.scaler_.transform(X), y, coef_init=coef_init, intercept_init=intercept_init,
+                           sample_weight=sample_weight)
+
+    def partial_fit(self, X, y, classes=None, sample_weight=None):
+        if not hasattr(self, "scaler_"):
+            self.scaler_ = StandardScaler()
+        self.scaler_.partial_fit(X)
+        return super().partial_fit(self.scaler_.transform(X), y, classes=classes, sample_weight=sample_weight)
+
+    def decision_function(self, X):
+        # also used by predict and predict_proba
+        return super().decision_function(self.scaler_.transform(X))
+
+
+def online_fit(classifier, method: str, parameters: dict, x_train: np.ndarray, y_train: np.ndarray,
+               model_out: str, classification: dict):
+    '''
+    Train an online classifier, updating the model of the previous iteration
+    with partial_fit on the samples it has not seen yet when possible, and
+    save its metadata
+
+    The deleted samples cannot be unlearned: the model is trained from
+    scratch when they are above max_deleted_proportion of the samples seen,
+    every full_retrain_every iterations, or when the parameters, the
+    features or the classes change. The arguments are the ones of
+    incremental_fit.
+
+    Returns
+    -------
+    The trained classifier.
+    '''
+    metadata = load_metadata(model_out)
+    previous_model = load_previous_model(model_out) if metadata is not None else None
+    iteration = metadata["iteration"] + 1 if metadata is not None else 0
+    classes = sorted(int(value) for value in np.unique(y_train))
+    current_hashes = row_hashes(x_train, y_train)
+    seen_hashes = load_rows(model_out).get(0, np.array([], dtype=np.uint64))
+
+    deleted_proportion = 1. - kept_proportions({0: seen_hashes}, current_hashes)[0]
+    if previous_model is None or metadata["method"] != method or metadata["parameters"] != parameters \
+            or metadata["features_nb"] != int(x_train.shape[1]) or not set(classes) <= set(metadata["classes"]) \
+            or deleted_proportion > classification["max_deleted_proportion"] \
+            or iteration - metadata["last_full_retrain"] >= classification["full_retrain_every"]:
+        print('  Full retrain of the model')
+        classifier.fit(x_train, y_train)
+        last_full_retrain = iteration
+        seen_hashes = current_hashes
+    else:
+        classifier = previous_model
+        last_full_retrain = metadata["last_full_retrain"]
+        classes = metadata["classes"]
+        new_samples = ~np.isin(current_hashes, seen_hashes)
+        if new_samples.any():
+            classifier.partial_fit(x_train[new_samples], y_train[new_samples])
+        seen_hashes = np.union1d(seen_hashes, current_hashes[new_samples])
+        print('  Online update of the model with {} new samples'.format(int(new_samples.sum())))
+
+    save_metadata(model_out, {"method": method, "parameters": parameters, "iteration": iteration,
+                              "last_full_retrain": last_full_retrain, "features_nb": int(x_train.shape[1]),
+                              "classes": classes}, {0: seen_hashes})
+    return classifier
@@ -0,0 +1,227 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (kfold_evaluation.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Evaluation of the folds of the K-fold cross-validation on the validation
+pixels only ("validation_pixels" kfold_evaluation).
+
+The confusion matrix of a fold only needs the regularized labels of the
+validation pixels. The regularization of a pixel only depends on the labels
+in a ball of regularization_radius around it: the (2 * radius + 1)² patches
+of the stack around the validation pixels are put side by side in a small
+mosaic, which is classified and regularized as the full image would be. The
+labels at the center of the patches are the ones of the full image, except
+near its edges, where the pixels outside the image are no-data. The
+confusion matrix is written in the format of the OTB ComputeConfusionMatrix,
+and the full image outputs (confidence, colorized map, contours) are not
+written, except for the last fold with kfold_last_full_image.
+"""
+import math
+import os.path as op
+from typing import Tuple
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+import model_compression
+import OTB_workflow
+import sample_extraction
+
+
+def is_pixels_evaluation(global_parameters, k_fold_step=None) -> bool:
+    """
+    Whether a fold of the K-fold is evaluated on the validation pixels only,
+    not on the classification of the full image.
+    """
+    training_parameters = global_parameters["training_parameters"]
+    if k_fold_step is None or training_parameters["kfold_evaluation"] != "validation_pixels":
+        return False
+    return not (training_parameters["kfold_last_full_image"] and k_fold_step == training_parameters["Kfold"] - 1)
+
+
+def read_validation_pixels(validation_shp: str, validation_shp_extended: str, raw_img: str,
+                           max_dist: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Row, column and class of the validation pixels, as rasterized by the OTB
+    confusion matrix from the extended validation shapefile: the pixels of
+    the squares around the validation points, then the ones of the (capped)
+    validation polygons appended after the squares. A pixel in several
+    squares or polygons is counted once, with the class of the first one
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        The rows, columns and classes of the pixels in the image.
+    '''
+    xs, ys, classes = sample_extraction.read_points(validation_shp)
+    with rasterio.open(raw_img) as src:
+        transform, width, height = src.transform, src.width, src.height
+    windows = sample_extraction.points_to_windows(xs, ys, transform, width, height, max_dist, max_dist)
+    vectors = []
+    for window, class_nb in zip(windows, classes):
+        if window is not None:
+            rows, cols = np.indices((window.height, window.width)).reshape(2, -1)
+            vectors.append((rows + window.row_off, cols + window.col_off, class_nb))
+
+    # the squares of the points are the first features of the extended shapefile
+    polygons, polygon_classes = sample_extraction.read_polygons(validation_shp_extended)
+    _, polygon_pixels = sample_extraction.polygons_pixels(raw_img, polygons[len(xs):])
+    for k, (rows, cols) in sorted(polygon_pixels.items()):
+        vectors.append((rows, cols, polygon_classes[len(xs) + k]))
+
+    pixels = {}
+    for rows, cols, class_nb in vectors:
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            pixels.setdefault((row, col), int(class_nb))
+
+    rows = np.array([row for row, _ in pixels], dtype=np.int64)
+    cols = np.array([col for _, col in pixels], dtype=np.int64)
+    return rows, cols, np.array(list(pixels.values()), dtype=np.int64)
+
+
+def get_grid_shape(patches_nb: int) -> Tuple[int, int]:
+    """
+    Number of rows and columns of patches of the mosaic.
+    """
+    grid_cols = max(1, math.ceil(math.sqrt(patches_nb)))
+    return max(1, math.ceil(patches_nb / grid_cols)), grid_cols
+
+
+def write_patches_mosaic(raw_img: str, mask_tif: str, rows: np.ndarray, cols: np.ndarray, radius: int,
+                         out_stack: str, out_mask: str):
+    '''
+    Write the mosaic of the patches of the stack and of the no-data mask
+    around some pixels
+
+    Parameters
+    ----------
+    raw_img, mask_tif : str
+        Stack and no-data mask of the image.
+    rows, cols : np.ndarray
+        Centers of the patches, the patch k being the k-th of the mosaic,
+        row by row.
+    radius : int
+        Radius of the patches, of (2 * radius + 1)² pixels. The pixels
+        outside the image are no-data.
+    out_stack, out_mask : str
+        Mosaics written.
+    '''
+    size = 2 * radius + 1
+    grid_rows, grid_cols = get_grid_shape(len(rows))
+    with rasterio.open(raw_img) as src, rasterio.open(mask_tif) as mask_src:
+        stack = np.zeros((src.count, grid_rows * size, grid_cols * size), dtype=src.dtypes[0])
+        mask = np.zeros((grid_rows * size, grid_cols * size), dtype=mask_src.dtypes[0])
+        for k, (row, col) in enumerate(zip(rows, cols)):
+            window = Window(int(col) - radius, int(row) - radius, size, size)
+            top, left = (k // grid_cols) * size, (k % grid_cols) * size
+            stack[:, top:top + size, left:left + size] = src.read(window=window, boundless=True, fill_value=0)
+            mask[top:top + size, left:left + size] = mask_src.read(1, window=window, boundless=True, fill_value=0)
+        res = src.res
+
+    profile = {"driver": "GTiff", "width": grid_cols * size, "height": grid_rows * size,
+               "transform": from_origin(0, grid_rows * size * res[1], res[0], res[1])}
+    with rasterio.open(out_stack, 'w', count=len(stack), dtype=stack.dtype, **profile) as dst:
+        dst.write(stack)
+    with rasterio.open(out_mask, 'w', count=1, dtype=mask.dtype, **profile) as dst:
+        dst.write(mask, 1)
+
+
+def read_patches_centers(labeled_tif: str, patches_nb: int, radius: int) -> np.ndarray:
+    """
+    Labels of the center pixels of the patches of a classified mosaic.
+    """
+    size = 2 * radius + 1
+    _, grid_cols = get_grid_shape(patches_nb)
+    with rasterio.open(labeled_tif) as src:
+        labels = src.read(1)
+    patches = np.arange(patches_nb)
+    return labels[(patches // grid_cols) * size + radius, (patches % grid_cols) * size + radius]
+
+
+def write_confusion_matrix(reference: np.ndarray, produced: np.ndarray, csv_path: str, nodata: int = 0):
+    '''
+    Write the confusion matrix of labels in the format of the OTB
+    ComputeConfusionMatrix, the references in rows and the produced labels
+    in columns, the pixels produced as no-data being ignored. Every reference
+    class has its row, and the produced labels are the reference classes
+    when all the pixels are produced as no-data.
+    '''
+    classes_ref = np.unique(reference)
+    kept = produced != nodata
+    reference, produced = reference[kept], produced[kept]
+    classes_produced = np.unique(produced) if produced.size else classes_ref
+    matrix = np.zeros((len(classes_ref), len(classes_produced)), dtype=np.int64)
+    np.add.at(matrix, (np.searchsorted(classes_ref, reference), np.searchsorted(classes_produced, produced)), 1)
+    with open(csv_path, 'w') as csv_file:
+        csv_file.write('#Reference labels (rows):{}\n'.format(','.join(str(c) for c in classes_ref)))
+        csv_file.write('#Produced labels (columns):{}\n'.format(','.join(str(c) for c in classes_produced)))
+        for line in matrix:
+            csv_file.write('{}\n'.format(','.join(str(n) for n in line)))
+
+
+def evaluate_fold(global_parameters) -> str:
+    '''
+    Classify and regularize the patches around the validation pixels with the
+    model of the fold, and write its confusion matrix
+
+    Returns
+    -------
+    str
+        The confusion matrix written.
+    '''
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    classification = global_parameters["classification"]
+    radius = int(global_parameters["training_parameters"]["regularization_radius"])
+    raw_img = op.join(main_dir, 'In_data', 'Image', global_parameters["user_choices"]["raw_img"])
+    mask_tif = op.join(main_dir, 'In_data', 'Masks', global_parameters["general"]["no_data_mask"])[0:-4] + '.tif'
+    validation_shp = op.join(main_dir, 'Intermediate', global_parameters["general"]["validation_shp"])
+    validation_shp_extended = op.join(main_dir, 'Intermediate', global_parameters["general"]["validation_shp_extended"])
+    max_dist = float(global_parameters["training_parameters"]["expansion_distance"])
+
+    rows, cols, classes = read_validation_pixels(validation_shp, validation_shp_extended, raw_img, max_dist)
+    print('  Classification of the patches around the {} validation pixels'.format(len(rows)))
+    patches_stack = op.join(main_dir, 'Intermediate', 'kfold_patches.tif')
+    patches_mask = op.join(main_dir, 'Intermediate', 'kfold_patches_mask.tif')
+    write_patches_mosaic(raw_img, mask_tif, rows, cols, radius, patches_stack, patches_mask)
+
+    method = OTB_workflow.get_method(global_parameters)
+    model = op.join(main_dir, 'Models', ('model.' + method))
+    if "scikit" in method:
+        model = model_compression.get_classification_model(global_parameters, model)
+    patches_labeled = op.join(main_dir, 'Intermediate', 'kfold_patches_labeled.tif')
+    kwargs = {"raw_img": patches_stack, "model": model, "img_labeled": patches_labeled,
+              "confidence_map": op.join(main_dir, 'Intermediate', 'kfold_patches_confidence.tif'),
+              "mask_tif": patches_mask, "shell": False}
+    if "otb" in method:
+        OTB_workflow.otb_class(**kwargs)
+    else:
+        OTB_workflow.scikit_class(ram=classification["inference_ram"], **kwargs)
+    patches_regularized = op.join(main_dir, 'Intermediate', 'kfold_patches_regularized.tif')
+    OTB_workflow.regularize(patches_labeled, patches_regularized, radius)
+
+    conf_matrix = op.join(main_dir, 'Statistics', global_parameters["postprocessing"]["confusion_matrix"])
+    write_confusion_matrix(classes, read_patches_centers(patches_regularized, len(rows), radius), conf_matrix)
+    print('  Confusion matrix of the validation pixels: {}'.format(conf_matrix))
+    return conf_matrix
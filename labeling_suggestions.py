@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (labeling_suggestions.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Suggestions of locations to label at the next iteration.
+
+After the classification, the pixels where the model is the least sure are
+proposed: the ones whose confidence is at most max_confidence, ranked by the
+disagreement between the two most probable classes (1 - margin) when the
+uncertainty map is written, by 1 - confidence otherwise. The image is split
+in a grid of cells of cell_size pixels, and the most informative pixel of
+each cell is a candidate, so that the suggestions are spread over the image
+and not clustered in the largest uncertain area. The number best candidates
+are written as points in In_data/Masks/suggestions.shp, to be loaded in QGIS
+next to the class layers, with the label given by the model, its confidence
+and the score.
+"""
+import math
+import os
+import os.path as op
+from typing import List, Optional
+
+import numpy as np
+import rasterio
+from osgeo import ogr, osr
+from rasterio.windows import Window
+
+import OTB_workflow
+
+
+def cells_best_pixels(score: np.ndarray, cell_size: int) -> List[tuple]:
+    '''
+    Pixel of highest score of each cell of a block of rows
+
+    Parameters
+    ----------
+    score : np.ndarray
+        (rows, cols) scores, -inf for the pixels which cannot be suggested.
+    cell_size : int
+        Size of the cells, the block being a row of cells.
+
+    Returns
+    -------
+    List[tuple]
+        (row, col, score) of the best pixel of each cell having one.
+    '''
+    rows, cols = score.shape
+    cells_nb = math.ceil(cols / cell_size)
+    padded = np.full((cell_size, cells_nb * cell_size), -np.inf)
+    padded[:rows, :cols] = score
+    cells = padded.reshape(cell_size, cells_nb, cell_size).transpose(1, 0, 2).reshape(cells_nb, -1)
+    best = np.argmax(cells, axis=1)
+    best_score = cells[np.arange(cells_nb), best]
+    return [(int(best[k] // cell_size), int(k * cell_size + best[k] % cell_size), float(best_score[k]))
+            for k in np.flatnonzero(np.isfinite(best_score))]
+
+
+def sample_suggestions(labeled_tif: str, confidence_map: str, uncertainty_map: Optional[str] = None,
+                       cell_size: int = 64, number: int = 50, max_confidence: float = 0.7) -> List[dict]:
+    '''
+    Most informative pixels of a classification, at most one per cell of a
+    grid
+
+    Parameters
+    ----------
+    labeled_tif : str
+        Labels of the classification, 0 outside the no-data mask.
+    confidence_map : str
+        Confidence of the classification.
+    uncertainty_map : Optional[str]
+        Uncertainty map of the classification, the pixels being ranked by
+        1 - margin if given, by 1 - confidence otherwise.
+    cell_size : int
+        Size in pixels of the cells of the grid.
+    number : int
+        Maximum number of suggestions.
+    max_confidence : float
+        Highest confidence of the pixels suggested.
+
+    Returns
+    -------
+    List[dict]
+        Row, column, label, confidence and score of the suggestions, from
+        the most informative one.
+    '''
+    candidates = []
+    with rasterio.open(labeled_tif) as labels_src, rasterio.open(confidence_map) as confidence_src:
+        uncertainty_src = rasterio.open(uncertainty_map) if uncertainty_map is not None else None
+        try:
+            for row in range(0, labels_src.height, cell_size):
+                window = Window(0, row, labels_src.width, min(cell_size, labels_src.height - row))
+                labels = labels_src.read(1, window=window)
+                confidence = confidence_src.read(1, window=window).astype(np.float64)
+                if uncertainty_src is not None:
+                    score = 1. - uncertainty_src.read(2, window=window).astype(np.float64)
+                else:
+                    score = 1. - confidence
+                # neither the no-data nor the pixels left undecided by the regularization
+                score[(labels == 0) | (labels == OTB_workflow.UNDECIDED_LABEL) | (confidence > max_confidence)
+                      | ~np.isfinite(score)] = -np.inf
+                candidates += [{"row": row + r, "col": c, "label": int(labels[r, c]),
+                                "confidence": float(confidence[r, c]), "score": s}
+                               for r, c, s in cells_best_pixels(score, cell_size)]
+        finally:
+            if uncertainty_src is not None:
+                uncertainty_src.close()
+    candidates.sort(key=lambda candidate: -candidate["score"])
+    return candidates[:number]
+
+
+def write_suggestions(suggestions: List[dict], labeled_tif: str, out_shp: str):
+    """
+    Write the suggestions as points at the center of their pixels, in the
+    projection of the classification.
+    """
+    with rasterio.open(labeled_tif) as src:
+        transform, wkt = src.transform, src.crs.to_wkt() if src.crs else ''
+
+    outDriver = ogr.GetDriverByName("ESRI Shapefile")
+    # Remove output shapefile if it already exists
+    if os.path.exists(out_shp):
+        outDriver.DeleteDataSource(out_shp)
+    outDataSource = outDriver.CreateDataSource(out_shp)
+    outLayer = outDataSource.CreateLayer("buff_layer", osr.SpatialReference(wkt=wkt), geom_type=ogr.wkbPoint)
+    outLayer.CreateField(ogr.FieldDefn("label", ogr.OFTInteger))
+    for name in ["confidence", "score"]:
+        outLayer.CreateField(ogr.FieldDefn(name, ogr.OFTReal))
+
+    featureDefn = outLayer.GetLayerDefn()
+    for suggestion in suggestions:
+        x, y = transform * (suggestion["col"] + 0.5, suggestion["row"] + 0.5)
+        point = ogr.Geometry(ogr.wkbPoint)
+        point.SetPoint(0, x, y)
+        feature = ogr.Feature(featureDefn)
+        feature.SetGeometry(point)
+        for name in ["label", "confidence", "score"]:
+            feature.SetField(name, suggestion[name])
+        outLayer.CreateFeature(feature)
+
+    # Close DataSource
+    outDataSource.Destroy()
+
+
+def labeling_suggestions(global_parameters) -> str:
+    '''
+    Write the suggestions of locations to label of the last classification
+    '''
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    suggestions = global_parameters["suggestions"]
+    labeled_tif = op.join(main_dir, 'Out', global_parameters["general"]["img_labeled_regularized"])
+    uncertainty_map = op.join(main_dir, 'Out', 'uncertainty.tif')
+    if not global_parameters["classification"]["uncertainty"] or not op.exists(uncertainty_map):
+        uncertainty_map = None
+
+    points = sample_suggestions(labeled_tif, op.join(main_dir, 'Out', 'confidence.tif'), uncertainty_map,
+                                suggestions["cell_size"], suggestions["number"], suggestions["max_confidence"])
+    out_shp = op.join(main_dir, 'In_data', 'Masks', suggestions["layer"])
+    write_suggestions(points, labeled_tif, out_shp)
+    print('  {} suggestions of points to label: {}'.format(len(points), out_shp))
+    return out_shp
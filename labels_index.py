@@ -0,0 +1,210 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (labels_index.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Spatial index of the merged label points on the pixel grid of the stack.
+
+The points are snapped to the pixel they fall in, which gives:
+ - the duplicates: several points of the same class in the same pixel,
+   extracted and trained on several times;
+ - the conflicts: points of different classes in the same pixel;
+ - the overlapping squares: squares of different classes, once expanded by
+   create_squares, which share some pixels.
+"""
+import json
+import os.path as op
+from typing import Dict, List, Tuple
+
+import numpy as np
+import rasterio
+from osgeo import ogr
+
+import sample_extraction
+
+
+def read_labels(in_shp: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Read the FID, coordinates and class of the labelled points of a shapefile.
+    Points without class are skipped.
+    """
+    inDriver = ogr.GetDriverByName("ESRI Shapefile")
+    inDataSource = inDriver.Open(in_shp, 0)
+    inLayer = inDataSource.GetLayer()
+
+    fids, xs, ys, classes = [], [], [], []
+    for point in inLayer:
+        current_class = point.GetField("class")
+        if current_class != None:
+            ingeom = point.GetGeometryRef()
+            fids.append(point.GetFID())
+            xs.append(ingeom.GetX(0))
+            ys.append(ingeom.GetY(0))
+            classes.append(int(current_class))
+
+    inDataSource.Destroy()
+    return (np.array(fids, dtype=np.int64), np.array(xs, dtype=np.float64),
+            np.array(ys, dtype=np.float64), np.array(classes, dtype=np.int64))
+
+
+def snap_to_pixels(xs: np.ndarray, ys: np.ndarray, transform) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Row and column of the pixels of the stack the points fall in.
+    """
+    cols = np.floor((xs - transform.c) / transform.a).astype(np.int64)
+    rows = np.floor((ys - transform.f) / transform.e).astype(np.int64)
+    return rows, cols
+
+
+def pixel_groups(rows: np.ndarray, cols: np.ndarray) -> Dict[Tuple[int, int], List[int]]:
+    """
+    Index of the points by pixel: (row, col) -> indexes of the points in it.
+    """
+    groups = {}
+    for k, pixel in enumerate(zip(rows.tolist(), cols.tolist())):
+        groups.setdefault(pixel, []).append(k)
+    return groups
+
+
+def find_duplicates(groups: Dict[Tuple[int, int], List[int]],
+                    classes: np.ndarray) -> Tuple[List[int], List[List[int]]]:
+    """
+    Find the duplicates and the conflicts among the points of each pixel.
+
+    Returns
+    -------
+    Tuple[List[int], List[List[int]]]
+        The indexes of the duplicated points (all the points of a pixel of
+        the same class but the first one), and the groups of points of
+        different classes sharing a pixel.
+    """
+    duplicates = []
+    conflicts = []
+    for indexes in groups.values():
+        if len(indexes) < 2:
+            continue
+        if len(set(classes[indexes].tolist())) > 1:
+            conflicts.append(indexes)
+        else:
+            duplicates.extend(indexes[1:])
+    return sorted(duplicates), conflicts
+
+
+def windows_overlap(window_a, window_b) -> bool:
+    """
+    Whether two pixel windows share at least one pixel.
+    """
+    return (window_a.col_off < window_b.col_off + window_b.width and
+            window_b.col_off < window_a.col_off + window_a.width and
+            window_a.row_off < window_b.row_off + window_b.height and
+            window_b.row_off < window_a.row_off + window_a.height)
+
+
+def grid_neighbours(grid: Dict[Tuple[int, int], List[int]], cell: Tuple[int, int]) -> List[int]:
+    """
+    Points of a cell of the grid index and of the 8 cells around it.
+    """
+    neighbours = []
+    for d_row in (-1, 0, 1):
+        for d_col in (-1, 0, 1):
+            neighbours.extend(grid.get((cell[0] + d_row, cell[1] + d_col), []))
+    return neighbours
+
+
+def find_overlapping_squares(windows: list, classes: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Find the pairs of squares of different classes sharing some pixels.
+
+    The windows are indexed on a grid whose cells are as large as the largest
+    window, so that two overlapping windows start in the same cell or in
+    neighbouring cells.
+    """
+    valid = [k for k, window in enumerate(windows) if window is not None]
+    if not valid:
+        return []
+    cell_size = max(max(windows[k].width, windows[k].height) for k in valid)
+
+    grid = {}
+    for k in valid:
+        grid.setdefault((windows[k].row_off // cell_size, windows[k].col_off // cell_size), []).append(k)
+
+    pairs = []
+    for cell, members in grid.items():
+        neighbours = grid_neighbours(grid, cell)
+        for k in members:
+            pairs.extend((k, j) for j in neighbours
+                         if j > k and classes[j] != classes[k] and windows_overlap(windows[k], windows[j]))
+    return sorted(pairs)
+
+
+def remove_labels(in_shp: str, fids: List[int]):
+    """
+    Remove the given features from a shapefile, in place.
+    """
+    inDriver = ogr.GetDriverByName("ESRI Shapefile")
+    inDataSource = inDriver.Open(in_shp, 1)
+    inLayer = inDataSource.GetLayer()
+    for fid in fids:
+        inLayer.DeleteFeature(int(fid))
+    inDataSource.ExecuteSQL('REPACK {}'.format(inLayer.GetName()))
+    inDataSource.Destroy()
+
+
+def index_labels(global_parameters, merged_shp: str) -> dict:
+    '''
+    Snap the merged label points to the pixels of the stack, report the
+    duplicates, the conflicts and the overlapping squares in the Statistics
+    directory and, if asked, collapse the duplicates and drop the conflicting
+    points from the merged shapefile.
+    '''
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    raw_img = op.join(main_dir, 'In_data', 'Image', global_parameters["user_choices"]["raw_img"])
+    labels_report = op.join(main_dir, 'Statistics', global_parameters["general"]["labels_report"])
+    max_dist = float(global_parameters["training_parameters"]["expansion_distance"])
+    collapse = global_parameters["training_parameters"]["collapse_duplicate_labels"]
+
+    fids, xs, ys, classes = read_labels(merged_shp)
+    with rasterio.open(raw_img) as src:
+        transform, width, height = src.transform, src.width, src.height
+
+    rows, cols = snap_to_pixels(xs, ys, transform)
+    duplicates, conflicts = find_duplicates(pixel_groups(rows, cols), classes)
+    windows = sample_extraction.points_to_windows(xs, ys, transform, width, height, max_dist, max_dist)
+    overlaps = find_overlapping_squares(windows, classes)
+
+    report = {"points_nb": int(len(fids)),
+              "duplicates": [int(fids[k]) for k in duplicates],
+              "conflicts": [[int(fids[k]) for k in group] for group in conflicts],
+              "overlapping_squares": [[int(fids[k]), int(fids[j])] for k, j in overlaps],
+              "collapsed": bool(collapse)}
+    with open(labels_report, 'w') as json_file:
+        json.dump(report, json_file, indent=3)
+
+    print('{} points, {} duplicates, {} pixels with conflicting classes, {} overlapping squares of different classes'.format(
+        len(fids), len(duplicates), len(conflicts), len(overlaps)))
+
+    if collapse and (duplicates or conflicts):
+        removed = report["duplicates"] + [fid for group in report["conflicts"] for fid in group]
+        remove_labels(merged_shp, removed)
+        print('{} points removed from {}'.format(len(removed), merged_shp))
+
+    return report
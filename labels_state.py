@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (labels_state.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+State of the labels at the last masks preprocessing, used to only redo the
+work needed by the changes of the operator.
+
+The state is a JSON file in the Intermediate directory holding:
+ - the hash of the geometry of each feature of each class layer;
+ - the training (1) or validation (0) assignment of each labelled point,
+   identified by the hash of its geometry and class;
+ - the hash of the no-data mask and of the image it was rasterized on;
+ - the parameters the split and the squares were computed with;
+ - the hash of the files of the split and of the squares, to detect that
+   they were replaced, e.g. by a K-fold run.
+"""
+import hashlib
+import json
+import math
+import os.path as op
+from typing import Dict, List
+
+from osgeo import ogr
+
+import sample_extraction
+
+
+def geometry_hash(geometry, class_name=None) -> str:
+    """
+    Hash of a geometry, and of its class if given.
+    """
+    content = bytes(geometry.ExportToWkb())
+    if class_name is not None:
+        content += str(class_name).encode()
+    return hashlib.sha1(content).hexdigest()
+
+
+def layer_hashes(in_shp: str) -> List[str]:
+    """
+    Sorted hashes of the geometries of the features of a shapefile.
+    """
+    inDriver = ogr.GetDriverByName("ESRI Shapefile")
+    inDataSource = inDriver.Open(in_shp, 0)
+    hashes = sorted(geometry_hash(feature.GetGeometryRef()) for feature in inDataSource.GetLayer())
+    inDataSource.Destroy()
+    return hashes
+
+
+def files_hash(paths: List[str]) -> str:
+    """
+    Hash of the content of files, the missing ones being skipped.
+    """
+    sha1 = hashlib.sha1()
+    for path in paths:
+        if op.exists(path):
+            with open(path, 'rb') as in_file:
+                sha1.update(in_file.read())
+    return sha1.hexdigest()
+
+
+def no_data_hash(no_data_shp: str, reference_tif: str) -> str:
+    """
+    Hash of the no-data shapefile (with its sidecar files) and of the image
+    it is rasterized on.
+    """
+    basename = op.splitext(no_data_shp)[0]
+    content = files_hash([basename + extension for extension in ['.shp', '.shx', '.dbf', '.prj']])
+    return content + sample_extraction.get_stack_id(reference_tif)
+
+
+def load_labels_state(state_file: str) -> dict:
+    """
+    Load the state of the last masks preprocessing, empty if there is none.
+    """
+    if not op.exists(state_file):
+        return {"layers": {}, "split": {}, "no_data": None, "parameters": None, "split_files": None}
+    with open(state_file, 'r') as json_file:
+        return json.load(json_file)
+
+
+def save_labels_state(state_file: str, state: dict):
+    """
+    Save the state of the masks preprocessing.
+    """
+    with open(state_file, 'w') as json_file:
+        json.dump(state, json_file)
+
+
+def changed_layers(previous_layers: Dict[str, List[str]], current_layers: Dict[str, List[str]]) -> List[str]:
+    """
+    Names of the class layers added, removed or whose features changed.
+    """
+    names = set(previous_layers.keys()) | set(current_layers.keys())
+    return sorted(name for name in names if previous_layers.get(name) != current_layers.get(name))
+
+
+def new_points_assignment(new_hashes: List[str], previous_assignments: List[int], proportion: float) -> Dict[str, int]:
+    """
+    Deterministic split of the new points of a class: 1 for training, 0 for
+    validation. As in split_samples.split_points_sample, the class gets
+    ceil(proportion * points) training points, the new points completing
+    the ones of the previous split in the order of their hashes.
+    """
+    training_nb = math.ceil(proportion * (len(new_hashes) + len(previous_assignments))) - sum(previous_assignments)
+    training_nb = min(max(training_nb, 0), len(new_hashes))
+    return {point_hash: int(rank < training_nb) for rank, point_hash in enumerate(sorted(new_hashes))}
+
+
+def points_split(train_shp: str, validation_shp: str) -> Dict[str, int]:
+    """
+    Assignment of the points of a training and a validation shapefile, by
+    the hash of their geometry and class.
+    """
+    split = {}
+    inDriver = ogr.GetDriverByName("ESRI Shapefile")
+    for in_shp, assignment in [(train_shp, 1), (validation_shp, 0)]:
+        inDataSource = inDriver.Open(in_shp, 0)
+        for point in inDataSource.GetLayer():
+            split[geometry_hash(point.GetGeometryRef(), point.GetField("class"))] = assignment
+        inDataSource.Destroy()
+    return split
+
+
+def incremental_split(merged_shp: str, previous_split: Dict[str, int], proportion: float):
+    '''
+    Assign each point of the merged shapefile to the training or validation
+    set: the points of the previous split keep their assignment, the new
+    ones are split by class with new_points_assignment.
+
+    Returns
+    -------
+    Tuple[Dict[str, int], List[int], List[int]]
+        The assignment of each point hash, the FIDs of the training points
+        and the FIDs of the validation points.
+    '''
+    inDriver = ogr.GetDriverByName("ESRI Shapefile")
+    inDataSource = inDriver.Open(merged_shp, 0)
+
+    points = []
+    previous_assignments = {}
+    new_hashes = {}
+    for point in inDataSource.GetLayer():
+        class_name = point.GetField("class")
+        point_hash = geometry_hash(point.GetGeometryRef(), class_name)
+        points.append((point.GetFID(), point_hash))
+        if point_hash in previous_split:
+            previous_assignments.setdefault(class_name, []).append(previous_split[point_hash])
+        else:
+            new_hashes.setdefault(class_name, []).append(point_hash)
+    inDataSource.Destroy()
+
+    split = {point_hash: previous_split[point_hash] for _, point_hash in points if point_hash in previous_split}
+    for class_name, hashes in new_hashes.items():
+        split.update(new_points_assignment(hashes, previous_assignments.get(class_name, []), proportion))
+    train_FID = [fid for fid, point_hash in points if split[point_hash] == 1]
+    validation_FID = [fid for fid, point_hash in points if split[point_hash] == 0]
+
+    print('{} new points, {} training points, {} validation points'.format(
+        sum(len(hashes) for hashes in new_hashes.values()), len(train_FID), len(validation_FID)))
+    return split, train_FID, validation_FID
@@ -24,7 +24,6 @@ You should have received a copy of the GNU Lesser General Public
 License along with this program.  If not, see
 https://www.gnu.org/licenses/gpl-3.0.fr.html
 """
-import shutil
 import os.path as op
 from osgeo import ogr, gdal
 
@@ -32,13 +31,17 @@ from osgeo import ogr, gdal
 import expand_point_region
 import split_samples
 import merge_shapefiles
-import glob
+import labels_index
+import labels_state
 
 
-def split_and_augment(global_parameters, k_fold_step=None, k_fold_dir=None):
+def split_and_augment(global_parameters, k_fold_step=None, k_fold_dir=None, previous_split=None):
     '''
     Split the 'merged.shp' file in two dataset
     Then augment the data
+    If previous_split is given, the points keep their assignment in it
+    and the new ones are split by class, the new split is returned. An
+    empty previous_split is seeded with the stratified split
     '''
     main_dir = global_parameters["user_choices"]["main_dir"]
     merged_shp = op.join(main_dir, 'Intermediate', global_parameters["general"]["merged_layers"])
@@ -49,6 +52,7 @@ def split_and_augment(global_parameters, k_fold_step=None, k_fold_dir=None):
                                       global_parameters["general"]["validation_shp_extended"])
     training_shp_extended = op.join(main_dir, 'Intermediate',
                                     global_parameters["general"]["training_shp_extended"])
+    merged_polygons, training_polygons, validation_polygons = get_polygons_paths(global_parameters)
 
     if k_fold_step != None and k_fold_dir != None:
         # if not done before, create the split
@@ -59,6 +63,13 @@ def split_and_augment(global_parameters, k_fold_step=None, k_fold_dir=None):
         # copy directly the k fold
         load_kfold(training_shp, validation_shp, k_fold_step, k_fold_dir)
 
+    elif previous_split:
+        proportion = float(global_parameters["training_parameters"]["training_proportion"])
+
+        split, train_FID, validation_FID = labels_state.incremental_split(merged_shp, previous_split, proportion)
+        split_samples.write_subset(merged_shp, training_shp, fids=train_FID)
+        split_samples.write_subset(merged_shp, validation_shp, fids=validation_FID)
+
     else:
         # training proportion
         proportion = float(global_parameters["training_parameters"]["training_proportion"])
@@ -66,6 +77,9 @@ def split_and_augment(global_parameters, k_fold_step=None, k_fold_dir=None):
         # split into 2 datasets
         split_samples.split_points_sample(
             in_shp=merged_shp, train_shp=training_shp, validation_shp=validation_shp, proportion=proportion)
+        if previous_split is not None:
+            # first incremental run
+            split = labels_state.points_split(training_shp, validation_shp)
 
     # set the distance of the zone around each point
     max_dist_X = float(global_parameters["training_parameters"]["expansion_distance"])
@@ -76,31 +90,36 @@ def split_and_augment(global_parameters, k_fold_step=None, k_fold_dir=None):
     expand_point_region.create_squares(
         validation_shp, validation_shp_extended, max_dist_X, max_dist_Y)
 
+    # the polygons are split on their own, and added to the squares
+    if k_fold_step != None and k_fold_dir != None:
+        split_samples.split_polygons(merged_polygons, training_polygons, validation_polygons,
+                                     K=global_parameters["training_parameters"]["Kfold"], k_fold_step=int(k_fold_step))
+    else:
+        split_samples.split_polygons(merged_polygons, training_polygons, validation_polygons,
+                                     proportion=float(global_parameters["training_parameters"]["training_proportion"]))
+    expand_point_region.append_polygons(training_polygons, training_shp_extended)
+    # the validation polygons are capped as the training ones, not to outweigh the points in the confusion matrix
+    expand_point_region.append_polygons(validation_polygons, validation_shp_extended,
+                                        raw_img=get_no_data_paths(global_parameters)[2],
+                                        max_pixels=global_parameters["training_parameters"]["max_samples_per_polygon"],
+                                        seed=global_parameters["training_parameters"]["random_seed"])
+
+    if previous_split is not None:
+        return split
+    return None
+
 
 def load_kfold(train_shp, validation_shp, k_fold_step, k_fold_dir):
     '''
-    Copy the K train and validation shp to the default validation shp,
-    in order to obtain the validation
+    Select the train and validation points of the k_fold_step fold
+    in the fold table, and write them to the default train and
+    validation shp, in order to obtain the validation
     '''
-    validation_files = glob.glob(op.join(k_fold_dir, 'validation*_k_*{}*'.format(k_fold_step)))
-    train_files = glob.glob(op.join(k_fold_dir, 'train*_k_*{}*'.format(k_fold_step)))
+    folds_shp = op.join(k_fold_dir, split_samples.FOLDS_SHP)
+    k_fold_step = int(k_fold_step)
 
-    # Problem with the shapefiles is that they are accompagnied with
-    # other files (prj, dbf, shx) that we should copy as well
-    # so we go through all the names and copy them
-    for valid_f in validation_files:
-        # get the extension of the file
-        _, extension = op.splitext(valid_f)
-        dst_basename, _ = op.splitext(validation_shp)
-        dst = dst_basename + extension
-        shutil.copy(valid_f, dst)
-
-    for train_f in train_files:
-        # get the extension of the file
-        _, extension = op.splitext(train_f)
-        dst_basename, _ = op.splitext(train_shp)
-        dst = dst_basename + extension
-        shutil.copy(train_f, dst)
+    split_samples.write_subset(folds_shp, validation_shp, 'fold = {}'.format(k_fold_step))
+    split_samples.write_subset(folds_shp, train_shp, 'fold <> {}'.format(k_fold_step))
 
 
 def rasterize_shp(input_shp, out_tif, reference_tif):
@@ -136,25 +155,76 @@ def rasterize_shp(input_shp, out_tif, reference_tif):
     shapefile = None
 
 
-def masks_preprocess(global_parameters, k_fold_step=None, k_fold_dir=None):
+def get_layers(global_parameters):
     '''
-    Global preprocessing of the masks
+    Paths and classes of the class layers
     '''
     main_dir = global_parameters["user_choices"]["main_dir"]
 
     layers_to_merge = []
     layers_classes = []
 
-    # append the classes names and numbers
+    # append the classes names and numbers
     for mask_name, mask_values in global_parameters["masks"].items():
         layers_to_merge.append(op.join(main_dir, 'In_data', 'Masks', mask_values["shp"]))
         layers_classes.append(mask_values["class_name"])
 
+    return layers_to_merge, layers_classes
+
+
+def get_polygons_paths(global_parameters):
+    '''
+    Paths of the merged, training and validation polygons
+    '''
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    return [op.join(main_dir, 'Intermediate', global_parameters["general"][name])
+            for name in ["merged_polygons", "training_polygons", "validation_polygons"]]
+
+
+def get_split_files(global_parameters):
+    '''
+    Files written by split_and_augment: the training and validation points,
+    their squares and the polygons, with the sidecar files of the shapefiles
+    '''
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    shapefiles = [op.join(main_dir, 'Intermediate', global_parameters["general"][name])
+                  for name in ["training_shp", "validation_shp", "training_shp_extended", "validation_shp_extended"]]
+    shapefiles += get_polygons_paths(global_parameters)[1:]
+    return [op.splitext(shp)[0] + extension for shp in shapefiles for extension in ['.shp', '.shx', '.dbf']]
+
+
+def get_no_data_paths(global_parameters):
+    '''
+    Paths of the no-data shapefile, of its raster and of the reference image
+    '''
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    no_data_shp = op.join(main_dir, 'In_data', 'Masks',
+                          global_parameters["general"]["no_data_mask"])
+    no_data_tif = no_data_shp[0:-4] + '.tif'
+    reference_tif = op.join(main_dir, 'In_data', 'Image',
+                            global_parameters["user_choices"]["raw_img"])
+    return no_data_shp, no_data_tif, reference_tif
+
+
+def masks_preprocess(global_parameters, k_fold_step=None, k_fold_dir=None):
+    '''
+    Global preprocessing of the masks
+    '''
+    if global_parameters["training_parameters"]["incremental_preprocess"] and k_fold_step == None:
+        return incremental_masks_preprocess(global_parameters)
+
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    layers_to_merge, layers_classes = get_layers(global_parameters)
     merged_layers = op.join(main_dir, 'Intermediate', global_parameters["general"]["merged_layers"])
 
     print('  Merge the classes shapefiles into one')
     merge_shapefiles.merge_shapefiles(in_shp_list=layers_to_merge,
-                                      class_list=layers_classes, out_shp=merged_layers)
+                                      class_list=layers_classes, out_shp=merged_layers,
+                                      out_polygons_shp=get_polygons_paths(global_parameters)[0])
+    print('Done')
+
+    print('  Index the labels on the pixels of the image')
+    labels_index.index_labels(global_parameters, merged_layers)
     print('Done')
 
     if k_fold_step != None and k_fold_dir != None:
@@ -165,12 +235,68 @@ def masks_preprocess(global_parameters, k_fold_step=None, k_fold_dir=None):
     print('Done')
 
     print('  Transform the no-data mask to raster')
-    no_data_shp = op.join(main_dir, 'In_data', 'Masks',
-                          global_parameters["general"]["no_data_mask"])
-    no_data_tif = no_data_shp[0:-4] + '.tif'
-    reference_tif = op.join(main_dir, 'In_data', 'Image',
-                            global_parameters["user_choices"]["raw_img"])
+    no_data_shp, no_data_tif, reference_tif = get_no_data_paths(global_parameters)
     rasterize_shp(no_data_shp, no_data_tif, reference_tif)
     print('Done')
 
-    return
\ No newline at end of file
+    return
+
+
+def incremental_masks_preprocess(global_parameters):
+    '''
+    Preprocessing of the masks redoing only the work needed by the
+    changes since the last run: if no class layer changed and the split
+    files were not replaced (e.g. by a K-fold run), the merge, split and
+    squares are kept, otherwise the points already labelled
+    keep their training or validation assignment. The no-data mask is
+    rasterized again only if it changed
+    '''
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    training_parameters = global_parameters["training_parameters"]
+    layers_to_merge, layers_classes = get_layers(global_parameters)
+    merged_layers = op.join(main_dir, 'Intermediate', global_parameters["general"]["merged_layers"])
+    state_file = op.join(main_dir, 'Intermediate', global_parameters["general"]["labels_state"])
+    extended_shps = [op.join(main_dir, 'Intermediate', global_parameters["general"][name])
+                     for name in ["training_shp_extended", "validation_shp_extended"]]
+
+    state = labels_state.load_labels_state(state_file)
+    parameters = {name: training_parameters[name] for name in
+                  ["expansion_distance", "training_proportion", "collapse_duplicate_labels"]}
+    current_layers = {'{}:{}'.format(op.basename(layer), class_name): labels_state.layer_hashes(layer)
+                      for layer, class_name in zip(layers_to_merge, layers_classes)}
+    changed = labels_state.changed_layers(state["layers"], current_layers)
+    # the split files are rewritten by a K-fold run
+    split_changed = labels_state.files_hash(get_split_files(global_parameters)) != state.get("split_files")
+
+    if changed or split_changed or parameters != state["parameters"] or \
+            not all(op.exists(shp) for shp in extended_shps):
+        print('  Layers changed since the last run: {}'.format(', '.join(changed)))
+        merge_shapefiles.merge_shapefiles(in_shp_list=layers_to_merge,
+                                          class_list=layers_classes, out_shp=merged_layers,
+                                          out_polygons_shp=get_polygons_paths(global_parameters)[0])
+        labels_index.index_labels(global_parameters, merged_layers)
+
+        # a new proportion invalidates the previous split
+        previous_split = state["split"]
+        if state["parameters"] is None or \
+                state["parameters"]["training_proportion"] != parameters["training_proportion"]:
+            previous_split = {}
+        state["split"] = split_and_augment(global_parameters, previous_split=previous_split)
+        print('Done')
+    else:
+        print('  No class layer changed, the split and the squares are kept')
+    state["layers"] = current_layers
+    state["parameters"] = parameters
+    state["split_files"] = labels_state.files_hash(get_split_files(global_parameters))
+
+    no_data_shp, no_data_tif, reference_tif = get_no_data_paths(global_parameters)
+    no_data = labels_state.no_data_hash(no_data_shp, reference_tif)
+    if no_data != state["no_data"] or not op.exists(no_data_tif):
+        print('  Transform the no-data mask to raster')
+        rasterize_shp(no_data_shp, no_data_tif, reference_tif)
+        print('Done')
+    else:
+        print('  No-data mask unchanged, its raster is kept')
+    state["no_data"] = no_data
+
+    labels_state.save_labels_state(state_file, state)
@@ -29,12 +29,40 @@ import os.path as op
 from osgeo import ogr
 
 
-def merge_shapefiles(in_shp_list, class_list, out_shp):
+def is_polygon(geometry):
+    '''
+    Whether a geometry is a polygon or a multipolygon
+    '''
+    return ogr.GT_Flatten(geometry.GetGeometryType()) in [ogr.wkbPolygon, ogr.wkbMultiPolygon]
+
+
+def create_class_layer(out_shp, srs, geom_type):
+    '''
+    Create a shapefile with a class field, replacing the existing one
+    '''
+    outDriver = ogr.GetDriverByName("ESRI Shapefile")
+    # Remove output shapefile if it already exists
+    if os.path.exists(out_shp):
+        outDriver.DeleteDataSource(out_shp)
+
+    # Create the output shapefile
+    outDataSource = outDriver.CreateDataSource(out_shp)
+    outLayer = outDataSource.CreateLayer("buff_layer", srs, geom_type=geom_type)
+
+    # Add a class field
+    classField = ogr.FieldDefn("class", ogr.OFTInteger)
+    outLayer.CreateField(classField)
+    return outDataSource, outLayer
+
+
+def merge_shapefiles(in_shp_list, class_list, out_shp, out_polygons_shp=None):
     ''' 
     Create a merged shapefile
     The class_list should be in the same order than the in_shp_list 
+    The points are merged in out_shp and the polygons in out_polygons_shp,
+    the polygons are skipped if it is not given
     '''
-
+    skipped_polygons = 0
     for k in range(len(in_shp_list)):
         print(in_shp_list)
         in_shp = in_shp_list[k]
@@ -47,31 +75,35 @@ def merge_shapefiles(in_shp_list, class_list, out_shp):
         srs = inLayer.GetSpatialRef()
 
         if k == 0:
-            # Save extent to a new Shapefile
-            outDriver = ogr.GetDriverByName("ESRI Shapefile")
-            # Remove output shapefile if it already exists
-            if os.path.exists(out_shp):
-                outDriver.DeleteDataSource(out_shp)
-
-            # Create the output shapefile
-            outDataSource = outDriver.CreateDataSource(out_shp)
-            outLayer = outDataSource.CreateLayer("buff_layer", srs, geom_type=ogr.wkbPoint)
-
-            # Add a class field
-            classField = ogr.FieldDefn("class", ogr.OFTInteger)
-            outLayer.CreateField(classField)
+            outDataSource, outLayer = create_class_layer(out_shp, srs, ogr.wkbPoint)
+            if out_polygons_shp is not None:
+                polygonsDataSource, polygonsLayer = create_class_layer(out_polygons_shp, srs, ogr.wkbPolygon)
 
         # Create the feature and set values
         for point in inLayer:
             ingeom = point.GetGeometryRef()
-
-            featureDefn = outLayer.GetLayerDefn()
+            if ingeom is None:
+                continue
+
+            if not is_polygon(ingeom):
+                currentLayer = outLayer
+            elif out_polygons_shp is not None:
+                currentLayer = polygonsLayer
+            else:
+                skipped_polygons += 1
+                continue
+
+            featureDefn = currentLayer.GetLayerDefn()
             feature = ogr.Feature(featureDefn)
             feature.SetGeometry(ingeom)
             feature.SetField("class", current_class)
-            outLayer.CreateFeature(feature)
+            currentLayer.CreateFeature(feature)
 
         # Close DataSource
         inDataSource.Destroy()
     outDataSource.Destroy()
-    return
\ No newline at end of file
+    if out_polygons_shp is not None:
+        polygonsDataSource.Destroy()
+    if skipped_polygons > 0:
+        print('{} polygons skipped, only the points are merged'.format(skipped_polygons))
+    return
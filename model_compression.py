@@ -0,0 +1,258 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (model_compression.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Compression of the scikit forests (rf_scikit, xtree_scikit) for a faster
+classification of the image.
+
+Three smaller models are derived from the trained forest:
+ - pruned: the subset of trees selected greedily, each added tree being the
+   one improving the most the accuracy of the subset;
+ - depth: the same forest trained again with a maximum depth;
+ - distilled: a small forest with a maximum depth trained on the labels
+   given by the forest to the training samples.
+The validation samples are read from the stack with the raster sampling
+engine and split in two halves: the trees are selected on the first one, and
+the accuracy of every model is measured on the second one, along with its
+prediction time. The accuracy loss and the speedup of each model are written
+in a JSON report of the Statistics directory, and the chosen model is saved
+next to the forest (<model>_compressed) and used for the classification.
+"""
+import copy
+import json
+import os
+import os.path as op
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import rasterio
+from sklearn.base import clone
+
+import model_store
+import OTB_workflow
+import sample_extraction
+import sample_store
+
+COMPRESSED_METHODS = ["rf_scikit", "xtree_scikit"]
+CANDIDATES = ["pruned", "depth", "distilled"]
+
+
+def get_compressed_path(model_out: str) -> str:
+    """
+    Path of the compressed model.
+    """
+    return model_out + '_compressed'
+
+
+def get_classification_model(global_parameters, model_out: str) -> str:
+    """
+    Path of the model to classify the image with: the compressed one if it
+    was chosen and is up to date, the trained one otherwise.
+    """
+    compressed = get_compressed_path(model_out)
+    if global_parameters["compression"]["apply"] != "none" and op.exists(compressed) \
+            and op.getmtime(compressed) >= op.getmtime(model_out):
+        return compressed
+    return model_out
+
+
+def read_validation_samples(global_parameters) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Read the features and the class of the validation pixels: the pixels of
+    the squares around the validation points and of the validation polygons.
+    """
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    raw_img = op.join(main_dir, 'In_data', 'Image', global_parameters["user_choices"]["raw_img"])
+    validation_shp = op.join(main_dir, 'Intermediate', global_parameters["general"]["validation_shp"])
+    validation_polygons = op.join(main_dir, 'Intermediate', global_parameters["general"]["validation_polygons"])
+    no_data_shp = op.join(main_dir, 'In_data', 'Masks', global_parameters["general"]["no_data_mask"])
+    cache_file = op.join(main_dir, 'Intermediate', global_parameters["general"]["feature_cache"])
+    training_parameters = global_parameters["training_parameters"]
+
+    with rasterio.open(raw_img) as src:
+        bands_qty, dtype = src.count, src.dtypes[0]
+
+    # the feature cache is read, not updated
+    cache = sample_extraction.load_feature_cache(cache_file, sample_extraction.get_stack_id(raw_img))
+    pixels, classes = sample_extraction.read_labelled_pixels(
+        raw_img, validation_shp, validation_polygons, no_data_shp[0:-4] + '.tif',
+        float(training_parameters["expansion_distance"]), cache,
+        training_parameters["max_samples_per_polygon"], training_parameters["random_seed"])
+    originfids, _, _, features = sample_extraction.candidates_table(pixels, bands_qty, dtype)
+    return features.astype(np.float32), classes[originfids]
+
+
+def trees_probabilities(forest, features: np.ndarray) -> np.ndarray:
+    """
+    (trees, samples, classes) probabilities of each tree of a forest.
+    """
+    return np.stack([tree.predict_proba(features) for tree in forest.estimators_])
+
+
+def select_trees(probabilities: np.ndarray, labels_index: np.ndarray, trees_nb: int) -> List[int]:
+    '''
+    Greedy selection of trees: the added tree is the one giving the best
+    accuracy to the mean probabilities of the selected trees
+
+    Parameters
+    ----------
+    probabilities : np.ndarray
+        (trees, samples, classes) probabilities returned by trees_probabilities.
+    labels_index : np.ndarray
+        Index of the class of each sample in the classes of the forest.
+    trees_nb : int
+        Number of trees to select.
+
+    Returns
+    -------
+    List[int]
+        The indexes of the selected trees, in the order of their selection.
+    '''
+    selected = []
+    total = np.zeros(probabilities.shape[1:])
+    remaining = list(range(probabilities.shape[0]))
+    for _ in range(min(trees_nb, len(remaining))):
+        candidates = total[np.newaxis] + probabilities[remaining]
+        accuracies = (candidates.argmax(axis=2) == labels_index[np.newaxis]).mean(axis=1)
+        best = remaining[int(np.argmax(accuracies))]
+        selected.append(best)
+        remaining.remove(best)
+        total += probabilities[best]
+    return selected
+
+
+def prune_forest(forest, features: np.ndarray, labels: np.ndarray, trees_nb: int):
+    """
+    Copy of a forest keeping the trees selected on the given samples.
+    """
+    labels_index = np.searchsorted(forest.classes_, labels)
+    selected = select_trees(trees_probabilities(forest, features), labels_index, trees_nb)
+    pruned = copy.copy(forest)
+    pruned.estimators_ = [forest.estimators_[k] for k in sorted(selected)]
+    pruned.n_estimators = len(pruned.estimators_)
+    return pruned
+
+
+def describe_model(forest, features: np.ndarray, labels: np.ndarray, repeats: int) -> Dict[str, float]:
+    """
+    Size, accuracy and prediction time of a forest on the given samples,
+    the time being the best of a few repetitions.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predictions = forest.predict(features)
+        times.append(time.perf_counter() - start)
+    return {"trees": len(forest.estimators_),
+            "nodes": int(sum(tree.tree_.node_count for tree in forest.estimators_)),
+            "max_depth": int(max(tree.tree_.max_depth for tree in forest.estimators_)),
+            "accuracy": float((predictions == labels).mean()) if len(labels) else 0.,
+            "prediction_time_s": min(times)}
+
+
+def choose_model(report: Dict[str, Dict[str, float]], apply: str, max_accuracy_loss: float) -> str:
+    """
+    Name of the model to classify with: the asked one, or with "auto" the
+    fastest one losing at most max_accuracy_loss of accuracy.
+    """
+    if apply != "auto":
+        return apply
+    acceptable = [name for name in CANDIDATES if report[name]["accuracy_delta"] >= -max_accuracy_loss]
+    if not acceptable:
+        return "none"
+    best = max(acceptable, key=lambda name: report[name]["speedup"])
+    return best if report[best]["speedup"] > 1. else "none"
+
+
+def compress_forest(forest, x_train: np.ndarray, y_train: np.ndarray, x_validation: np.ndarray,
+                    y_validation: np.ndarray, compression: dict, seed=None):
+    '''
+    Derive the compressed models of a forest and compare them with it
+
+    Returns
+    -------
+    Tuple[dict, Dict[str, Dict[str, float]]]
+        The compressed models by name, and the description of the forest
+        ("none") and of each compressed model, with its accuracy delta and
+        speedup.
+    '''
+    # the trees are selected on one half, all the models evaluated on the other
+    halves = np.random.default_rng(seed).permutation(len(y_validation)) % 2 == 0
+    x_selection, y_selection = x_validation[halves], y_validation[halves]
+    x_evaluation, y_evaluation = x_validation[~halves], y_validation[~halves]
+
+    depth = clone(forest).set_params(max_depth=compression["max_depth"], warm_start=False)
+    distilled = clone(forest).set_params(n_estimators=compression["distilled_trees"],
+                                         max_depth=compression["max_depth"], warm_start=False)
+    models = {"pruned": prune_forest(forest, x_selection, y_selection, compression["trees"]),
+              "depth": depth.fit(x_train, y_train),
+              "distilled": distilled.fit(x_train, forest.predict(x_train))}
+
+    report = {"none": describe_model(forest, x_evaluation, y_evaluation, compression["repeats"])}
+    for name, model in models.items():
+        report[name] = describe_model(model, x_evaluation, y_evaluation, compression["repeats"])
+        report[name]["accuracy_delta"] = report[name]["accuracy"] - report["none"]["accuracy"]
+        report[name]["speedup"] = report["none"]["prediction_time_s"] / max(report[name]["prediction_time_s"], 1e-6)
+    return models, report
+
+
+def compress_model(global_parameters, model_out: str):
+    '''
+    Compress the trained forest, report the accuracy and speed of the
+    compressed models, and save the chosen one
+    '''
+    method = OTB_workflow.get_method(global_parameters)
+    compression = global_parameters["compression"]
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    if method not in COMPRESSED_METHODS or global_parameters["classification"]["online"]:
+        print('  No compression of the {} model, only the scikit forests are compressed'.format(method))
+        return
+
+    print('  Compression of the model')
+    forest = model_store.load_model(model_out, mmap=False, cache=False)
+    x_train, y_train, columns = sample_store.load_sample_store(sample_store.get_store_path(global_parameters))
+    # the model trained again on the selected features only sees their columns
+    metadata = model_store.load_training_metadata(model_out)
+    if metadata is not None and metadata.get("features") is not None and metadata["features"] != list(columns):
+        x_train = x_train[:, [list(columns).index(name) for name in metadata["features"]]]
+    x_validation, y_validation = read_validation_samples(global_parameters)
+
+    models, report = compress_forest(forest, x_train, y_train, x_validation, y_validation, compression,
+                                     global_parameters["training_parameters"]["random_seed"])
+    chosen = choose_model(report, compression["apply"], compression["max_accuracy_loss"])
+    for name in CANDIDATES:
+        print('{:10} {:5} trees, accuracy {:+.4f}, speedup x{:.2f}'.format(
+            name, report[name]["trees"], report[name]["accuracy_delta"], report[name]["speedup"]))
+
+    compressed = get_compressed_path(model_out)
+    if chosen != "none":
+        model_store.save_model(models[chosen], compressed, {"method": method, "compression": chosen})
+    elif op.exists(compressed):
+        # an older compressed model must not be used
+        os.remove(compressed)
+
+    with open(op.join(main_dir, 'Statistics', compression["report"]), 'w') as json_file:
+        json.dump({"method": method, "validation_samples": int(len(y_validation)),
+                   "models": report, "chosen": chosen}, json_file, indent=3)
+    print('Done')
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (model_store.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Storage of the scikit models.
+
+The models are written with joblib, uncompressed, so that their numpy arrays
+are written as they are and memory-mapped when loaded. The metadata of the
+training (method, parameters, samples, features, duration) are written in a
+JSON file next to the model (<model>_training.json).
+
+The loaded models are kept in a cache of the process, keyed by the path,
+the modification time and the size of the model, so that a model is read
+only once until it is trained again.
+"""
+import json
+import os
+import os.path as op
+import time
+from datetime import datetime
+from typing import Optional
+
+import joblib
+import sklearn
+
+_cache = {}
+
+
+def get_training_metadata_path(model_out: str) -> str:
+    """
+    Path of the training metadata of a model.
+    """
+    return model_out + '_training.json'
+
+
+def save_model(classifier, model_out: str, metadata: Optional[dict] = None):
+    """
+    Write a model, and the metadata of its training if given.
+    """
+    joblib.dump(classifier, model_out)
+    if metadata is not None:
+        metadata = dict(metadata, date=datetime.now().isoformat(timespec='seconds'),
+                        sklearn_version=sklearn.__version__)
+        with open(get_training_metadata_path(model_out), 'w') as json_file:
+            json.dump(metadata, json_file, indent=3)
+
+
+def load_training_metadata(model_out: str) -> Optional[dict]:
+    """
+    Load the training metadata of a model, None if there is none.
+    """
+    metadata_file = get_training_metadata_path(model_out)
+    if not op.exists(metadata_file):
+        return None
+    with open(metadata_file, 'r') as json_file:
+        return json.load(json_file)
+
+
+def load_model(model_out: str, mmap: bool = True, cache: bool = True):
+    """
+    Load a model, from the cache if it was already loaded since it was last
+    written.
+
+    Parameters
+    ----------
+    model_out : str
+        Path of the model, written by save_model or pickled.
+    mmap : bool
+        Memory-map the numpy arrays of the model, read-only.
+    cache : bool
+        Use and fill the cache. A model to be modified, e.g. updated with
+        warm_start, must not be shared and is loaded without it.
+    """
+    stat = os.stat(model_out)
+    key = (op.abspath(model_out), stat.st_mtime_ns, stat.st_size, mmap)
+    if cache and key in _cache:
+        return _cache[key]
+
+    start = time.time()
+    classifier = joblib.load(model_out, mmap_mode='r' if mmap else None)
+    print('  Model {} loaded in {:.2f} s'.format(op.basename(model_out), time.time() - start))
+
+    if cache:
+        # only the last version of a model is kept
+        for cached_key in [cached_key for cached_key in _cache if cached_key[0] == key[0]]:
+            del _cache[cached_key]
+        _cache[key] = classifier
+    return classifier
+
+
+def clear_cache():
+    """
+    Empty the cache of the loaded models.
+    """
+    _cache.clear()
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (otb_factory.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Creation of all the OTB applications of ALCD.
+
+The applications are created with the RAM budget of the configuration, their
+GeoTIFF outputs get the extended filename options (compression, tiling) and
+each execution is recorded, with its wall time, the number of pixels of its
+output and the peak memory, in a JSON run report in the Statistics
+directory. The applications connected in memory are executed by the one
+writing the output, whose time includes theirs. The shell applications are
+recorded too when run by run_shell.
+
+The peak memory is the one of the whole process (process_peak_rss_mb), and
+of its largest child for the shell applications. An application which
+raised it has its increase in peak_rss_increase_mb, the memory it used
+under the previous peak being not measured.
+"""
+import json
+import os
+import os.path as op
+import resource
+import subprocess
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+import otbApplication
+
+_settings = {"ram": None, "extended_filename": "", "report": None}
+_records = []
+
+
+def configure(global_parameters):
+    '''
+    Set the RAM budget, the number of threads and the extended filename
+    options of the OTB applications from the "otb" section of the
+    configuration, and the path of the run report, which starts empty
+    '''
+    otb_parameters = global_parameters["otb"]
+    _records.clear()
+    main_dir = global_parameters["user_choices"]["main_dir"]
+
+    _settings["ram"] = otb_parameters["ram"]
+    if otb_parameters["ram"] is not None:
+        # default of the shell applications too
+        os.environ["OTB_MAX_RAM_HINT"] = str(otb_parameters["ram"])
+    if otb_parameters["threads"] is not None:
+        # read by ITK when the first filter of the process is created
+        os.environ["ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS"] = str(otb_parameters["threads"])
+
+    options = []
+    if otb_parameters["compression"] is not None:
+        options.append('gdal:co:COMPRESS={}'.format(otb_parameters["compression"]))
+    if otb_parameters["tiled"]:
+        options.append('gdal:co:TILED=YES')
+    _settings["extended_filename"] = '&'.join(options)
+
+    _settings["report"] = op.join(main_dir, 'Statistics', otb_parameters["report"])
+
+
+def add_extended_filename(out_file: str) -> str:
+    '''
+    Add the configured extended filename options to a GeoTIFF output,
+    unless it already has some
+    '''
+    if not _settings["extended_filename"] or '?' in out_file or \
+            op.splitext(out_file)[1].lower() not in ['.tif', '.tiff']:
+        return out_file
+    return '{}?&{}'.format(out_file, _settings["extended_filename"])
+
+
+def write_report():
+    '''
+    Write the records of the applications executed by the process
+    '''
+    if _settings["report"] is None:
+        return
+    report_dir = op.dirname(_settings["report"])
+    if not op.exists(report_dir):
+        os.makedirs(report_dir)
+    with open(_settings["report"], 'w') as json_file:
+        json.dump({"ram": _settings["ram"], "threads": os.environ.get("ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS"),
+                   "applications": _records}, json_file, indent=3)
+
+
+def get_peak_rss_mb(who: int) -> float:
+    '''
+    Peak memory of the process (RUSAGE_SELF) or of its largest child
+    (RUSAGE_CHILDREN), in MB
+    '''
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(who).ru_maxrss / 1024.
+
+
+def record_execution(name: str, execute: Callable, written: bool, pixels_nb: Optional[Callable] = None,
+                     shell: bool = False):
+    '''
+    Execute an application and add its record to the run report
+    '''
+    who = resource.RUSAGE_CHILDREN if shell else resource.RUSAGE_SELF
+    start, previous_peak = time.time(), get_peak_rss_mb(who)
+    result = execute()
+    wall_time = time.time() - start
+    peak = get_peak_rss_mb(who)
+    _records.append({"application": name,
+                     "date": datetime.now().isoformat(timespec='seconds'),
+                     "written": written,
+                     "shell": shell,
+                     "wall_time_s": round(wall_time, 3),
+                     "pixels": pixels_nb() if pixels_nb is not None else None,
+                     "process_peak_rss_mb": round(peak, 1),
+                     "peak_rss_increase_mb": round(peak - previous_peak, 1)})
+    write_report()
+    return result
+
+
+def run_shell(name: str, command: str) -> int:
+    '''
+    Run an OTB application through the shell, and record its execution
+    '''
+    return record_execution(name, lambda: subprocess.call(command, shell=True), written=True, shell=True)
+
+
+class Application():
+    '''
+    OTB application recording its executions
+    The other methods are the ones of the wrapped otbApplication
+    '''
+
+    def __init__(self, name: str, app):
+        self._name = name
+        self._app = app
+
+    def __getattr__(self, attribute):
+        return getattr(self._app, attribute)
+
+    def SetParameterString(self, key, value):
+        if self._app.GetParameterType(key) == otbApplication.ParameterType_OutputImage:
+            value = add_extended_filename(value)
+        return self._app.SetParameterString(key, value)
+
+    def Execute(self):
+        return self._record(self._app.Execute, written=False)
+
+    def ExecuteAndWriteOutput(self):
+        return self._record(self._app.ExecuteAndWriteOutput, written=True)
+
+    def get_pixels_nb(self) -> Optional[int]:
+        '''
+        Number of pixels of the first output image, or of the first input
+        image when the application has no output image
+        '''
+        keys = self._app.GetParametersKeys()
+        for parameter_type in [otbApplication.ParameterType_OutputImage, otbApplication.ParameterType_InputImage]:
+            for key in keys:
+                if self._app.GetParameterType(key) == parameter_type and self._app.HasValue(key):
+                    try:
+                        size = self._app.GetImageSize(key)
+                        return int(size[0]) * int(size[1])
+                    except (AttributeError, RuntimeError):
+                        return None
+        return None
+
+    def _record(self, execute, written):
+        return record_execution(self._name, execute, written, self.get_pixels_nb)
+
+
+def create_application(name: str) -> Application:
+    '''
+    Create an OTB application, with the configured RAM budget
+    '''
+    app = otbApplication.Registry.CreateApplication(name)
+    if app is None:
+        raise RuntimeError('The OTB application {} is not available'.format(name))
+    if _settings["ram"] is not None and "ram" in app.GetParametersKeys():
+        app.SetParameterInt("ram", int(_settings["ram"]))
+    return Application(name, app)
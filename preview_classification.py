@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (preview_classification.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Fast preview of the classification, on a decimated grid.
+
+The stack and the no-data mask are decimated by preview_factor (every
+preview_factor-th pixel in each direction, read from the overviews of the
+stack when it has some), and the decimated stack is classified with the
+trained model. The preview labels and confidence are written in
+Out/preview_labeled.tif and Out/preview_confidence.tif before the full
+resolution classification, in about 1/preview_factor² of its time. The
+decimated inputs are kept in Intermediate, and written again when the stack
+or the mask is newer than them.
+"""
+import os
+import os.path as op
+import time
+from typing import Tuple
+
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from rasterio.windows import Window
+
+import model_compression
+import OTB_workflow
+
+PREVIEW_ROWS = 256
+
+
+def decimate(src_tif: str, dst_tif: str, factor: int):
+    '''
+    Write an image decimated by an integer factor, by blocks of rows
+
+    Parameters
+    ----------
+    src_tif : str
+        Image decimated, its last rows and columns being dropped when its
+        size is not a multiple of the factor.
+    dst_tif : str
+        Decimated image, of pixels factor times larger.
+    factor : int
+        Decimation factor.
+    '''
+    with rasterio.open(src_tif) as src:
+        width, height = max(1, src.width // factor), max(1, src.height // factor)
+        profile = src.profile
+        profile.update(driver="GTiff", width=width, height=height,
+                       transform=src.transform * Affine.scale(min(factor, src.width), min(factor, src.height)))
+        for option in ["blockxsize", "blockysize", "tiled", "compress", "photometric"]:
+            profile.pop(option, None)
+        with rasterio.open(dst_tif, 'w', **profile) as dst:
+            for row in range(0, height, PREVIEW_ROWS):
+                rows = min(PREVIEW_ROWS, height - row)
+                window = Window(0, row * factor, min(width * factor, src.width),
+                                min(rows * factor, src.height - row * factor))
+                dst.write(src.read(window=window, out_shape=(src.count, rows, width), resampling=Resampling.nearest),
+                          window=Window(0, row, width, rows))
+
+
+def prepare_inputs(raw_img: str, mask_tif: str, factor: int, out_dir: str) -> Tuple[str, str]:
+    """
+    Decimated stack and mask of the preview, written again only when they
+    are older than the full resolution ones.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    decimated = []
+    for path in [raw_img, mask_tif]:
+        out_tif = op.join(out_dir, '{}_preview{}.tif'.format(op.splitext(op.basename(path))[0], factor))
+        if not op.exists(out_tif) or op.getmtime(out_tif) < op.getmtime(path):
+            decimate(path, out_tif, factor)
+        decimated.append(out_tif)
+    return decimated[0], decimated[1]
+
+
+def preview_classification(global_parameters, additional_name='') -> str:
+    '''
+    Classify the decimated stack with the trained model, and write the
+    preview labels and confidence
+
+    Returns
+    -------
+    str
+        The preview labels.
+    '''
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    classification = global_parameters["classification"]
+    factor = classification["preview_factor"]
+    method = OTB_workflow.get_method(global_parameters)
+    model = op.join(main_dir, 'Models', ('model.' + method))
+    if "scikit" in method:
+        model = model_compression.get_classification_model(global_parameters, model)
+
+    start = time.time()
+    raw_img = op.join(main_dir, 'In_data', 'Image', global_parameters["user_choices"]["raw_img"])
+    mask_tif = op.join(main_dir, 'In_data', 'Masks', global_parameters["general"]["no_data_mask"])[0:-4] + '.tif'
+    preview_img, preview_mask = prepare_inputs(raw_img, mask_tif, factor, op.join(main_dir, 'Intermediate'))
+
+    img_labeled = op.join(main_dir, 'Out', "preview_labeled{}.tif".format(additional_name))
+    kwargs = {"raw_img": preview_img, "model": model, "img_labeled": img_labeled,
+              "confidence_map": op.join(main_dir, 'Out', "preview_confidence{}.tif".format(additional_name)),
+              "mask_tif": preview_mask, "shell": False}
+    print("  Preview of the classification, decimated by {}".format(factor))
+    if "otb" in method:
+        OTB_workflow.otb_class(**kwargs)
+    else:
+        OTB_workflow.scikit_class(ram=classification["inference_ram"], **kwargs)
+    print('  Preview written in {:.1f} s: {}'.format(time.time() - start, img_labeled))
+    return img_labeled
@@ -0,0 +1,205 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (sample_budget.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Adaptive number of training samples per class ("adaptive_<nb>" sampling).
+
+The samples are first extracted with at most <nb> samples per class. The
+model is then trained on increasing fractions of them (budget_fractions of
+the largest class), and its accuracy measured on the validation pixels: the
+smallest number of samples per class whose accuracy is within
+budget_tolerance of the accuracy with all the samples is kept in
+Statistics/sample_budget.json. The following iterations extract and train on
+this number of samples per class (constant_<budget>), until the stack, the
+method or <nb> changes, a class is added, or the number of candidate pixels
+doubles.
+"""
+import json
+import os.path as op
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import sklearn.ensemble as sk
+from sklearn.base import clone
+
+import model_compression
+import OTB_workflow
+import sample_extraction
+import sample_store
+
+CANDIDATES_GROWTH = 2.
+
+
+def get_budget_path(global_parameters) -> str:
+    """
+    Path of the adaptive budget of the scene.
+    """
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    return op.join(main_dir, 'Statistics', global_parameters["general"]["sample_budget"])
+
+
+def get_candidates(global_parameters) -> Dict[int, int]:
+    """
+    Number of candidate pixels of each class, from the class statistics of
+    the last samples extraction.
+    """
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    class_stats = op.join(main_dir, 'Statistics', global_parameters["general"]["class_stats"])
+    return OTB_workflow.get_samples_per_class(class_stats)
+
+
+def load_budget(global_parameters, stack_id: str, candidates: Optional[Dict[int, int]] = None) -> Optional[int]:
+    '''
+    Number of samples per class cached for the scene, None if there is none
+    or if it is out of date
+
+    Parameters
+    ----------
+    global_parameters : dict
+        Configuration, with an "adaptive_<nb>" training_sampling.
+    stack_id : str
+        Identifier of the stack the samples are extracted from.
+    candidates : Optional[Dict[int, int]]
+        Number of candidate pixels of each class, not checked if None.
+    '''
+    budget_file = get_budget_path(global_parameters)
+    if not op.exists(budget_file):
+        return None
+    with open(budget_file, 'r') as json_file:
+        cached = json.load(json_file)
+    if cached["stack_id"] != stack_id or cached["method"] != OTB_workflow.get_method(global_parameters) \
+            or cached["strategy"] != global_parameters["general"]["training_sampling"]:
+        return None
+    if candidates is not None:
+        cached_candidates = {int(c): n for c, n in cached["candidates"].items()}
+        if set(candidates) - set(cached_candidates) \
+                or sum(candidates.values()) > CANDIDATES_GROWTH * sum(cached_candidates.values()):
+            return None
+    return cached["budget"]
+
+
+def get_strategy(global_parameters, stack_id: str) -> Tuple[str, bool]:
+    """
+    Sampling strategy of the samples extraction, and whether the adaptive
+    budget has to be computed on the extracted samples: constant_<budget>
+    with the cached budget of an "adaptive_<nb>" sampling, constant_<nb> if
+    it has to be computed again, the configured strategy otherwise.
+    """
+    strategy = global_parameters["general"]["training_sampling"]
+    name, _, value = strategy.partition('_')
+    if name != "adaptive":
+        return strategy, False
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    candidates = None
+    if op.exists(op.join(main_dir, 'Statistics', global_parameters["general"]["class_stats"])):
+        candidates = get_candidates(global_parameters)
+    budget = load_budget(global_parameters, stack_id, candidates)
+    if budget is None:
+        print('  Adaptive sampling: learning curve with at most {} samples per class'.format(value))
+        return 'constant_{}'.format(value), True
+    print('  Adaptive sampling: {} samples per class'.format(budget))
+    return 'constant_{}'.format(budget), False
+
+
+def learning_curve(classifier, x_train: np.ndarray, y_train: np.ndarray, x_validation: np.ndarray,
+                   y_validation: np.ndarray, fractions: List[float], seed=None) -> List[dict]:
+    '''
+    Validation accuracy of a classifier trained on increasing numbers of
+    samples per class
+
+    Parameters
+    ----------
+    classifier
+        Untrained scikit classifier, cloned for each number of samples.
+    x_train, y_train : np.ndarray
+        All the training samples.
+    x_validation, y_validation : np.ndarray
+        Validation samples.
+    fractions : List[float]
+        Fractions of the number of samples of the largest class, the
+        classes being capped at each number.
+    seed
+        Random seed of the drawing of the samples.
+
+    Returns
+    -------
+    List[dict]
+        For each number of samples per class, in increasing order, the
+        number of samples trained on, the accuracy and the training time.
+    '''
+    classes, counts = np.unique(y_train, return_counts=True)
+    budgets = sorted({max(1, int(round(fraction * counts.max()))) for fraction in list(fractions) + [1.]})
+    curve = []
+    for budget in budgets:
+        samples_nb = {int(c): int(min(n, budget)) for c, n in zip(classes, counts)}
+        drawn = sample_extraction.draw_samples(y_train, samples_nb, seed)
+        start = time.time()
+        model = clone(classifier).fit(x_train[drawn], y_train[drawn])
+        curve.append({"budget": budget, "samples_nb": int(len(drawn)), "training_time_s": round(time.time() - start, 3),
+                      "accuracy": float((model.predict(x_validation) == y_validation).mean())})
+    return curve
+
+
+def choose_budget(curve: List[dict], tolerance: float) -> int:
+    """
+    Smallest number of samples per class whose accuracy is within tolerance
+    of the accuracy with all the samples, the last point of the curve.
+    """
+    plateau = curve[-1]["accuracy"] - tolerance
+    return next(point["budget"] for point in curve if point["accuracy"] >= plateau)
+
+
+def compute_budget(global_parameters, model_parameters, stack_id: str) -> Optional[int]:
+    '''
+    Compute the learning curve on the extracted samples, and cache the
+    number of samples per class chosen for the scene
+    '''
+    training_parameters = global_parameters["training_parameters"]
+    method = OTB_workflow.get_method(global_parameters)
+    seed = training_parameters["random_seed"]
+
+    x_validation, y_validation = model_compression.read_validation_samples(global_parameters)
+    if not len(y_validation):
+        print('  No validation samples, no adaptive sampling budget')
+        return None
+    if "scikit" in method:
+        classifier = OTB_workflow.get_scikit_classifier(method, model_parameters)
+    else:
+        # the OTB models are trained from the samples table only, a scikit forest stands for them
+        print('  Learning curve of a scikit random forest as a surrogate of the {} model'.format(method))
+        classifier = sk.RandomForestClassifier(random_state=seed)
+    x_train, y_train, _ = sample_store.load_sample_store(sample_store.get_store_path(global_parameters))
+    curve = learning_curve(classifier, x_train, y_train, x_validation, y_validation,
+                           training_parameters["budget_fractions"], seed)
+    budget = choose_budget(curve, training_parameters["budget_tolerance"])
+    for point in curve:
+        print('{:8} samples per class: accuracy {:.4f}, training {:.2f} s'.format(
+            point["budget"], point["accuracy"], point["training_time_s"]))
+    print('  Adaptive sampling: {} samples per class kept for the next iterations'.format(budget))
+
+    with open(get_budget_path(global_parameters), 'w') as json_file:
+        json.dump({"strategy": global_parameters["general"]["training_sampling"], "method": method,
+                   "stack_id": stack_id, "candidates": get_candidates(global_parameters),
+                   "budget": budget, "curve": curve}, json_file, indent=3)
+    return budget
@@ -0,0 +1,633 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (sample_extraction.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Raster-native alternative to the OTB sampling chain
+(PolygonClassStatistics, SampleSelection and SampleExtraction).
+
+The labels are points expanded into squares of fixed size, so the samples
+are the pixels whose centre falls inside a small window around each point,
+and polygons, rasterized within their bounding window with a cap on the
+number of samples per polygon. Only those windows are read from the stack, the selection strategy is
+applied in numpy and the sample table is written in a single pass, with
+the same schema as the one produced by SampleExtraction.
+"""
+import os
+import os.path as op
+import json
+import hashlib
+import sqlite3
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import rasterio
+import rasterio.errors
+import rasterio.features
+from rasterio.windows import Window
+from osgeo import ogr, osr
+
+import sample_store
+
+
+def read_points(in_shp: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Read the coordinates and class of every labelled point of a shapefile.
+
+    Points without class are skipped, as in expand_point_region.create_squares,
+    so that the position of a point in the returned arrays is the FID of its
+    square in the extended shapefile.
+
+    Parameters
+    ----------
+    in_shp : str
+        Path to the point shapefile, with a "class" field.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        X coordinates, Y coordinates and classes of the points.
+    """
+    inDriver = ogr.GetDriverByName("ESRI Shapefile")
+    inDataSource = inDriver.Open(in_shp, 0)
+    inLayer = inDataSource.GetLayer()
+
+    xs, ys, classes = [], [], []
+    for point in inLayer:
+        current_class = point.GetField("class")
+        if current_class != None:
+            ingeom = point.GetGeometryRef()
+            xs.append(ingeom.GetX(0))
+            ys.append(ingeom.GetY(0))
+            classes.append(int(current_class))
+
+    inDataSource.Destroy()
+    return np.array(xs, dtype=np.float64), np.array(ys, dtype=np.float64), np.array(classes, dtype=np.int64)
+
+
+def points_to_windows(xs: np.ndarray, ys: np.ndarray, transform, width: int, height: int,
+                      max_dist_X: float, max_dist_Y: float) -> List[Optional[Window]]:
+    """
+    Convert points to the pixel windows covering their expanded squares.
+
+    A pixel belongs to the square of a point when its centre lies strictly
+    inside [X - max_dist_X, X + max_dist_X] x [Y - max_dist_Y, Y + max_dist_Y],
+    which is the rule followed by the OTB sampling applications.
+
+    Parameters
+    ----------
+    xs, ys : np.ndarray
+        Coordinates of the points, in the CRS of the stack.
+    transform : affine.Affine
+        Geotransform of the stack (north-up).
+    width, height : int
+        Size of the stack, in pixels.
+    max_dist_X, max_dist_Y : float
+        Half size of the squares, in the units of the CRS.
+
+    Returns
+    -------
+    List[Optional[Window]]
+        One window per point, None when the square does not cover any pixel.
+    """
+    pixel_x = transform.a
+    pixel_y = -transform.e
+
+    # Pixel centre of column c is x0 + (c + 0.5) * pixel_x
+    col_min = np.floor((xs - max_dist_X - transform.c) / pixel_x - 0.5).astype(np.int64) + 1
+    col_max = np.ceil((xs + max_dist_X - transform.c) / pixel_x - 0.5).astype(np.int64) - 1
+    row_min = np.floor((transform.f - (ys + max_dist_Y)) / pixel_y - 0.5).astype(np.int64) + 1
+    row_max = np.ceil((transform.f - (ys - max_dist_Y)) / pixel_y - 0.5).astype(np.int64) - 1
+
+    col_min = np.clip(col_min, 0, None)
+    row_min = np.clip(row_min, 0, None)
+    col_max = np.clip(col_max, None, width - 1)
+    row_max = np.clip(row_max, None, height - 1)
+
+    windows = []
+    for c0, c1, r0, r1 in zip(col_min, col_max, row_min, row_max):
+        if c1 < c0 or r1 < r0:
+            windows.append(None)
+        else:
+            windows.append(Window(int(c0), int(r0), int(c1 - c0 + 1), int(r1 - r0 + 1)))
+    return windows
+
+
+def block_order(windows: List[Optional[Window]], block_shape: Tuple[int, int]) -> List[int]:
+    """
+    Order the windows by the block of the stack they start in, so that
+    consecutive reads hit the same (cached) blocks of the file.
+    """
+    block_h, block_w = block_shape
+    valid = [k for k, w in enumerate(windows) if w is not None]
+    return sorted(valid, key=lambda k: (windows[k].row_off // block_h, windows[k].col_off // block_w,
+                                        windows[k].row_off, windows[k].col_off))
+
+
+def read_windows(raw_img: str, windows: List[Optional[Window]], keys: List[str],
+                 cache: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]
+                 ) -> Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Get all the pixels of each window, from the feature cache when the point
+    is already in it, from the stack otherwise.
+
+    Parameters
+    ----------
+    raw_img : str
+        Path to the features stack.
+    windows : List[Optional[Window]]
+        Windows returned by points_to_windows.
+    keys : List[str]
+        Cache keys of the points, returned by point_keys.
+    cache : Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]
+        Feature cache returned by load_feature_cache, the windows read from
+        the stack are added to it.
+
+    Returns
+    -------
+    Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]
+        For each window index, the rows, the columns and the (pixels, bands)
+        values of its pixels.
+    """
+    pixels = {}
+    to_read = [w if w is not None and keys[k] not in cache else None for k, w in enumerate(windows)]
+    with rasterio.open(raw_img) as src:
+        for k in block_order(to_read, src.block_shapes[0]):
+            window = windows[k]
+            values = src.read(window=window)
+            rows, cols = np.indices((window.height, window.width)).reshape(2, -1)
+            cache[keys[k]] = (rows + window.row_off, cols + window.col_off, values[:, rows, cols].T)
+
+    for k, window in enumerate(windows):
+        if window is not None:
+            pixels[k] = cache[keys[k]]
+    print('{} points read from the stack, {} from the feature cache'.format(
+        sum(w is not None for w in to_read), len(pixels) - sum(w is not None for w in to_read)))
+    return pixels
+
+
+def mask_pixels(mask_tif: str, windows: List[Optional[Window]],
+                pixels: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]
+                ) -> Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Discard the pixels with a 0 value in the validity mask.
+    The mask is read at each run, as the no-data layer can be edited.
+    """
+    masked = {}
+    with rasterio.open(mask_tif) as mask_src:
+        for k in block_order(windows, mask_src.block_shapes[0]):
+            window = windows[k]
+            rows, cols, values = pixels[k]
+            valid = mask_src.read(1, window=window)[rows - window.row_off, cols - window.col_off] > 0
+            masked[k] = (rows[valid], cols[valid], values[valid])
+    return masked
+
+
+def get_stack_id(raw_img: str) -> str:
+    """
+    Identifier of the features stack, used to invalidate the feature cache.
+    The stack is not modified after step 0, so its size, modification time
+    and georeferencing are enough to identify it without hashing its pixels.
+    """
+    with rasterio.open(raw_img) as src:
+        description = [src.width, src.height, src.count, list(src.dtypes), list(src.transform)]
+    description.extend([op.getsize(raw_img), os.stat(raw_img).st_mtime_ns])
+    return hashlib.sha1(json.dumps(description).encode()).hexdigest()
+
+
+def point_keys(xs: np.ndarray, ys: np.ndarray, max_dist: float) -> List[str]:
+    """
+    Keys of the points in the feature cache, from their geometry and the
+    expansion distance.
+    """
+    return [hashlib.sha1(struct.pack('<ddd', x, y, max_dist)).hexdigest() for x, y in zip(xs, ys)]
+
+
+def load_feature_cache(cache_file: str, stack_id: str) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Load the feature cache written by save_feature_cache.
+    The cache is discarded if it was computed on another stack.
+    """
+    if not op.exists(cache_file):
+        return {}
+    with np.load(cache_file) as data:
+        if str(data["stack_id"]) != stack_id:
+            print('Feature cache computed on another stack, discarded')
+            return {}
+        offsets = data["offsets"]
+        rows, cols, values = data["rows"], data["cols"], data["values"]
+        return {str(key): (rows[offsets[n]:offsets[n + 1]], cols[offsets[n]:offsets[n + 1]],
+                           values[offsets[n]:offsets[n + 1]])
+                for n, key in enumerate(data["keys"])}
+
+
+def save_feature_cache(cache_file: str, stack_id: str, cache: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]):
+    """
+    Save the pixels of every cached point, in one npz file.
+    """
+    keys = sorted(cache.keys())
+    if len(keys) == 0:
+        if op.exists(cache_file):
+            os.remove(cache_file)
+        return
+    sizes = [len(cache[key][0]) for key in keys]
+    np.savez(cache_file, stack_id=np.array(stack_id), keys=np.array(keys),
+             offsets=np.concatenate([[0], np.cumsum(sizes)]),
+             rows=np.concatenate([cache[key][0] for key in keys]),
+             cols=np.concatenate([cache[key][1] for key in keys]),
+             values=np.concatenate([cache[key][2] for key in keys]))
+
+
+def candidates_table(pixels: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]], bands_qty: int, dtype
+                     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Concatenate the pixels returned by mask_pixels into one table of candidates,
+    in the order of the points.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        Index of the point of origin, row, column and (pixels, bands) values
+        of every candidate pixel.
+    """
+    fids = sorted(pixels.keys())
+    originfids = [np.full(len(pixels[k][0]), k, dtype=np.int64) for k in fids]
+    rows = [pixels[k][0] for k in fids]
+    cols = [pixels[k][1] for k in fids]
+    features = [pixels[k][2] for k in fids]
+    if len(fids) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, np.zeros((0, bands_qty), dtype=dtype)
+    return np.concatenate(originfids), np.concatenate(rows), np.concatenate(cols), np.concatenate(features)
+
+
+def read_polygons(in_shp: str) -> Tuple[List[dict], np.ndarray]:
+    """
+    Read the geometry, as a GeoJSON-like dict, and the class of every
+    labelled polygon of a shapefile, in the order of their FID.
+    """
+    inDriver = ogr.GetDriverByName("ESRI Shapefile")
+    inDataSource = inDriver.Open(in_shp, 0)
+    inLayer = inDataSource.GetLayer()
+
+    polygons, classes = [], []
+    for polygon in inLayer:
+        polygons.append(json.loads(polygon.GetGeometryRef().ExportToJson()))
+        classes.append(int(polygon.GetField("class")))
+
+    inDataSource.Destroy()
+    return polygons, np.array(classes, dtype=np.int64)
+
+
+def polygons_pixels(raw_img: str, polygons: List[dict]
+                    ) -> Tuple[List[Optional[Window]], Dict[int, Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Rasterize each polygon on the grid of the stack, within its bounding
+    window. As for the squares, a pixel belongs to a polygon when its centre
+    is inside.
+
+    Returns
+    -------
+    Tuple[List[Optional[Window]], Dict[int, Tuple[np.ndarray, np.ndarray]]]
+        The bounding window of each polygon, None when it is outside the
+        stack, and the rows and columns of the pixels of each polygon.
+    """
+    windows = []
+    pixels = {}
+    with rasterio.open(raw_img) as src:
+        for k, polygon in enumerate(polygons):
+            try:
+                window = rasterio.features.geometry_window(src, [polygon])
+            except rasterio.errors.WindowError:
+                windows.append(None)
+                continue
+            windows.append(window)
+            inside = rasterio.features.rasterize([(polygon, 1)], out_shape=(window.height, window.width),
+                                                 transform=src.window_transform(window), fill=0, dtype=np.uint8)
+            rows, cols = np.nonzero(inside)
+            pixels[k] = (rows + window.row_off, cols + window.col_off)
+    return windows, pixels
+
+
+def read_polygons_pixels(raw_img: str, polygons: List[dict]
+                         ) -> Tuple[List[Optional[Window]], Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+    """
+    Get the pixels of each polygon, as given by polygons_pixels, with their
+    values in the stack.
+
+    Returns
+    -------
+    Tuple[List[Optional[Window]], Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]]
+        The bounding window of each polygon, None when it is outside the
+        stack, and the pixels of each polygon as returned by read_windows.
+    """
+    windows, positions = polygons_pixels(raw_img, polygons)
+    pixels = {}
+    with rasterio.open(raw_img) as src:
+        for k, (rows, cols) in positions.items():
+            window = windows[k]
+            values = src.read(window=window)
+            pixels[k] = (rows, cols, values[:, rows - window.row_off, cols - window.col_off].T)
+    print('{} pixels inside {} polygons'.format(sum(len(p[0]) for p in pixels.values()), len(pixels)))
+    return windows, pixels
+
+
+def cap_pixels(pixels: Dict[int, Tuple[np.ndarray, ...]], capped: List[int],
+               max_pixels: int, seed: Optional[int] = None) -> Dict[int, Tuple[np.ndarray, ...]]:
+    """
+    Randomly keep at most max_pixels pixels of the given vectors, so that a
+    large polygon does not outweigh the other labels of its class.
+    """
+    rng = np.random.default_rng(seed)
+    for k in capped:
+        if k in pixels and len(pixels[k][0]) > max_pixels:
+            kept = np.sort(rng.choice(len(pixels[k][0]), size=max_pixels, replace=False))
+            pixels[k] = tuple(array[kept] for array in pixels[k])
+    return pixels
+
+
+def pixels_centres(transform, rows: np.ndarray, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Coordinates of the centre of the pixels, computed as OTB does, i.e. from
+    the centre of the upper left pixel.
+    """
+    xs = (transform.c + transform.a / 2.) + cols * transform.a
+    ys = (transform.f + transform.e / 2.) + rows * transform.e
+    return xs, ys
+
+
+def allocate_budget(capacities: Dict[int, int], weights: Dict[int, float], budget: int,
+                    min_samples: int = 1) -> Dict[int, int]:
+    """
+    Share a total number of samples between the classes, proportionally to
+    their weights, without exceeding their capacity. The share of a full
+    class goes to the other ones, and every class with candidates keeps at
+    least min_samples samples (or all its candidates), taken from the
+    largest classes.
+    """
+    samples_nb = {c: 0 for c in capacities}
+    remaining = budget
+    open_classes = [c for c in capacities if capacities[c] > 0 and weights[c] > 0]
+    while remaining > 0 and open_classes:
+        total_weight = float(sum(weights[c] for c in open_classes))
+        shares = {c: remaining * weights[c] / total_weight for c in open_classes}
+        given = 0
+        for c in open_classes:
+            added = min(int(shares[c]), capacities[c] - samples_nb[c])
+            samples_nb[c] += added
+            given += added
+        if given == 0:
+            # less than one sample per class left: one for the largest shares
+            for c in sorted(open_classes, key=lambda c: -shares[c])[:remaining]:
+                samples_nb[c] += 1
+            break
+        remaining -= given
+        open_classes = [c for c in open_classes if samples_nb[c] < capacities[c]]
+    for c in capacities:
+        missing = min(min_samples, capacities[c]) - samples_nb[c]
+        if missing > 0:
+            samples_nb[c] += missing
+            largest = max(samples_nb, key=samples_nb.get)
+            samples_nb[largest] -= min(missing, max(0, samples_nb[largest] - min_samples))
+    return samples_nb
+
+
+def get_samples_nb_per_class(samples_per_class: Dict[int, int], strategy: str,
+                             class_caps: Optional[Dict[int, int]] = None, min_samples: int = 1) -> Dict[int, int]:
+    """
+    Number of samples to keep for each class. The strategy names follow the
+    ones of the OTB SampleSelection application used in
+    OTB_workflow.select_samples, with two budget strategies in addition.
+
+    Parameters
+    ----------
+    samples_per_class : Dict[int, int]
+        Number of candidate pixels for each class.
+    strategy : str
+        "smallest", "constant" (both take the size of the smallest class),
+        "constant_<nb>" (at most nb samples per class), "all",
+        "proportional_<budget>" (budget samples in total, shared in
+        proportion to the class sizes) or "sqrt_<budget>" (shared in
+        proportion to the square root of the class sizes, which favours
+        the rare classes).
+    class_caps : Optional[Dict[int, int]]
+        Maximum number of samples of some classes. With a budget strategy,
+        what a capped class does not use goes to the other classes.
+    min_samples : int
+        Minimum number of samples of each class with candidates, with a
+        budget strategy.
+
+    Returns
+    -------
+    Dict[int, int]
+        Number of samples to select for each class.
+    """
+    if len(samples_per_class) == 0:
+        return {}
+    capacities = {c: min(n, (class_caps or {}).get(c, n)) for c, n in samples_per_class.items()}
+
+    name, _, value = strategy.partition('_')
+    if strategy == "all":
+        return capacities
+    if strategy in ("smallest", "constant"):
+        nb = min(samples_per_class.values())
+        return {c: min(n, nb) for c, n in capacities.items()}
+    if name == "constant":
+        return {c: min(n, int(value)) for c, n in capacities.items()}
+    if name == "proportional":
+        return allocate_budget(capacities, {c: float(n) for c, n in samples_per_class.items()}, int(value),
+                               min_samples)
+    if name == "sqrt":
+        return allocate_budget(capacities, {c: np.sqrt(n) for c, n in samples_per_class.items()}, int(value),
+                               min_samples)
+    raise ValueError('Unknown sampling strategy: {}'.format(strategy))
+
+
+def draw_samples(pixel_classes: np.ndarray, samples_nb: Dict[int, int], seed: Optional[int] = None) -> np.ndarray:
+    """
+    Randomly draw, without replacement, the requested number of samples of
+    each class. The returned indexes keep the order of the candidates.
+    """
+    rng = np.random.default_rng(seed)
+    selected = []
+    for class_nb, nb in sorted(samples_nb.items()):
+        class_indexes = np.flatnonzero(pixel_classes == class_nb)
+        if nb < len(class_indexes):
+            class_indexes = rng.choice(class_indexes, size=nb, replace=False)
+        selected.append(class_indexes)
+    if len(selected) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.sort(np.concatenate(selected))
+
+
+def write_class_stats(class_stats: str, samples_per_class: Dict[int, int], samples_per_vector: Dict[int, int]):
+    """
+    Write the class statistics in the XML format of PolygonClassStatistics,
+    so that OTB_workflow.get_samples_nb can read them.
+    """
+    lines = ['<?xml version="1.0" ?>', '<GeneralStatistics>', '    <Statistic name="samplesPerClass">']
+    for class_nb, nb in sorted(samples_per_class.items()):
+        lines.append('        <StatisticMap key="{}" value="{}" />'.format(class_nb, nb))
+    lines.extend(['    </Statistic>', '    <Statistic name="samplesPerVector">'])
+    for fid, nb in sorted(samples_per_vector.items()):
+        lines.append('        <StatisticMap key="{}" value="{}" />'.format(fid, nb))
+    lines.extend(['    </Statistic>', '</GeneralStatistics>'])
+
+    with open(class_stats, 'w') as xml_file:
+        xml_file.write('\n'.join(lines) + '\n')
+
+
+def write_samples_table(out_sqlite: str, srs_wkt: str, xs: np.ndarray, ys: np.ndarray, classes: np.ndarray,
+                        originfids: np.ndarray, features: np.ndarray, feature_names: List[str]):
+    """
+    Write the samples in a SQLite file with the schema of SampleExtraction:
+    a point layer named "output" with the "class" and "originfid" fields
+    followed by one real field per feature.
+
+    The layer is created through OGR, so that the file stays readable by
+    TrainVectorClassifier, then the rows are inserted in one transaction.
+    """
+    outDriver = ogr.GetDriverByName("SQLite")
+    if op.exists(out_sqlite):
+        outDriver.DeleteDataSource(out_sqlite)
+
+    srs = osr.SpatialReference(wkt=srs_wkt)
+    outDataSource = outDriver.CreateDataSource(out_sqlite)
+    outLayer = outDataSource.CreateLayer("output", srs, geom_type=ogr.wkbPoint, options=["FORMAT=WKB"])
+    outLayer.CreateField(ogr.FieldDefn("class", ogr.OFTInteger))
+    outLayer.CreateField(ogr.FieldDefn("originfid", ogr.OFTInteger))
+    for feature_name in feature_names:
+        outLayer.CreateField(ogr.FieldDefn(feature_name, ogr.OFTReal))
+    outDataSource.Destroy()
+
+    # Little endian WKB point
+    geometries = [struct.pack('<BIdd', 1, 1, x, y) for x, y in zip(xs, ys)]
+    rows = zip(geometries, classes.tolist(), originfids.tolist(), features.astype(np.float64).tolist())
+
+    columns = ['GEOMETRY', 'class', 'originfid'] + list(feature_names)
+    query = 'INSERT INTO output ({}) VALUES ({})'.format(
+        ', '.join('"{}"'.format(c) for c in columns), ', '.join(['?'] * len(columns)))
+
+    connex = sqlite3.connect(out_sqlite)
+    with connex:
+        connex.executemany(query, ([g, c, f] + v for g, c, f, v in rows))
+    connex.close()
+
+
+def read_labelled_pixels(raw_img: str, points_shp: str, polygons_shp: str, mask_tif: str, max_dist: float,
+                         cache: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]], max_per_polygon: int,
+                         seed: Optional[int] = None
+                         ) -> Tuple[Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]], np.ndarray]:
+    """
+    Get the valid pixels of the squares around the labelled points and of
+    the labelled polygons, at most max_per_polygon in each polygon.
+
+    Returns
+    -------
+    Tuple[Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]], np.ndarray]
+        The pixels of each vector as returned by read_windows, the polygons
+        following the points as in the extended shapefiles, and the class
+        of each vector.
+    """
+    xs, ys, classes = read_points(points_shp)
+    with rasterio.open(raw_img) as src:
+        transform, width, height = src.transform, src.width, src.height
+
+    windows = points_to_windows(xs, ys, transform, width, height, max_dist, max_dist)
+    pixels = read_windows(raw_img, windows, point_keys(xs, ys, max_dist), cache)
+
+    polygons, polygon_classes = read_polygons(polygons_shp)
+    polygon_windows, polygon_pixels = read_polygons_pixels(raw_img, polygons)
+    pixels.update({len(xs) + k: values for k, values in polygon_pixels.items()})
+    windows = windows + polygon_windows
+
+    pixels = mask_pixels(mask_tif, windows, pixels)
+    pixels = cap_pixels(pixels, range(len(xs), len(windows)), max_per_polygon, seed)
+    return pixels, np.concatenate([classes, polygon_classes])
+
+
+def extract_samples(global_parameters, strategy="constant_8000"):
+    '''
+    Statistics, selection and extraction of the training samples in one pass.
+    Replaces compute_samples_stats, select_samples and extract_samples of
+    OTB_workflow, and writes the same class statistics and samples table,
+    along with the samples store used by the scikit training.
+    '''
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    raw_img = op.join(main_dir, 'In_data', 'Image', global_parameters["user_choices"]["raw_img"])
+    training_shp = op.join(main_dir, 'Intermediate', global_parameters["general"]["training_shp"])
+    training_polygons = op.join(main_dir, 'Intermediate', global_parameters["general"]["training_polygons"])
+    class_stats = op.join(main_dir, 'Statistics', global_parameters["general"]["class_stats"])
+    training_samples_extracted = op.join(
+        main_dir, 'Samples', global_parameters["general"]["training_samples_extracted"])
+
+    no_data_shp = op.join(main_dir, 'In_data', 'Masks', global_parameters["general"]["no_data_mask"])
+    no_data_mask = no_data_shp[0:-4] + '.tif'
+
+    max_dist = float(global_parameters["training_parameters"]["expansion_distance"])
+    seed = global_parameters["training_parameters"]["random_seed"]
+    max_per_polygon = global_parameters["training_parameters"]["max_samples_per_polygon"]
+
+    merged_shp = op.join(main_dir, 'Intermediate', global_parameters["general"]["merged_layers"])
+    cache_file = op.join(main_dir, 'Intermediate', global_parameters["general"]["feature_cache"])
+
+    print("  Training Samples Extraction (raster engine)")
+    with rasterio.open(raw_img) as src:
+        transform = src.transform
+        srs_wkt = src.crs.to_wkt()
+        bands_qty, dtype = src.count, src.dtypes[0]
+
+    stack_id = get_stack_id(raw_img)
+    cache = load_feature_cache(cache_file, stack_id)
+    pixels, classes = read_labelled_pixels(raw_img, training_shp, training_polygons, no_data_mask,
+                                           max_dist, cache, max_per_polygon, seed)
+
+    # Keep in the cache all the current points, including the validation ones
+    # which can become training points at the next split, drop the deleted ones
+    merged_xs, merged_ys, _ = read_points(merged_shp)
+    current_keys = set(point_keys(merged_xs, merged_ys, max_dist))
+    save_feature_cache(cache_file, stack_id, {key: v for key, v in cache.items() if key in current_keys})
+
+    originfids, rows, cols, features = candidates_table(pixels, bands_qty, dtype)
+    pixel_classes = classes[originfids]
+
+    samples_per_class = {int(c): int(n) for c, n in zip(*np.unique(pixel_classes, return_counts=True))}
+    samples_per_vector = {k: len(pixels[k][0]) for k in sorted(pixels.keys())}
+    write_class_stats(class_stats, samples_per_class, samples_per_vector)
+
+    samples_nb = get_samples_nb_per_class(samples_per_class, strategy,
+                                          global_parameters["training_parameters"]["max_samples_per_class"],
+                                          global_parameters["training_parameters"]["min_samples_per_class"])
+    selected = draw_samples(pixel_classes, samples_nb, seed)
+    print('{} samples selected among {} candidates'.format(len(selected), len(pixel_classes)))
+
+    # Same feature names as the ones given by SampleExtraction
+    feature_names = ['band_{}'.format(b) for b in range(bands_qty)]
+    sample_xs, sample_ys = pixels_centres(transform, rows[selected], cols[selected])
+    write_samples_table(training_samples_extracted, srs_wkt, sample_xs, sample_ys,
+                        pixel_classes[selected], originfids[selected], features[selected], feature_names)
+    sample_store.write_sample_store(sample_store.get_store_path(global_parameters), features[selected],
+                                    pixel_classes[selected], feature_names)
+    print('Done')
+
+    return training_samples_extracted
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (sample_store.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Columnar store of the extracted samples, used for the training.
+
+A store is a directory holding the features as a float32 (samples, features)
+.npy array, the classes as an int32 .npy array and a JSON file with the
+names of the features. The arrays are memory-mapped when loaded.
+"""
+import os
+import os.path as op
+import json
+import shutil
+import sqlite3
+from typing import List, Tuple
+
+import numpy as np
+
+FEATURES_FILE = "features.npy"
+LABELS_FILE = "labels.npy"
+METADATA_FILE = "metadata.json"
+NON_FEATURE_COLUMNS = ["ogc_fid", "GEOMETRY", "class", "originfid"]
+
+
+def get_store_path(global_parameters) -> str:
+    """
+    Path of the samples store of the current run.
+    """
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    return op.join(main_dir, 'Samples', global_parameters["general"]["training_samples_store"])
+
+
+def write_sample_store(store_dir: str, features: np.ndarray, labels: np.ndarray, feature_names: List[str]) -> str:
+    """
+    Write the samples in a store, replacing the previous one.
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the store.
+    features : np.ndarray
+        (samples, features) array, stored as float32.
+    labels : np.ndarray
+        Class of each sample, stored as int32.
+    feature_names : List[str]
+        Name of each column of features.
+
+    Returns
+    -------
+    str
+        The directory of the store.
+    """
+    if features.shape[1] != len(feature_names):
+        raise ValueError('{} feature names given for {} features'.format(len(feature_names), features.shape[1]))
+
+    if op.exists(store_dir):
+        shutil.rmtree(store_dir)
+    os.makedirs(store_dir)
+
+    np.save(op.join(store_dir, FEATURES_FILE), np.ascontiguousarray(features, dtype=np.float32))
+    np.save(op.join(store_dir, LABELS_FILE), np.asarray(labels, dtype=np.int32))
+    with open(op.join(store_dir, METADATA_FILE), 'w') as json_file:
+        json.dump({"feature_names": list(feature_names), "samples_nb": int(len(labels))}, json_file, indent=3)
+
+    return store_dir
+
+
+def get_feature_names(store_dir: str) -> List[str]:
+    """
+    Names of the features of a store, without loading the samples.
+    """
+    with open(op.join(store_dir, METADATA_FILE), 'r') as json_file:
+        return json.load(json_file)["feature_names"]
+
+
+def load_sample_store(store_dir: str, mmap: bool = True) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """
+    Load the samples of a store.
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the store.
+    mmap : bool
+        Memory-map the arrays (read-only) instead of reading them.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, List[str]]
+        The float32 features, the int32 classes and the feature names.
+    """
+    mmap_mode = 'r' if mmap else None
+    features = np.load(op.join(store_dir, FEATURES_FILE), mmap_mode=mmap_mode)
+    labels = np.load(op.join(store_dir, LABELS_FILE), mmap_mode=mmap_mode)
+    return features, labels, get_feature_names(store_dir)
+
+
+def get_table_columns(samples_sqlite: str, table: str = "output") -> List[str]:
+    """
+    Names of the columns of a table of a SQLite file, read from its schema
+    without loading any row.
+    """
+    connex = sqlite3.connect(str(samples_sqlite))
+    columns = [row[1] for row in connex.execute('PRAGMA table_info("{}")'.format(table))]
+    connex.close()
+    if not columns:
+        raise ValueError('No table {} in {}'.format(table, samples_sqlite))
+    return columns
+
+
+def get_feature_columns(samples_sqlite: str) -> List[str]:
+    """
+    Names of the feature columns of the samples table written by
+    SampleExtraction, i.e. all the columns but the identifiers, the
+    geometry and the class.
+    """
+    return [column for column in get_table_columns(samples_sqlite) if column not in NON_FEATURE_COLUMNS]
+
+
+def load_samples_table(samples_sqlite: str, feature_names: List[str],
+                       chunk_size: int = 100000) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load the features and classes of the samples table, by chunks of rows,
+    straight into preallocated float32 and int32 arrays.
+    """
+    connex = sqlite3.connect(str(samples_sqlite))
+    samples_nb = connex.execute('SELECT COUNT(*) FROM output').fetchone()[0]
+    features = np.empty((samples_nb, len(feature_names)), dtype=np.float32)
+    labels = np.empty(samples_nb, dtype=np.int32)
+
+    columns = ', '.join('"{}"'.format(name) for name in ['class'] + list(feature_names))
+    cursor = connex.execute('SELECT {} FROM output ORDER BY ogc_fid'.format(columns))
+    start = 0
+    rows = cursor.fetchmany(chunk_size)
+    while rows:
+        chunk = np.array(rows, dtype=np.float32)
+        features[start:start + len(rows)] = chunk[:, 1:]
+        labels[start:start + len(rows)] = chunk[:, 0]
+        start += len(rows)
+        rows = cursor.fetchmany(chunk_size)
+    connex.close()
+
+    return features[:start], labels[:start]
+
+
+def sqlite_to_sample_store(samples_sqlite: str, store_dir: str) -> str:
+    """
+    Convert the samples table written by SampleExtraction to a store.
+    """
+    feature_names = get_feature_columns(samples_sqlite)
+    features, labels = load_samples_table(samples_sqlite, feature_names)
+    return write_sample_store(store_dir, features, labels, feature_names)
+
+
+def is_up_to_date(store_dir: str, samples_sqlite: str) -> bool:
+    """
+    Whether the store exists and is more recent than the samples table.
+    """
+    metadata = op.join(store_dir, METADATA_FILE)
+    return op.exists(metadata) and op.getmtime(metadata) >= op.getmtime(samples_sqlite)
+
+
+def load_samples_origins(samples_sqlite: str) -> np.ndarray:
+    """
+    Identifier of the labelled point or polygon each sample of the samples
+    table was drawn around (originfid), in the order of the store.
+    """
+    connex = sqlite3.connect(str(samples_sqlite))
+    rows = connex.execute('SELECT originfid FROM output ORDER BY ogc_fid').fetchall()
+    connex.close()
+    return np.array([row[0] for row in rows], dtype=np.int64)
@@ -3,6 +3,7 @@
 
 import os
 import os.path as op
+import hashlib
 from osgeo import ogr
 import numpy as np
 from random import shuffle
@@ -165,109 +166,74 @@ def global_proportion_type(inLayer, proportion, trainLayer, validationLayer):
         k += 1
 
 
+FOLDS_SHP = 'folds.shp'
+
+
 def k_split(in_shp, out_dir, K):
     '''
     Split the in_shp in K different sets
-    They will be saved in the out_dir folder
+    A single table is saved in the out_dir folder, with the
+    points of in_shp and the fold they belong to in a "fold" field
     '''
     # Create the output dir
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
         print(out_dir + ' created')
-    
+
     # Get a Layer's Extent
     inDriver = ogr.GetDriverByName("ESRI Shapefile")
     inDataSource = inDriver.Open(in_shp, 0)
     inLayer = inDataSource.GetLayer()
-    
+
     layerDefinition = inLayer.GetLayerDefn()
     srs = inLayer.GetSpatialRef()
 
     # get the field names
     field_names = get_field_names(layerDefinition)
 
-    shpDriver = ogr.GetDriverByName("ESRI Shapefile")
-
-    # each class will respect the proportion
+    # Get a list of all the classes and FID
     points_classes_list = []
     points_FID_list = []
-    
-    # Get a list of all the classes and FID
     for point in inLayer:
         points_classes_list.append(point.GetField("class"))
         points_FID_list.append(point.GetFID())
-        
-    # Shuffle the two lists in the same order
-    points_classes_list, points_FID_list = shuffle_two_lists(points_classes_list, points_FID_list)
 
-    # Get the indexes to respect the quota
-    train_idx = []
-    validation_idx = []
-    # for each class
+    # each class will respect the proportion: the points of each class
+    # are shuffled and split into K chunks of same size
+    K = int(K)
+    fold_of_FID = {}
     for class_name in list(set(points_classes_list)):
-        # get all the indexes of the points belonging to that class
-        class_indexes = [index for index, value in enumerate(points_classes_list) if value == class_name]
-        shuffle(class_indexes)
-        
-        # split it into K chunks of same size
-        K = int(K)
-        splitted_class_indexes = np.array_split(class_indexes, K)
-        
-        # prepare all the k lists 
-        for k in range(K):
-            train_k_idx = np.concatenate([x for i,x in enumerate(splitted_class_indexes) if i!=k])
-            validation_k_idx = np.concatenate([x for i,x in enumerate(splitted_class_indexes) if i==k])
-            train_idx.append(train_k_idx)
-            validation_idx.append(validation_k_idx)
-
-    # here, train_idx and validation_idx contains K*nb_of_classes elements
-    # it should be transformed into K elements by concatenating the list into
-    # itself every nb_of_classes element
-    nb_classes = len(list(set(points_classes_list)))
-    
-    train_idx_all_K = []
-    validation_idx_all_K = []
-    for k in range(K):
-        train_idx_all_K.append(np.concatenate(train_idx[k::K]))
-        validation_idx_all_K.append(np.concatenate(validation_idx[k::K]))
+        class_FID = [fid for fid, value in zip(points_FID_list, points_classes_list) if value == class_name]
+        shuffle(class_FID)
+        for k, fold_FID in enumerate(np.array_split(class_FID, K)):
+            for fid in fold_FID:
+                fold_of_FID[int(fid)] = k
 
     for k in range(K):
-        train_idx = train_idx_all_K[k]
-        validation_idx = validation_idx_all_K[k]
-        
-        train_shp = op.join(out_dir, 'train_k_{}.shp'.format(k))
-        validation_shp = op.join(out_dir, 'validation_k_{}.shp'.format(k))
-                
-        # Associate the indexes to the FIDs
-        train_FID = [points_FID_list[int(idx)] for idx in train_idx]
-        validation_FID = [points_FID_list[int(idx)] for idx in validation_idx]
-        #~ print(train_FID)
-        print('{} training points will be taken'.format(len(train_FID)))
-        print('{} validation points will be taken'.format(len(validation_FID)))
-        
-        inLayer.ResetReading() # needs to be reset to be readable again
-
-        # Remove output shapefile if it already exists
-        for dire in [train_shp, validation_shp]:
-            if os.path.exists(dire):
-                shpDriver.DeleteDataSource(dire)
+        validation_nb = list(fold_of_FID.values()).count(k)
+        print('Fold {}: {} training points, {} validation points'.format(
+            k, len(fold_of_FID) - validation_nb, validation_nb))
 
-        # Create the output shapefiles
-        trainDataSource = shpDriver.CreateDataSource(train_shp)
-        trainLayer = trainDataSource.CreateLayer("buff_layer", srs, geom_type=ogr.wkbPoint)
-        
-        validationDataSource = shpDriver.CreateDataSource(validation_shp)
-        validationLayer = validationDataSource.CreateLayer("buff_layer", srs, geom_type=ogr.wkbPoint)
-
-        # Add all the fields
-        add_all_fields(field_names, inLayer, trainLayer, train_FID, validationLayer, validation_FID)
-
-        # Close DataSources
-        trainDataSource.Destroy()    
-        validationDataSource.Destroy()    
+    # Write the fold table
+    folds_shp = op.join(out_dir, FOLDS_SHP)
+    shpDriver = ogr.GetDriverByName("ESRI Shapefile")
+    if os.path.exists(folds_shp):
+        shpDriver.DeleteDataSource(folds_shp)
+    foldsDataSource = shpDriver.CreateDataSource(folds_shp)
+    foldsLayer = foldsDataSource.CreateLayer("buff_layer", srs, geom_type=ogr.wkbPoint)
+    for field_name in field_names + ['fold']:
+        foldsLayer.CreateField(ogr.FieldDefn(field_name, ogr.OFTInteger))
+
+    inLayer.ResetReading()  # needs to be reset to be readable again
+    for point in inLayer:
+        feature = ogr.Feature(foldsLayer.GetLayerDefn())
+        feature.SetFrom(point)
+        feature.SetField('fold', fold_of_FID[point.GetFID()])
+        foldsLayer.CreateFeature(feature)
 
+    foldsDataSource.Destroy()
     inDataSource.Destroy()
-    return
+    return folds_shp
 
 
 def get_field_names(layerDefinition):
@@ -277,18 +243,73 @@ def get_field_names(layerDefinition):
     return field_names
 
 
-def add_all_fields(field_names, inLayer, trainLayer, train_FID, validationLayer, validation_FID):
+def write_subset(in_shp, out_shp, where=None, fids=None, geom_type=ogr.wkbPoint):
+    '''
+    Write in out_shp the points of in_shp matching the attribute
+    filter where (e.g. "fold = 3") and/or whose FID is in fids,
+    without the fold field
+    '''
+    inDriver = ogr.GetDriverByName("ESRI Shapefile")
+    inDataSource = inDriver.Open(in_shp, 0)
+    inLayer = inDataSource.GetLayer()
+    if where is not None:
+        inLayer.SetAttributeFilter(where)
+    if fids is not None:
+        fids = set(fids)
+
+    field_names = [name for name in get_field_names(inLayer.GetLayerDefn()) if name != 'fold']
+
+    shpDriver = ogr.GetDriverByName("ESRI Shapefile")
+    if os.path.exists(out_shp):
+        shpDriver.DeleteDataSource(out_shp)
+    outDataSource = shpDriver.CreateDataSource(out_shp)
+    outLayer = outDataSource.CreateLayer("buff_layer", inLayer.GetSpatialRef(), geom_type=geom_type)
     for field_name in field_names:
-        newField = ogr.FieldDefn(field_name, ogr.OFTInteger)
-        trainLayer.CreateField(newField)
-        validationLayer.CreateField(newField)
+        outLayer.CreateField(ogr.FieldDefn(field_name, ogr.OFTInteger))
 
-        # Create the feature and set values
-        for point in inLayer:
-            current_FID = point.GetFID()
-            if current_FID in train_FID:
-                trainLayer.CreateFeature(point)
-            elif current_FID in validation_FID:
-                validationLayer.CreateFeature(point)
-            else:
-                print('FID {} not in any list'.format(current_FID))
+    for point in inLayer:
+        if fids is not None and point.GetFID() not in fids:
+            continue
+        feature = ogr.Feature(outLayer.GetLayerDefn())
+        feature.SetGeometry(point.GetGeometryRef())
+        for field_name in field_names:
+            feature.SetField(field_name, point.GetField(field_name))
+        outLayer.CreateFeature(feature)
+
+    outDataSource.Destroy()
+    inDataSource.Destroy()
+    return out_shp
+
+
+def split_polygons(in_shp, train_shp, validation_shp, proportion=None, K=None, k_fold_step=None):
+    '''
+    Split the polygons of in_shp in a training and a validation shapefile
+    There are few polygons, so the split is made deterministic by ordering
+    the polygons of each class by the hash of their geometry:
+    - with proportion, the first ones of each class go to train_shp
+    - with K and k_fold_step, the polygon of rank r of a class is in
+      the validation set of the fold r % K
+    '''
+    inDriver = ogr.GetDriverByName("ESRI Shapefile")
+    inDataSource = inDriver.Open(in_shp, 0)
+    polygons_by_class = {}
+    for polygon in inDataSource.GetLayer():
+        polygon_hash = hashlib.sha1(bytes(polygon.GetGeometryRef().ExportToWkb())).hexdigest()
+        polygons_by_class.setdefault(polygon.GetField("class"), []).append((polygon_hash, polygon.GetFID()))
+    inDataSource.Destroy()
+
+    train_FID = []
+    validation_FID = []
+    for class_polygons in polygons_by_class.values():
+        ranked_FID = [fid for _, fid in sorted(class_polygons)]
+        if K is not None:
+            validation_FID.extend(fid for rank, fid in enumerate(ranked_FID) if rank % int(K) == k_fold_step)
+            train_FID.extend(fid for rank, fid in enumerate(ranked_FID) if rank % int(K) != k_fold_step)
+        else:
+            cutoff = int(np.ceil(proportion*len(ranked_FID)))
+            train_FID.extend(ranked_FID[0:cutoff])
+            validation_FID.extend(ranked_FID[cutoff:])
+
+    print('{} training polygons and {} validation polygons'.format(len(train_FID), len(validation_FID)))
+    write_subset(in_shp, train_shp, fids=train_FID, geom_type=ogr.wkbPolygon)
+    write_subset(in_shp, validation_shp, fids=validation_FID, geom_type=ogr.wkbPolygon)
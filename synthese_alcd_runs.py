@@ -34,7 +34,7 @@ import shutil
 import matplotlib.pyplot as plt
 import glob
 
-import otbApplication
+import otb_factory
 from matplotlib.lines import Line2D
 
 from alcd_params.params_reader import read_paths_parameters
@@ -194,7 +194,7 @@ def mean_confidence(confidence_tif):
     '''
     Compute the mean confidence of an iteration from the confidence map
     '''
-    ComputeImagesStatistics = otbApplication.Registry.CreateApplication("ComputeImagesStatistics")
+    ComputeImagesStatistics = otb_factory.create_application("ComputeImagesStatistics")
     ComputeImagesStatistics.SetParameterStringList("il", ['QB_1_ortho.tif'])
     ComputeImagesStatistics.SetParameterString("out", "EstimateImageStatisticsQB1.xml")
     ComputeImagesStatistics.ExecuteAndWriteOutput()
@@ -0,0 +1,58 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_feature_importance.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import numpy as np
+import rasterio
+import sklearn.ensemble as sk
+from rasterio.transform import from_origin
+
+import feature_importance
+
+
+def test_select_top_features(tmp_path) -> None:
+    """
+    Check that the informative features are ranked first with both kinds of
+    importance, and that the stack of the selected bands keeps their order.
+    """
+    rng = np.random.default_rng(0)
+    x_train = rng.random((500, 5), dtype=np.float32)
+    y_train = (x_train[:, 3] + 0.3 * x_train[:, 1] > 0.65).astype(np.int32) + 1
+    forest = sk.RandomForestClassifier(n_estimators=20, random_state=0).fit(x_train, y_train)
+
+    for kind in ["impurity", "permutation"]:
+        importances = feature_importance.compute_importances(forest, x_train, y_train, kind, seed=0)
+        assert feature_importance.select_top_features(importances, 2) == [1, 3]
+
+    raw_img = str(tmp_path / "stack_bands.tif")
+    bands = rng.integers(0, 1000, (5, 32, 32)).astype(np.int16)
+    with rasterio.open(raw_img, 'w', driver='GTiff', width=32, height=32, count=5, dtype='int16',
+                       transform=from_origin(0, 320, 10, 10)) as dst:
+        dst.write(bands)
+    with open(str(tmp_path / "stack_bands_bands.txt"), 'w') as txt_file:
+        txt_file.writelines('B{} : /data/Intermediate/band{}.tif\n'.format(band + 1, band) for band in range(5))
+
+    out_tif = str(tmp_path / feature_importance.get_selected_stack_name("stack_bands.tif", 2))
+    feature_importance.write_selected_stack(raw_img, [1, 3], out_tif)
+    with rasterio.open(out_tif) as src:
+        assert np.array_equal(src.read(), bands[[1, 3]])
+    assert feature_importance.read_band_names(out_tif) == ["band1", "band3"]
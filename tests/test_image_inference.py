@@ -0,0 +1,121 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_image_inference.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import numpy as np
+import pytest
+import rasterio
+import sklearn.ensemble as sk
+from rasterio.transform import from_origin
+
+import image_inference
+from alcd_params.global_parameters import Classification
+
+
+def test_classify_image(tmp_path) -> None:
+    """
+    Check that the image classified by blocks of a few rows, or by tiles on
+    several processes, gives the labels and confidence of the model, with 0
+    outside the no-data mask.
+    """
+    rng = np.random.default_rng(0)
+    stack = rng.integers(0, 1000, (3, 50, 40)).astype(np.int16)
+    mask = (rng.random((50, 40)) > 0.2).astype(np.uint8)
+    x_train = rng.integers(0, 1000, (300, 3)).astype(np.float32)
+    y_train = np.where(x_train[:, 0] > 500, 2, 5).astype(np.int32)
+    model = sk.RandomForestClassifier(n_estimators=10, random_state=0).fit(x_train, y_train)
+
+    raw_img, mask_tif = str(tmp_path / "stack.tif"), str(tmp_path / "mask.tif")
+    profile = {"driver": "GTiff", "width": 40, "height": 50, "transform": from_origin(0, 500, 10, 10)}
+    with rasterio.open(raw_img, 'w', count=3, dtype='int16', **profile) as dst:
+        dst.write(stack)
+    with rasterio.open(mask_tif, 'w', count=1, dtype='uint8', **profile) as dst:
+        dst.write(mask, 1)
+
+    # a budget of a few rows per block
+    assert image_inference.get_block_rows(40, 3, 2, 2, 0.0005) < 50
+    img_labeled, confidence_map = str(tmp_path / "labeled.tif"), str(tmp_path / "confidence.tif")
+    image_inference.classify_image(model, raw_img, mask_tif, img_labeled, confidence_map, ram=0.0005)
+
+    features = stack.reshape(3, -1).T.astype(np.float32)
+    expected_labels = np.where(mask.ravel() != 0, model.predict(features), 0).reshape(50, 40)
+    expected_confidence = np.where(mask.ravel() != 0, model.predict_proba(features).max(axis=1), 0).reshape(50, 40)
+    with rasterio.open(img_labeled) as src:
+        assert src.dtypes[0] == 'uint8' and src.nodata == 0
+        assert np.array_equal(src.read(1), expected_labels)
+    with rasterio.open(confidence_map) as src:
+        assert src.dtypes[0] == 'float32'
+        assert np.allclose(src.read(1), expected_confidence)
+
+    image_inference.classify_image(model, raw_img, mask_tif, img_labeled, confidence_map, workers=2, tile_size=16)
+    with rasterio.open(img_labeled) as src:
+        assert np.array_equal(src.read(1), expected_labels)
+    with rasterio.open(confidence_map) as src:
+        assert np.allclose(src.read(1), expected_confidence)
+
+
+def test_uncertainty_map(tmp_path) -> None:
+    """
+    Check that the uncertainty bands written with the labels are the ones of
+    the probabilities of the model, and that the same bands are computed
+    from a probability map written on another scale.
+    """
+    rng = np.random.default_rng(1)
+    stack = rng.integers(0, 1000, (2, 20, 30)).astype(np.int16)
+    mask = (rng.random((20, 30)) > 0.2).astype(np.uint8)
+    x_train = rng.integers(0, 1000, (300, 2)).astype(np.float32)
+    y_train = np.digitize(x_train[:, 0], [300, 700]).astype(np.int32) + 1
+    model = sk.RandomForestClassifier(n_estimators=10, random_state=0).fit(x_train, y_train)
+
+    raw_img, mask_tif = str(tmp_path / "stack.tif"), str(tmp_path / "mask.tif")
+    profile = {"driver": "GTiff", "width": 30, "height": 20, "transform": from_origin(0, 200, 10, 10)}
+    with rasterio.open(raw_img, 'w', count=2, dtype='int16', **profile) as dst:
+        dst.write(stack)
+    with rasterio.open(mask_tif, 'w', count=1, dtype='uint8', **profile) as dst:
+        dst.write(mask, 1)
+
+    uncertainty_map = str(tmp_path / "uncertainty.tif")
+    image_inference.classify_image(model, raw_img, mask_tif, str(tmp_path / "labeled.tif"),
+                                   str(tmp_path / "confidence.tif"), uncertainty_map=uncertainty_map)
+
+    probabilities = model.predict_proba(stack.reshape(2, -1).T.astype(np.float32))
+    ordered = np.sort(probabilities, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -np.where(probabilities > 0, probabilities * np.log(probabilities), 0).sum(axis=1) / np.log(3)
+    expected = np.stack([ordered[:, -1], ordered[:, -1] - ordered[:, -2], entropy]).reshape(3, 20, 30)
+    expected[:, mask == 0] = np.nan
+    with rasterio.open(uncertainty_map) as src:
+        assert src.count == 3 and src.descriptions == ("confidence", "margin", "entropy")
+        assert np.allclose(src.read(), expected, equal_nan=True)
+    expected_labels = model.predict(stack.reshape(2, -1).T.astype(np.float32)).reshape(20, 30)
+    with rasterio.open(str(tmp_path / "labeled.tif")) as src:
+        assert np.array_equal(src.read(1), np.where(mask != 0, expected_labels, 0))
+
+
+def test_uncertainty_method() -> None:
+    """
+    Check that the uncertainty map is rejected with an OTB method when the
+    configuration is read, and accepted with a scikit one.
+    """
+    assert Classification(method="rf_scikit", uncertainty=True).uncertainty
+    with pytest.raises(ValueError):
+        Classification(method="rf_otb", uncertainty=True)
@@ -0,0 +1,118 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_incremental_model.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import numpy as np
+import sklearn.ensemble as sk
+from sklearn.base import clone
+from sklearn.naive_bayes import GaussianNB
+
+import incremental_model
+import model_store
+
+
+def test_incremental_forest(tmp_path) -> None:
+    """
+    Check that the forest of the previous iteration is updated: the trees
+    trained on deleted samples are retired, the oldest trees make room for
+    the new ones, and a full retrain happens periodically.
+    """
+    rng = np.random.default_rng(0)
+    x_train = rng.random((400, 4), dtype=np.float32)
+    y_train = (x_train[:, 0] > 0.5).astype(np.int32) + 1
+    parameters = {"n_estimators": 20, "random_state": 0}
+    classification = {"incremental_trees": 5, "max_deleted_proportion": 0.5, "full_retrain_every": 3}
+    model_out = str(tmp_path / "model.rf_scikit")
+
+    def train(x, y):
+        classifier = incremental_model.incremental_fit(sk.RandomForestClassifier(**parameters), "rf_scikit",
+                                                       parameters, x, y, model_out, classification)
+        model_store.save_model(classifier, model_out)
+        return classifier, incremental_model.load_metadata(model_out)
+
+    _, metadata = train(x_train, y_train)
+    assert metadata["generations"] == [0] * 20
+
+    # a few samples added: the 5 oldest trees are replaced
+    classifier, metadata = train(np.vstack([x_train, x_train[:10] * 0.5]), np.concatenate([y_train, y_train[:10]]))
+    assert len(classifier.estimators_) == 20
+    assert metadata["generations"] == [0] * 15 + [1] * 5
+
+    # most of the samples of the first iterations deleted: their trees are retired
+    classifier, metadata = train(x_train[300:], y_train[300:])
+    assert metadata["generations"] == [2] * 20
+    assert sorted(incremental_model.load_rows(model_out).keys()) == [2]
+
+    # full retrain after full_retrain_every iterations
+    _, metadata = train(x_train[300:], y_train[300:])
+    assert metadata["last_full_retrain"] == 3
+
+
+def test_online_model(tmp_path) -> None:
+    """
+    Check that the online model is updated with the new samples only, and
+    trained from scratch when most of the samples it has seen are deleted.
+    """
+    rng = np.random.default_rng(0)
+    x_train = rng.random((400, 4), dtype=np.float32)
+    y_train = (x_train[:, 0] > 0.5).astype(np.int32) + 1
+    parameters = {"var_smoothing": 1e-09}
+    classification = {"max_deleted_proportion": 0.5, "full_retrain_every": 10}
+    model_out = str(tmp_path / "model.nb_scikit")
+
+    def train(x, y):
+        classifier = incremental_model.online_fit(GaussianNB(**parameters), "nb_scikit", parameters,
+                                                  x, y, model_out, classification)
+        model_store.save_model(classifier, model_out)
+        return classifier, incremental_model.load_metadata(model_out)
+
+    train(x_train[:300], y_train[:300])
+    # the 300 samples already seen are not fitted again
+    classifier, metadata = train(x_train, y_train)
+    assert classifier.class_count_.sum() == 400
+    assert metadata["last_full_retrain"] == 0
+
+    classifier, metadata = train(x_train[300:], y_train[300:])
+    assert classifier.class_count_.sum() == 100
+    assert metadata["last_full_retrain"] == 2
+
+
+def test_scaled_sgd(tmp_path) -> None:
+    """
+    Check that the online SGD classifier standardizes features of very
+    different scales, with a scaler updated by partial_fit and saved with
+    the model.
+    """
+    rng = np.random.default_rng(0)
+    x_train = rng.random((400, 2), dtype=np.float32) * np.array([1., 10000.], dtype=np.float32)
+    y_train = (x_train[:, 0] > 0.5).astype(np.int32) + 1
+    classifier = clone(incremental_model.ScaledSGDClassifier(loss="log_loss", alpha=0.0001, random_state=0))
+    classifier.fit(x_train[:300], y_train[:300])
+    classifier.partial_fit(x_train[300:], y_train[300:])
+    assert np.allclose(classifier.scaler_.mean_, x_train.mean(axis=0), rtol=1e-4)
+    assert classifier.scaler_.n_samples_seen_ == 400
+
+    model_out = str(tmp_path / "model.sgd_scikit")
+    model_store.save_model(classifier, model_out)
+    loaded = model_store.load_model(model_out)
+    assert np.array_equal(loaded.predict_proba(x_train), classifier.predict_proba(x_train))
+    assert (loaded.predict(x_train) == y_train).mean() > 0.9
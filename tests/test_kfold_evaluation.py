@@ -0,0 +1,138 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_kfold_evaluation.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import os.path as op
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from conftest import ALCDTestsData
+from test_run_alcd import prepare_test_dir
+import OTB_workflow as OTB_wf
+import kfold_evaluation
+import masks_preprocessing
+import metrics_exploitation
+import sample_extraction
+from alcd_params.params_reader import read_global_parameters, read_models_parameters
+
+
+def test_patches_mosaic(tmp_path) -> None:
+    """
+    Check that the patches of the mosaic are the neighbourhoods of the
+    validation pixels, no-data outside the image, that their centers are
+    read back in order, and that the confusion matrix is read as the one of
+    the OTB ComputeConfusionMatrix.
+    """
+    rng = np.random.default_rng(0)
+    stack = rng.integers(1, 1000, (2, 30, 25)).astype(np.int16)
+    profile = {"driver": "GTiff", "width": 25, "height": 30, "transform": from_origin(0, 300, 10, 10)}
+    raw_img, mask_tif = str(tmp_path / "stack.tif"), str(tmp_path / "mask.tif")
+    with rasterio.open(raw_img, 'w', count=2, dtype='int16', **profile) as dst:
+        dst.write(stack)
+    with rasterio.open(mask_tif, 'w', count=1, dtype='uint8', **profile) as dst:
+        dst.write(np.ones((30, 25), dtype=np.uint8), 1)
+
+    rows, cols, radius = np.array([10, 0, 29, 5, 17]), np.array([12, 0, 24, 20, 3]), 2
+    out_stack, out_mask = str(tmp_path / "patches.tif"), str(tmp_path / "patches_mask.tif")
+    kfold_evaluation.write_patches_mosaic(raw_img, mask_tif, rows, cols, radius, out_stack, out_mask)
+
+    # patches of 5 x 5 pixels on a grid of 2 rows and 3 columns
+    with rasterio.open(out_stack) as src:
+        assert (src.count, src.height, src.width) == (2, 10, 15)
+        mosaic = src.read()
+    assert np.array_equal(mosaic[:, 0:5, 0:5], stack[:, 8:13, 10:15])
+    assert np.array_equal(mosaic[:, 0:5, 5:10][:, 2:, 2:], stack[:, 0:3, 0:3])
+    assert not mosaic[:, 0:5, 5:10][:, :2].any() and not mosaic[:, 0:5, 5:10][:, :, :2].any()
+    with rasterio.open(out_mask) as src:
+        mask = src.read(1)
+    assert mask[0:5, 0:5].all() and mask[0:5, 5:10][2:, 2:].all() and not mask[0:5, 5:10][:2].any()
+    assert not mask[5:10, 10:15].any()
+
+    # the centers of the patches, here the first band of the stack
+    assert np.array_equal(kfold_evaluation.read_patches_centers(out_stack, len(rows), radius), stack[0, rows, cols])
+
+    conf_matrix = str(tmp_path / "confusion_matrix.csv")
+    reference, produced = np.array([1, 1, 2, 2, 5, 5]), np.array([1, 2, 2, 2, 0, 3])
+    kfold_evaluation.write_confusion_matrix(reference, produced, conf_matrix)
+    classes, matrix = metrics_exploitation.matrix_loading(conf_matrix)
+    # the pixel produced as no-data is ignored
+    assert classes == [1, 2, 3, 5]
+    assert np.array_equal(matrix, [[1, 1, 0, 0], [0, 2, 0, 0], [0, 0, 0, 0], [0, 0, 1, 0]])
+
+    # all the pixels produced as no-data
+    kfold_evaluation.write_confusion_matrix(reference, np.zeros_like(produced), conf_matrix)
+    classes, matrix = metrics_exploitation.matrix_loading(conf_matrix)
+    assert classes == [1, 2, 5]
+    assert not matrix.any()
+
+
+def test_evaluate_fold(alcd_paths: ALCDTestsData) -> None:
+    """
+    Check that the validation pixels are the ones of the squares and polygons
+    of the extended validation shapefile, and that their labels in the
+    regularized mosaic of patches are the ones of the regularized full image.
+    """
+    output_dir = alcd_paths.data_dir / "test_kfold_evaluation" / "Toulouse_31TCJ_20240305"
+    global_param_file, _ = prepare_test_dir(alcd_paths, output_dir, "rf_scikit")
+    global_parameters = read_global_parameters(global_param_file)
+    model_parameters = read_models_parameters(alcd_paths.cfg / "model_parameters.json")
+
+    OTB_wf.create_directories(global_parameters)
+    masks_preprocessing.masks_preprocess(global_parameters)
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    raw_img = op.join(main_dir, 'In_data', 'Image', global_parameters["user_choices"]["raw_img"])
+    validation_shp = op.join(main_dir, 'Intermediate', global_parameters["general"]["validation_shp"])
+    validation_shp_extended = op.join(main_dir, 'Intermediate', global_parameters["general"]["validation_shp_extended"])
+    max_dist = float(global_parameters["training_parameters"]["expansion_distance"])
+
+    rows, cols, classes = kfold_evaluation.read_validation_pixels(validation_shp, validation_shp_extended,
+                                                                  raw_img, max_dist)
+    polygons, _ = sample_extraction.read_polygons(validation_shp_extended)
+    _, pixels = sample_extraction.polygons_pixels(raw_img, polygons)
+    expected = {(row, col) for k in pixels for row, col in zip(*(a.tolist() for a in pixels[k]))}
+    assert set(zip(rows.tolist(), cols.tolist())) == expected
+    # every pixel of the squares is counted, not only the one of the point
+    assert len(rows) > len(sample_extraction.read_points(validation_shp)[0])
+
+    sample_extraction.extract_samples(global_parameters)
+    OTB_wf.train_model(global_parameters, model_parameters, shell=False, incremental=False)
+    conf_matrix = kfold_evaluation.evaluate_fold(global_parameters)
+    reference_classes, _ = metrics_exploitation.matrix_loading(conf_matrix)
+    assert set(reference_classes) >= set(np.unique(classes).tolist())
+
+    # same labels as the full image, away from its edges
+    radius = int(global_parameters["training_parameters"]["regularization_radius"])
+    labeled, regularized = str(output_dir / "Out" / "labeled.tif"), str(output_dir / "Out" / "regularized.tif")
+    mask_tif = op.join(main_dir, 'In_data', 'Masks', global_parameters["general"]["no_data_mask"])[0:-4] + '.tif'
+    OTB_wf.scikit_class(raw_img=raw_img, model=op.join(main_dir, 'Models', 'model.rf_scikit'), img_labeled=labeled,
+                        confidence_map=str(output_dir / "Out" / "confidence_full.tif"), mask_tif=mask_tif,
+                        shell=False)
+    OTB_wf.regularize(labeled, regularized, radius)
+    with rasterio.open(regularized) as src:
+        full_labels = src.read(1)
+    patches_labels = kfold_evaluation.read_patches_centers(
+        op.join(main_dir, 'Intermediate', 'kfold_patches_regularized.tif'), len(rows), radius)
+    inside = (rows >= radius) & (rows < full_labels.shape[0] - radius) & \
+        (cols >= radius) & (cols < full_labels.shape[1] - radius)
+    assert np.array_equal(patches_labels[inside], full_labels[rows[inside], cols[inside]])
@@ -0,0 +1,65 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_labeling_suggestions.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+import labeling_suggestions
+
+
+def test_sample_suggestions(tmp_path) -> None:
+    """
+    Check that at most one pixel per cell is suggested, the least confident
+    one, outside the no-data, the undecided and the confident pixels, and that the pixels
+    are ranked by the margin of the uncertainty map when it is given.
+    """
+    confidence = np.full((20, 30), 0.9, dtype=np.float32)
+    labels = np.full((20, 30), 2, dtype=np.uint8)
+    # two uncertain pixels in the first cell, one in the last (partial) one
+    confidence[1, 2], confidence[3, 4], confidence[15, 25] = 0.4, 0.5, 0.6
+    # an uncertain pixel outside the no-data mask, and one left undecided by the regularization
+    confidence[12, 3], labels[12, 3] = 0., 0
+    confidence[5, 15], labels[5, 15] = 0., 20
+
+    profile = {"driver": "GTiff", "width": 30, "height": 20, "count": 1, "transform": from_origin(0, 200, 10, 10)}
+    labeled_tif, confidence_map = str(tmp_path / "labeled.tif"), str(tmp_path / "confidence.tif")
+    with rasterio.open(labeled_tif, 'w', dtype='uint8', **profile) as dst:
+        dst.write(labels, 1)
+    with rasterio.open(confidence_map, 'w', dtype='float32', **profile) as dst:
+        dst.write(confidence, 1)
+
+    suggestions = labeling_suggestions.sample_suggestions(labeled_tif, confidence_map, cell_size=10, number=10)
+    assert [(s["row"], s["col"]) for s in suggestions] == [(1, 2), (15, 25)]
+    assert suggestions[0]["label"] == 2 and np.isclose(suggestions[0]["score"], 0.6)
+    assert len(labeling_suggestions.sample_suggestions(labeled_tif, confidence_map, cell_size=10, number=1)) == 1
+    assert not labeling_suggestions.sample_suggestions(labeled_tif, confidence_map, cell_size=10, max_confidence=0.3)
+
+    # ranked by the margin between the two most probable classes
+    margin = np.ones((20, 30), dtype=np.float32)
+    margin[1, 2], margin[3, 4], margin[15, 25] = 0.3, 0.05, 0.1
+    uncertainty_map = str(tmp_path / "uncertainty.tif")
+    with rasterio.open(uncertainty_map, 'w', dtype='float32', **dict(profile, count=3)) as dst:
+        dst.write(np.stack([confidence, margin, np.zeros_like(margin)]))
+    suggestions = labeling_suggestions.sample_suggestions(labeled_tif, confidence_map, uncertainty_map, cell_size=10)
+    assert [(s["row"], s["col"]) for s in suggestions] == [(3, 4), (15, 25)]
@@ -0,0 +1,57 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_labels_index.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import numpy as np
+from affine import Affine
+
+import labels_index
+import sample_extraction
+
+
+def test_duplicates_and_conflicts() -> None:
+    """
+    Check that the points are snapped to the pixel they fall in, and that
+    the points sharing a pixel are sorted into duplicates and conflicts.
+    """
+    transform = Affine(60., 0., 1000., 0., -60., 5000.)
+    # two points of class 2 in pixel (1, 1), classes 2 and 3 in pixel (4, 4),
+    # class 2 in pixel (6, 6) and class 3 in pixel (7, 7)
+    xs = np.array([1061., 1119., 1250., 1270., 1390., 1450.])
+    ys = np.array([4939., 4881., 4750., 4730., 4610., 4550.])
+    classes = np.array([2, 2, 2, 3, 2, 3])
+
+    rows, cols = labels_index.snap_to_pixels(xs, ys, transform)
+    assert rows.tolist() == [1, 1, 4, 4, 6, 7]
+    assert cols.tolist() == [1, 1, 4, 4, 6, 7]
+
+    duplicates, conflicts = labels_index.find_duplicates(labels_index.pixel_groups(rows, cols), classes)
+    assert duplicates == [1]
+    assert conflicts == [[2, 3]]
+
+    # the squares of the two last points share some pixels, the ones of
+    # the first points overlap but have the same class
+    windows = sample_extraction.points_to_windows(xs, ys, transform, 20, 20, 100., 100.)
+    overlaps = labels_index.find_overlapping_squares(windows, classes)
+    assert (4, 5) in overlaps and (2, 3) in overlaps
+    assert (0, 1) not in overlaps
+    assert all(classes[k] != classes[j] for k, j in overlaps)
@@ -0,0 +1,91 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_model_compression.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import json
+import os.path as op
+
+import numpy as np
+import sklearn.ensemble as sk
+
+from conftest import ALCDTestsData
+from test_run_alcd import prepare_test_dir
+import OTB_workflow as OTB_wf
+import all_run_alcd
+import masks_preprocessing
+import model_compression
+import model_store
+import sample_extraction
+from alcd_params.params_reader import read_global_parameters, read_models_parameters
+
+
+def test_compress_forest() -> None:
+    """
+    Check the sizes of the compressed forests, and that the trees selected
+    by the pruning are the ones improving the accuracy.
+    """
+    rng = np.random.default_rng(0)
+    x_train = rng.random((600, 5), dtype=np.float32)
+    y_train = (x_train[:, 0] + 0.2 * x_train[:, 1] > 0.6).astype(np.int32) + 1
+    x_validation = rng.random((400, 5), dtype=np.float32)
+    y_validation = (x_validation[:, 0] + 0.2 * x_validation[:, 1] > 0.6).astype(np.int32) + 1
+    forest = sk.RandomForestClassifier(n_estimators=30, random_state=0).fit(x_train, y_train)
+    compression = {"trees": 5, "max_depth": 3, "distilled_trees": 4, "repeats": 1}
+
+    models, report = model_compression.compress_forest(forest, x_train, y_train, x_validation, y_validation,
+                                                       compression, seed=0)
+    assert len(models["pruned"].estimators_) == 5
+    assert len(forest.estimators_) == 30
+    assert report["depth"]["max_depth"] <= 3 and report["distilled"]["trees"] == 4
+    assert set(report.keys()) == {"none", "pruned", "depth", "distilled"}
+
+    # a perfect tree is selected first
+    probabilities = np.array([[[1., 0.], [1., 0.]], [[1., 0.], [0., 1.]], [[0., 1.], [0., 1.]]])
+    assert model_compression.select_trees(probabilities, np.array([0, 1]), 2)[0] == 1
+
+    report = {"pruned": {"accuracy_delta": -0.01, "speedup": 6.}, "depth": {"accuracy_delta": 0., "speedup": 2.},
+              "distilled": {"accuracy_delta": -0.002, "speedup": 4.}}
+    assert model_compression.choose_model(report, "auto", 0.005) == "distilled"
+
+
+def test_compress_selected_model(alcd_paths: ALCDTestsData) -> None:
+    """
+    Check that the model trained again on the top_n features is compressed
+    on the same features.
+    """
+    output_dir = alcd_paths.data_dir / "test_model_compression" / "Toulouse_31TCJ_20240305"
+    global_param_file, _ = prepare_test_dir(alcd_paths, output_dir, "rf_scikit")
+    global_parameters = read_global_parameters(global_param_file)
+    global_parameters["features"]["top_n"] = 3
+    global_parameters["compression"].update({"enabled": True, "apply": "depth", "repeats": 1})
+    model_parameters = read_models_parameters(alcd_paths.cfg / "model_parameters.json")
+
+    OTB_wf.create_directories(global_parameters)
+    masks_preprocessing.masks_preprocess(global_parameters)
+    sample_extraction.extract_samples(global_parameters)
+    assert all_run_alcd.train_and_classify(global_parameters, model_parameters)
+
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    compressed = model_compression.get_compressed_path(op.join(main_dir, 'Models', 'model.rf_scikit'))
+    assert model_store.load_model(compressed, cache=False).n_features_in_ == 3
+    with open(op.join(main_dir, 'Statistics', global_parameters["compression"]["report"]), 'r') as json_file:
+        assert json.load(json_file)["chosen"] == "depth"
@@ -0,0 +1,53 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_model_store.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import os
+
+import numpy as np
+import sklearn.ensemble as sk
+
+import model_store
+
+
+def test_model_cache(tmp_path) -> None:
+    """
+    Check that a saved model gives the same predictions once loaded, that it
+    is loaded once from the cache, and loaded again when it is rewritten.
+    """
+    rng = np.random.default_rng(0)
+    x_train = rng.random((200, 3), dtype=np.float32)
+    y_train = (x_train[:, 0] > 0.5).astype(np.int32) + 1
+    classifier = sk.RandomForestClassifier(n_estimators=5, random_state=0).fit(x_train, y_train)
+    model_out = str(tmp_path / "model.rf_scikit")
+
+    model_store.save_model(classifier, model_out, {"method": "rf_scikit"})
+    assert model_store.load_training_metadata(model_out)["method"] == "rf_scikit"
+
+    model = model_store.load_model(model_out)
+    np.testing.assert_array_equal(model.predict_proba(x_train), classifier.predict_proba(x_train))
+    assert model_store.load_model(model_out) is model
+
+    model_store.save_model(classifier, model_out)
+    os.utime(model_out, ns=(0, 0))
+    assert model_store.load_model(model_out) is not model
+    model_store.clear_cache()
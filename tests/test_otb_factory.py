@@ -0,0 +1,86 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_otb_factory.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import json
+
+import numpy as np
+import rasterio
+from affine import Affine
+
+import otb_factory
+
+
+def test_application_report(tmp_path) -> None:
+    """
+    Run a BandMathX through the factory, and check that its output has the
+    extended filename options and that its execution is in the run report.
+    """
+    otb_factory.configure({"user_choices": {"main_dir": str(tmp_path)},
+                           "otb": {"ram": 128, "threads": None, "compression": "DEFLATE",
+                                   "tiled": False, "report": "otb_report.json"}})
+
+    in_tif = str(tmp_path / "in.tif")
+    out_tif = str(tmp_path / "out.tif")
+    with rasterio.open(in_tif, "w", driver="GTiff", width=30, height=20, count=1, dtype="uint8",
+                       transform=Affine(60., 0., 1000., 0., -60., 5000.)) as dst:
+        dst.write(np.ones((1, 20, 30), dtype=np.uint8))
+
+    BandMathX = otb_factory.create_application("BandMathX")
+    BandMathX.SetParameterStringList("il", [in_tif])
+    BandMathX.SetParameterString("out", out_tif)
+    BandMathX.SetParameterString("exp", "im1b1 * 2")
+    BandMathX.ExecuteAndWriteOutput()
+
+    with rasterio.open(out_tif) as src:
+        assert src.profile.get("compress", "").lower() == "deflate"
+        assert src.read(1).max() == 2
+
+    with open(tmp_path / "Statistics" / "otb_report.json") as json_file:
+        report = json.load(json_file)
+    assert report["ram"] == 128
+    record = report["applications"][-1]
+    assert record["application"] == "BandMathX" and record["written"]
+    assert record["pixels"] == 30 * 20
+    assert record["wall_time_s"] >= 0 and record["process_peak_rss_mb"] > 0
+    assert 0 <= record["peak_rss_increase_mb"] <= record["process_peak_rss_mb"]
+
+
+def test_shell_report(tmp_path) -> None:
+    """
+    Check that the shell applications are recorded, and that a new
+    configuration starts an empty report.
+    """
+    configuration = {"user_choices": {"main_dir": str(tmp_path)},
+                     "otb": {"ram": None, "threads": None, "compression": None, "tiled": False,
+                             "report": "otb_report.json"}}
+    otb_factory.configure(configuration)
+    assert otb_factory.run_shell("ImageClassifier", "exit 3") == 3
+    otb_factory.configure(configuration)
+    assert otb_factory.run_shell("TrainVectorClassifier", "true") == 0
+
+    with open(tmp_path / "Statistics" / "otb_report.json") as json_file:
+        report = json.load(json_file)
+    assert [record["application"] for record in report["applications"]] == ["TrainVectorClassifier"]
+    record = report["applications"][0]
+    assert record["shell"] and record["written"] and record["pixels"] is None
+    assert record["wall_time_s"] >= 0
@@ -0,0 +1,73 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_pipeline.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import numpy as np
+import rasterio
+from affine import Affine
+from osgeo import gdal
+
+import OTB_workflow as OTB_wf
+import otb_factory
+
+
+def test_intermediate_output(tmp_path) -> None:
+    """
+    Check that the intermediate outputs are passed in memory in pipelined
+    mode only, never through the shell, and that the memory written by an
+    OTB application is freed.
+    """
+    (tmp_path / "Out").mkdir()
+    global_parameters = {"user_choices": {"main_dir": str(tmp_path)},
+                         "general": {"img_labeled": "labeled_img.tif"},
+                         "pipeline": {"pipelined": False, "keep": []},
+                         "otb": {"ram": 128, "threads": None, "compression": None, "tiled": False,
+                                 "report": "otb_report.json"}}
+    out_file = str(tmp_path / "Out" / "labeled_img.tif")
+    assert OTB_wf.intermediate_output(global_parameters, 'Out', "img_labeled") == out_file
+
+    # the previous file is removed, not to be taken for the output
+    (tmp_path / "Out" / "labeled_img.tif").write_bytes(b"")
+    global_parameters["pipeline"]["pipelined"] = True
+    assert OTB_wf.intermediate_output(global_parameters, 'Out', "img_labeled", shell=True) == out_file
+    in_memory = OTB_wf.intermediate_output(global_parameters, 'Out', "img_labeled")
+    assert in_memory == "/vsimem/labeled_img.tif" and not (tmp_path / "Out" / "labeled_img.tif").exists()
+    global_parameters["pipeline"]["keep"] = ["img_labeled"]
+    assert OTB_wf.intermediate_output(global_parameters, 'Out', "img_labeled") == out_file
+
+    assert not OTB_wf.release_intermediate(out_file)
+    assert not OTB_wf.release_intermediate("/vsimem/not_written.tif")
+
+    # written in memory by OTB, then freed
+    otb_factory.configure(global_parameters)
+    in_tif = str(tmp_path / "in.tif")
+    with rasterio.open(in_tif, "w", driver="GTiff", width=30, height=20, count=1, dtype="uint8",
+                       transform=Affine(60., 0., 1000., 0., -60., 5000.)) as dst:
+        dst.write(np.ones((1, 20, 30), dtype=np.uint8))
+    BandMathX = otb_factory.create_application("BandMathX")
+    BandMathX.SetParameterStringList("il", [in_tif])
+    BandMathX.SetParameterString("out", in_memory)
+    BandMathX.SetParameterString("exp", "im1b1 * 2")
+    BandMathX.ExecuteAndWriteOutput()
+    assert gdal.VSIStatL(in_memory) is not None
+    assert OTB_wf.release_intermediate(in_memory)
+    assert gdal.VSIStatL(in_memory) is None
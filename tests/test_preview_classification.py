@@ -0,0 +1,66 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_preview_classification.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import os
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+import preview_classification
+
+
+def test_prepare_inputs(tmp_path, monkeypatch) -> None:
+    """
+    Check that the stack and the mask are decimated to one pixel of each
+    block of factor x factor pixels, on pixels factor times larger, and that
+    they are only written again when the full resolution ones change.
+    """
+    rng = np.random.default_rng(0)
+    stack = rng.integers(0, 1000, (3, 42, 37)).astype(np.int16)
+    profile = {"driver": "GTiff", "width": 37, "height": 42, "transform": from_origin(100, 420, 10, 10)}
+    raw_img, mask_tif = str(tmp_path / "stack.tif"), str(tmp_path / "mask.tif")
+    with rasterio.open(raw_img, 'w', count=3, dtype='int16', **profile) as dst:
+        dst.write(stack)
+    with rasterio.open(mask_tif, 'w', count=1, dtype='uint8', **profile) as dst:
+        dst.write(np.ones((42, 37), dtype=np.uint8), 1)
+
+    # blocks of a few rows
+    monkeypatch.setattr(preview_classification, "PREVIEW_ROWS", 3)
+    out_dir = str(tmp_path / "Intermediate")
+    preview_img, preview_mask = preview_classification.prepare_inputs(raw_img, mask_tif, 4, out_dir)
+    with rasterio.open(preview_img) as src:
+        assert (src.count, src.height, src.width) == (3, 10, 9)
+        assert src.res == (40, 40) and (src.transform.c, src.transform.f) == (100, 420)
+        decimated = src.read()
+    # one pixel of each block, at the same position in every block
+    blocks = stack[:, :40, :36].reshape(3, 10, 4, 9, 4)
+    positions = [(i, j) for i in range(4) for j in range(4) if np.array_equal(decimated, blocks[:, :, i, :, j])]
+    assert len(positions) == 1
+    with rasterio.open(preview_mask) as src:
+        assert (src.height, src.width) == (10, 9) and src.read(1).all()
+
+    # not written again if the stack did not change
+    modified = os.path.getmtime(preview_img)
+    assert preview_classification.prepare_inputs(raw_img, mask_tif, 4, out_dir) == (preview_img, preview_mask)
+    assert os.path.getmtime(preview_img) == modified
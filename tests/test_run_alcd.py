@@ -22,7 +22,7 @@ https://www.gnu.org/licenses/gpl-3.0.fr.html
 """
 
 import json
-import pickle
+import joblib
 import shutil
 import rasterio
 import sqlite3
@@ -244,7 +244,7 @@ def test_scikit_alcd(alcd_paths: ALCDTestsData) -> None:
     assert alcd_results, f"some output files are missing: {', '.join(file_name for file_name, exists in details.items() if not exists)}"
 
     model_path = alcd_paths.data_dir / "test_scikit_alcd" / "Toulouse_31TCJ_20240305" / "Models"
-    model = pickle.load(open(model_path / "model.rf_scikit", 'rb'))
+    model = joblib.load(model_path / "model.rf_scikit", mmap_mode='r')
     assert isinstance(model, BaseEstimator), f"Expected a scikit-learn model, got {type(model)}"
 
 
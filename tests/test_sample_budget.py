@@ -0,0 +1,50 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_sample_budget.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import numpy as np
+import sklearn.ensemble as sk
+
+import sample_budget
+
+
+def test_learning_curve() -> None:
+    """
+    Check that the learning curve caps the classes at increasing numbers of
+    samples, and that the smallest budget of the plateau is chosen.
+    """
+    rng = np.random.default_rng(0)
+    x_train = rng.random((1000, 3), dtype=np.float32)
+    y_train = (x_train[:, 0] > 0.3).astype(np.int32) + 1
+    x_validation = rng.random((500, 3), dtype=np.float32)
+    y_validation = (x_validation[:, 0] > 0.3).astype(np.int32) + 1
+    classifier = sk.RandomForestClassifier(n_estimators=10, random_state=0)
+
+    curve = sample_budget.learning_curve(classifier, x_train, y_train, x_validation, y_validation, [0.1, 0.5], seed=0)
+    largest = int(np.bincount(y_train).max())
+    assert [point["budget"] for point in curve] == [round(0.1 * largest), round(0.5 * largest), largest]
+    assert curve[0]["samples_nb"] == 2 * curve[0]["budget"] and curve[-1]["samples_nb"] == 1000
+
+    curve = [{"budget": 100, "accuracy": 0.90}, {"budget": 400, "accuracy": 0.978},
+             {"budget": 800, "accuracy": 0.985}, {"budget": 1600, "accuracy": 0.982}]
+    assert sample_budget.choose_budget(curve, 0.005) == 400
+    assert sample_budget.choose_budget(curve, 0.) == 800
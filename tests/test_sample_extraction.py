@@ -0,0 +1,256 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_sample_extraction.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import json
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+import rasterio
+from affine import Affine
+
+from conftest import ALCDTestsData
+from test_run_alcd import prepare_test_dir
+import OTB_workflow as OTB_wf
+import expand_point_region
+import masks_preprocessing
+import sample_extraction
+import sample_store
+from alcd_params.params_reader import read_global_parameters
+
+
+def read_samples_table(samples_sqlite: str) -> pd.DataFrame:
+    """Read the class and features of a samples table, sorted to be comparable."""
+    connex = sqlite3.connect(str(samples_sqlite))
+    samples = pd.read_sql_query("SELECT * FROM output", connex)
+    connex.close()
+    columns = ["class"] + list(samples.columns)[4:]
+    return samples[columns].sort_values(columns).reset_index(drop=True)
+
+
+def test_points_to_windows() -> None:
+    """
+    Check that the windows contain the pixels whose centre is strictly inside
+    the square around each point, clipped to the image.
+    """
+    transform = Affine(60., 0., 1000., 0., -60., 5000.)
+    xs = np.array([1000. + 60. * 5, 1000. + 60. * 5.5, 1010.])
+    ys = np.array([5000. - 60. * 5, 5000. - 60. * 5.5, 4990.])
+
+    windows = sample_extraction.points_to_windows(xs, ys, transform, 20, 20, 100., 100.)
+
+    # point on a pixel corner: 4 pixels on each side have their centre within 100 m
+    assert (windows[0].col_off, windows[0].row_off, windows[0].width, windows[0].height) == (3, 3, 4, 4)
+    # point on a pixel centre: the centre pixel and one on each side
+    assert (windows[1].col_off, windows[1].row_off, windows[1].width, windows[1].height) == (4, 4, 3, 3)
+    # point in the upper left corner of the image
+    assert (windows[2].col_off, windows[2].row_off, windows[2].width, windows[2].height) == (0, 0, 2, 2)
+
+
+def test_samples_nb_per_class() -> None:
+    """
+    Check the numbers of samples given by the selection strategies, and that
+    the budget not used by a capped or small class goes to the other ones,
+    every class keeping the minimum number of samples.
+    """
+    samples_per_class = {1: 100, 2: 10, 3: 10000}
+
+    assert sample_extraction.get_samples_nb_per_class(samples_per_class, "smallest") == {1: 10, 2: 10, 3: 10}
+    assert sample_extraction.get_samples_nb_per_class(samples_per_class, "constant_50") == {1: 50, 2: 10, 3: 50}
+    assert sample_extraction.get_samples_nb_per_class(samples_per_class, "proportional_1000") == {1: 9, 2: 1, 3: 990}
+    assert sample_extraction.get_samples_nb_per_class(samples_per_class, "proportional_1000",
+                                                      min_samples=20) == {1: 20, 2: 10, 3: 970}
+    assert sample_extraction.get_samples_nb_per_class(samples_per_class, "sqrt_1000") == {1: 89, 2: 10, 3: 901}
+    assert sample_extraction.get_samples_nb_per_class(samples_per_class, "sqrt_1000", {3: 200}) == {1: 100, 2: 10, 3: 200}
+    assert sample_extraction.get_samples_nb_per_class(samples_per_class, "all", {1: 20}) == {1: 20, 2: 10, 3: 10000}
+
+
+def test_polygons_pixels(tmp_path) -> None:
+    """
+    Check that the pixels of a polygon are the ones whose centre is inside,
+    and that the number of pixels per polygon is capped.
+    """
+    transform = Affine(60., 0., 1000., 0., -60., 5000.)
+    raw_img = str(tmp_path / "stack.tif")
+    values = np.arange(2 * 20 * 20, dtype=np.int16).reshape(2, 20, 20)
+    with rasterio.open(raw_img, "w", driver="GTiff", width=20, height=20, count=2,
+                       dtype="int16", transform=transform) as dst:
+        dst.write(values)
+
+    # covers the centres of the pixels of rows 2 to 4 and columns 3 to 6
+    polygon = {"type": "Polygon", "coordinates": [[(1170., 4870.), (1410., 4870.), (1410., 4700.),
+                                                   (1170., 4700.), (1170., 4870.)]]}
+    outside = {"type": "Polygon", "coordinates": [[(0., 0.), (10., 0.), (10., 10.), (0., 0.)]]}
+    windows, pixels = sample_extraction.read_polygons_pixels(raw_img, [polygon, outside])
+
+    assert windows[1] is None and 1 not in pixels
+    rows, cols, features = pixels[0]
+    assert sorted(set(rows.tolist())) == [2, 3, 4]
+    assert sorted(set(cols.tolist())) == [3, 4, 5, 6]
+    assert np.array_equal(features, values[:, rows, cols].T)
+
+    capped = sample_extraction.cap_pixels(pixels, [0], 5, seed=1)
+    assert len(capped[0][0]) == 5 and len(capped[0][2]) == 5
+
+
+def test_pixels_squares(tmp_path) -> None:
+    """
+    Check that the small squares written for a capped validation polygon
+    cover its kept pixels only.
+    """
+    transform = Affine(60., 0., 1000., 0., -60., 5000.)
+    raw_img = str(tmp_path / "stack.tif")
+    with rasterio.open(raw_img, "w", driver="GTiff", width=20, height=20, count=1,
+                       dtype="int16", transform=transform) as dst:
+        dst.write(np.zeros((1, 20, 20), dtype=np.int16))
+
+    rows, cols = np.array([2, 2, 3, 7]), np.array([3, 4, 3, 19])
+    squares = expand_point_region.pixels_squares(transform, rows, cols)
+    _, squares_pixels = sample_extraction.polygons_pixels(raw_img, [json.loads(squares.ExportToJson())])
+    assert sorted(zip(*(a.tolist() for a in squares_pixels[0]))) == sorted(zip(rows.tolist(), cols.tolist()))
+
+
+def test_feature_cache(tmp_path) -> None:
+    """
+    Check that the pixels of the squares are read from the feature cache
+    when the points are in it, from the stack otherwise, and that the cache
+    is discarded when the stack changes.
+    """
+    transform = Affine(60., 0., 1000., 0., -60., 5000.)
+    raw_img = str(tmp_path / "stack.tif")
+    values = np.arange(2 * 20 * 20, dtype=np.int16).reshape(2, 20, 20)
+    with rasterio.open(raw_img, "w", driver="GTiff", width=20, height=20, count=2,
+                       dtype="int16", transform=transform) as dst:
+        dst.write(values)
+
+    xs, ys = np.array([1150., 1630.]), np.array([4850., 4430.])
+    windows = sample_extraction.points_to_windows(xs, ys, transform, 20, 20, 70., 70.)
+    keys = sample_extraction.point_keys(xs, ys, 70.)
+    cache = {}
+    pixels = sample_extraction.read_windows(raw_img, windows, keys, cache)
+    assert sorted(cache.keys()) == sorted(keys)
+    rows, cols, features = pixels[0]
+    assert np.array_equal(features, values[:, rows, cols].T)
+
+    cache_file = str(tmp_path / "feature_cache.npz")
+    stack_id = sample_extraction.get_stack_id(raw_img)
+    sample_extraction.save_feature_cache(cache_file, stack_id, cache)
+    loaded = sample_extraction.load_feature_cache(cache_file, stack_id)
+    assert all(np.array_equal(a, b) for key in keys for a, b in zip(loaded[key], cache[key]))
+
+    # the cached points are not read again, only the new one
+    loaded[keys[0]] = (rows, cols, np.full_like(features, -1))
+    new_keys = sample_extraction.point_keys(np.array([1390.]), np.array([4610.]), 70.)
+    windows = windows + sample_extraction.points_to_windows(np.array([1390.]), np.array([4610.]),
+                                                            transform, 20, 20, 70., 70.)
+    pixels = sample_extraction.read_windows(raw_img, windows, keys + new_keys, loaded)
+    assert (pixels[0][2] == -1).all()
+    assert np.array_equal(pixels[2][2], values[:, pixels[2][0], pixels[2][1]].T)
+    assert new_keys[0] in loaded
+
+    # another stack, or the same point with another expansion distance, is not in the cache
+    assert sample_extraction.point_keys(xs[:1], ys[:1], 130.)[0] not in loaded
+    with rasterio.open(raw_img, "w", driver="GTiff", width=20, height=20, count=2,
+                       dtype="int16", transform=transform * Affine.translation(1, 0)) as dst:
+        dst.write(values)
+    assert sample_extraction.load_feature_cache(cache_file, sample_extraction.get_stack_id(raw_img)) == {}
+
+    sample_extraction.save_feature_cache(cache_file, stack_id, {})
+    assert not os.path.exists(cache_file)
+
+
+def test_sample_store(tmp_path) -> None:
+    """
+    Check that a store written from the samples table is memory-mapped back
+    as float32 features and int32 classes, in the order of the table.
+    """
+    features = np.arange(12, dtype=np.float64).reshape(4, 3) / 7.
+    labels = np.array([2, 3, 2, 7])
+    store_dir = str(tmp_path / "store")
+
+    sample_store.write_sample_store(store_dir, features, labels, ["band_0", "band_1", "band_2"])
+    x_train, y_train, feature_names = sample_store.load_sample_store(store_dir)
+
+    assert isinstance(x_train, np.memmap)
+    assert x_train.dtype == np.float32 and y_train.dtype == np.int32
+    assert np.array_equal(x_train, features.astype(np.float32))
+    assert y_train.tolist() == [2, 3, 2, 7]
+    assert feature_names == ["band_0", "band_1", "band_2"]
+
+
+def test_samples_table_loading(tmp_path) -> None:
+    """
+    Check that the feature columns are read from the schema of the samples
+    table, and that the chunked loader gives float32 features in row order.
+    """
+    samples_sqlite = str(tmp_path / "samples.sqlite")
+    connex = sqlite3.connect(samples_sqlite)
+    connex.execute('CREATE TABLE output (ogc_fid INTEGER PRIMARY KEY, GEOMETRY BLOB, class INTEGER, '
+                   'originfid INTEGER, band_0 REAL, band_1 REAL)')
+    rows = [(None, None, 2 + k % 3, k, k / 3., -k) for k in range(25)]
+    connex.executemany('INSERT INTO output VALUES (?, ?, ?, ?, ?, ?)', rows)
+    connex.commit()
+    connex.close()
+
+    feature_names = sample_store.get_feature_columns(samples_sqlite)
+    assert feature_names == ["band_0", "band_1"]
+
+    features, labels = sample_store.load_samples_table(samples_sqlite, feature_names, chunk_size=7)
+    assert features.dtype == np.float32 and features.shape == (25, 2)
+    assert np.array_equal(features[:, 0], (np.arange(25) / 3.).astype(np.float32))
+    assert labels.tolist() == [2 + k % 3 for k in range(25)]
+
+
+def test_raster_engine_matches_otb(alcd_paths: ALCDTestsData) -> None:
+    """
+    Extract the training samples of the reference run with the OTB chain and
+    with the raster engine, and check that both tables contain exactly the
+    same samples.
+
+    The reference labels give less than 8000 pixels per class, so both
+    engines keep all the candidates and the random selection does not matter.
+    """
+    output_dir = alcd_paths.data_dir / "test_sample_extraction" / "Toulouse_31TCJ_20240305"
+    global_param_file, _ = prepare_test_dir(alcd_paths, output_dir, "rf_otb")
+    global_parameters = read_global_parameters(global_param_file)
+
+    OTB_wf.create_directories(global_parameters)
+    masks_preprocessing.masks_preprocess(global_parameters)
+
+    OTB_wf.compute_samples_stats(global_parameters)
+    OTB_wf.select_samples(global_parameters, strategy="constant_8000")
+    otb_samples = read_samples_table(OTB_wf.extract_samples(global_parameters))
+
+    global_parameters["general"]["training_samples_extracted"] = "training_samples_extracted_raster.sqlite"
+    raster_samples = read_samples_table(
+        sample_extraction.extract_samples(global_parameters, strategy="constant_8000"))
+
+    assert len(otb_samples) > 0
+    assert list(otb_samples.columns) == list(raster_samples.columns)
+    assert otb_samples["class"].tolist() == raster_samples["class"].tolist()
+    assert np.array_equal(otb_samples.to_numpy(), raster_samples.to_numpy())
+
+    # the store written by the raster engine holds the same samples as its table
+    x_train, y_train, _ = sample_store.load_sample_store(sample_store.get_store_path(global_parameters))
+    assert sorted(y_train.tolist()) == otb_samples["class"].tolist()
+    assert x_train.shape == (len(otb_samples), otb_samples.shape[1] - 1)
@@ -0,0 +1,113 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_split_samples.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+from osgeo import ogr
+
+from conftest import ALCDTestsData
+from test_run_alcd import prepare_test_dir
+import OTB_workflow as OTB_wf
+import masks_preprocessing
+import merge_shapefiles
+import labels_state
+import split_samples
+from alcd_params.params_reader import read_global_parameters
+
+
+def read_points(in_shp: str) -> list:
+    """Read the coordinates and class of the points of a shapefile."""
+    inDataSource = ogr.GetDriverByName("ESRI Shapefile").Open(str(in_shp), 0)
+    points = [(point.GetGeometryRef().GetX(0), point.GetGeometryRef().GetY(0), point.GetField("class"))
+              for point in inDataSource.GetLayer()]
+    inDataSource.Destroy()
+    return points
+
+
+def test_k_split(alcd_paths: ALCDTestsData, tmp_path) -> None:
+    """
+    Split the reference labels in 11 folds, and check that each point is in
+    exactly one validation fold, and in the training set of all the others.
+    """
+    masks_dir = alcd_paths.reference_run / "In_data" / "Masks"
+    layers = ["background", "clouds_shadows", "high_clouds", "land", "low_clouds", "snow", "water"]
+    merged_shp = str(tmp_path / "merged.shp")
+    merge_shapefiles.merge_shapefiles([str(masks_dir / "{}.shp".format(layer)) for layer in layers],
+                                      list(range(1, len(layers) + 1)), merged_shp)
+    all_points = sorted(read_points(merged_shp))
+
+    K = 11
+    split_samples.k_split(merged_shp, str(tmp_path / "kfold"), K)
+
+    validation_points = []
+    for k in range(K):
+        train_shp = str(tmp_path / "train.shp")
+        validation_shp = str(tmp_path / "validation.shp")
+        masks_preprocessing.load_kfold(train_shp, validation_shp, k, str(tmp_path / "kfold"))
+
+        train_k, validation_k = read_points(train_shp), read_points(validation_shp)
+        assert sorted(train_k + validation_k) == all_points
+        validation_points.extend(validation_k)
+
+    assert sorted(validation_points) == all_points
+
+
+def test_incremental_split_assignment() -> None:
+    """
+    Check that the new points of a class are assigned deterministically, in
+    the wanted proportion with the points of the previous split, and that
+    the changed layers are detected.
+    """
+    hashes = [labels_state.geometry_hash(ogr.CreateGeometryFromWkt("POINT ({} {})".format(x, x * 3)), 2)
+              for x in range(2000)]
+    assignments = labels_state.new_points_assignment(hashes, [], 0.7)
+    assert assignments == labels_state.new_points_assignment(hashes[::-1], [], 0.7)
+    assert sum(assignments.values()) == 1400
+
+    # the new points complete the previous ones of the class
+    assert sum(labels_state.new_points_assignment(hashes[:10], [1] * 10, 0.7).values()) == 4
+    assert sum(labels_state.new_points_assignment(hashes[:10], [1] * 25, 0.7).values()) == 0
+    assert sum(labels_state.new_points_assignment(hashes[:3], [0] * 7, 0.7).values()) == 3
+
+    previous = {"water.shp:7": ["a", "b"], "land.shp:5": ["c"], "snow.shp:6": ["d"]}
+    current = {"water.shp:7": ["a", "b", "e"], "land.shp:5": ["c"], "background.shp:1": ["f"]}
+    assert labels_state.changed_layers(previous, current) == ["background.shp:1", "snow.shp:6", "water.shp:7"]
+
+
+def test_incremental_split_after_kfold(alcd_paths: ALCDTestsData, tmp_path) -> None:
+    """
+    Check that the incremental preprocessing writes its split again when a
+    K-fold run replaced it, even if no class layer changed.
+    """
+    output_dir = alcd_paths.data_dir / "test_incremental_split" / "Toulouse_31TCJ_20240305"
+    global_param_file, _ = prepare_test_dir(alcd_paths, output_dir, "rf_otb")
+    global_parameters = read_global_parameters(global_param_file)
+    global_parameters["training_parameters"]["incremental_preprocess"] = True
+    OTB_wf.create_directories(global_parameters)
+    training_shp = output_dir / "Intermediate" / global_parameters["general"]["training_shp"]
+
+    masks_preprocessing.masks_preprocess(global_parameters)
+    incremental_points = sorted(read_points(training_shp))
+    masks_preprocessing.masks_preprocess(global_parameters, k_fold_step=0, k_fold_dir=str(tmp_path / "kfold"))
+    assert sorted(read_points(training_shp)) != incremental_points
+
+    masks_preprocessing.masks_preprocess(global_parameters)
+    assert sorted(read_points(training_shp)) == incremental_points
@@ -0,0 +1,70 @@
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (test_tune_model.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+"""
+
+import json
+
+import numpy as np
+import pytest
+import sklearn.ensemble as sk
+
+import tune_model
+
+
+def test_search_parameters(tmp_path) -> None:
+    """
+    Check that the candidates of a grid and of a random space are
+    cross-validated with their timings, and that the chosen parameters are
+    written back in the model parameters file.
+    """
+    rng = np.random.default_rng(0)
+    x = rng.random((300, 3), dtype=np.float32)
+    y = (x[:, 0] > 0.5).astype(np.int32) + 1
+    groups = np.repeat(np.arange(30), 10)
+    classifier = sk.RandomForestClassifier(n_estimators=5, random_state=0)
+
+    candidates = tune_model.search_parameters(classifier, {"max_depth": [1, 4], "n_estimators": [5, 10]},
+                                              x, y, groups, folds=3, jobs=1, seed=0)
+    assert len(candidates) == 4
+    assert all(candidate["training_time_s"] > 0 for candidate in candidates)
+
+    candidates = tune_model.search_parameters(classifier, {"max_depth": {"distribution": "randint", "low": 1,
+                                                                         "high": 6}},
+                                              x, y, n_iter=3, folds=3, jobs=1, seed=0)
+    assert len(candidates) == 3 and isinstance(candidates[0]["parameters"]["max_depth"], int)
+
+    candidates = [{"accuracy": 0.95, "training_time_s": 4., "prediction_time_s": 1., "parameters": {"max_depth": 20}},
+                  {"accuracy": 0.948, "training_time_s": 1., "prediction_time_s": .5, "parameters": {"max_depth": 8}}]
+    assert tune_model.choose_candidate(candidates)["parameters"] == {"max_depth": 20}
+    assert tune_model.choose_candidate(candidates, 0.005)["parameters"] == {"max_depth": 8}
+
+    with pytest.raises(ValueError):
+        tune_model.check_space("rf_scikit", {"max_leaf_nodes": [10, 100]})
+
+    model_parameters = str(tmp_path / "model_parameters.json")
+    with open(model_parameters, 'w') as json_file:
+        json.dump({"rf_scikit": {"n_estimators": 100, "max_depth": 25, "random_state": 42,
+                                 "min_samples_split": 2}}, json_file)
+    tune_model.write_parameters(model_parameters, "rf_scikit", {"max_depth": 8})
+    with open(model_parameters, 'r') as json_file:
+        assert json.load(json_file)["rf_scikit"] == {"n_estimators": 100, "max_depth": 8, "random_state": 42,
+                                                     "min_samples_split": 2}
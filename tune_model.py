@@ -0,0 +1,249 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Tool to generate reference cloud masks for validation of operational cloud masks.
+The elaboration is performed using an active learning procedure.
+
+==================== Copyright
+Software (tune_model.py)
+
+Copyright© 2019 Centre National d’Etudes Spatiales
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License version 3
+as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public
+License along with this program.  If not, see
+https://www.gnu.org/licenses/gpl-3.0.fr.html
+
+Tuning of the parameters of a scikit method on the extracted samples.
+
+The search space is a JSON file giving for each parameter a list of values,
+or for a random search a distribution:
+    {"n_estimators": [50, 100, 200],
+     "max_depth": {"distribution": "randint", "low": 5, "high": 30}}
+Each candidate is evaluated by a cross-validation on the samples of the last
+run (Samples/training_samples_store), the folds being processed in
+parallel. The samples drawn around the same labelled point are kept in the
+same fold. The image is not classified. The accuracy and the training and
+prediction times of each candidate are written in
+Statistics/tuning_<method>.json, and the parameters of the best candidate
+(or of the fastest one within tolerance of its accuracy) are written in the
+model parameters file.
+
+Example:
+python tune_model.py -global_parameters global_parameters.json -model_parameters model_parameters.json
+    -space rf_space.json -n_iter 20 -tolerance 0.005
+"""
+import argparse
+import json
+import os.path as op
+import typing
+from typing import List, Optional
+
+import numpy as np
+from scipy import stats
+from sklearn.model_selection import (GridSearchCV, RandomizedSearchCV, StratifiedGroupKFold,
+                                     StratifiedKFold)
+
+import OTB_workflow
+import sample_store
+from alcd_params.models_parameters import MLConfig
+from alcd_params.params_reader import read_global_parameters, read_models_parameters
+
+DISTRIBUTIONS = {"uniform": lambda low, high: stats.uniform(low, high - low),
+                 "loguniform": stats.loguniform,
+                 "randint": stats.randint}
+
+
+def check_space(method: str, space: dict):
+    """
+    Check that the parameters of the search space are the ones of the
+    configuration of the method, the others not being read back.
+    """
+    if "scikit" not in method:
+        raise ValueError('Only the scikit methods can be tuned, not {}'.format(method))
+    config_class = typing.get_args(MLConfig.model_fields[method].annotation)[0]
+    unknown = [name for name in space if name not in config_class.model_fields]
+    if unknown:
+        raise ValueError('Parameters {} are not in the configuration of {}: {}'.format(
+            unknown, method, list(config_class.model_fields)))
+
+
+def to_distributions(space: dict) -> dict:
+    """
+    Parameters of the scikit search: the lists of values as they are, the
+    distributions as scipy.stats distributions.
+    """
+    return {name: values if isinstance(values, list) else
+            DISTRIBUTIONS[values["distribution"]](values["low"], values["high"])
+            for name, values in space.items()}
+
+
+def get_folds(y: np.ndarray, groups: Optional[np.ndarray], folds: int, seed=None):
+    """
+    Cross-validation folds, stratified by class, and by origin of the
+    samples if there are enough labelled points for it.
+    """
+    if groups is not None and len(np.unique(groups)) >= folds:
+        return list(StratifiedGroupKFold(n_splits=folds, shuffle=True, random_state=seed).split(
+            np.zeros(len(y)), y, groups))
+    return list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(np.zeros(len(y)), y))
+
+
+def search_parameters(classifier, space: dict, x: np.ndarray, y: np.ndarray, groups: Optional[np.ndarray] = None,
+                      n_iter: int = 0, folds: int = 5, jobs: int = -1, seed=None) -> List[dict]:
+    '''
+    Cross-validate the candidates of a search space
+
+    Parameters
+    ----------
+    classifier
+        Untrained scikit classifier, with the parameters not searched.
+    space : dict
+        Lists of values of the parameters, or distributions for a random search.
+    x, y : np.ndarray
+        Samples.
+    groups : Optional[np.ndarray]
+        Origin of each sample, the samples of an origin being in a same fold.
+    n_iter : int
+        Number of random candidates, all the combinations of the lists of
+        values if 0.
+    folds : int
+        Number of folds of the cross-validation.
+    jobs : int
+        Number of parallel fits, all the cores if -1.
+    seed
+        Random seed of the folds and of the candidates.
+
+    Returns
+    -------
+    List[dict]
+        For each candidate, its parameters, the mean and standard deviation
+        of its accuracy, and its mean training and prediction times.
+    '''
+    cv = get_folds(y, groups, folds, seed)
+    if n_iter > 0:
+        search = RandomizedSearchCV(classifier, to_distributions(space), n_iter=n_iter, cv=cv, n_jobs=jobs,
+                                    random_state=seed, refit=False)
+    else:
+        if not all(isinstance(values, list) for values in space.values()):
+            raise ValueError('A grid search needs lists of values, set n_iter for the distributions')
+        search = GridSearchCV(classifier, space, cv=cv, n_jobs=jobs, refit=False)
+    search.fit(x, y)
+
+    results = search.cv_results_
+    # the numpy values drawn from the distributions as Python ones, for the JSON files
+    return [{"parameters": {name: value.item() if isinstance(value, np.generic) else value
+                            for name, value in parameters.items()},
+             "accuracy": float(results["mean_test_score"][k]), "accuracy_std": float(results["std_test_score"][k]),
+             "training_time_s": float(results["mean_fit_time"][k]),
+             "prediction_time_s": float(results["mean_score_time"][k])}
+            for k, parameters in enumerate(results["params"])]
+
+
+def choose_candidate(candidates: List[dict], tolerance: float = 0.) -> dict:
+    """
+    The fastest candidate (training and prediction) whose accuracy is within
+    tolerance of the best one.
+    """
+    best = max(candidate["accuracy"] for candidate in candidates)
+    acceptable = [candidate for candidate in candidates if candidate["accuracy"] >= best - tolerance]
+    return min(acceptable, key=lambda candidate: (candidate["training_time_s"] + candidate["prediction_time_s"],
+                                                  -candidate["accuracy"]))
+
+
+def write_parameters(model_parameters_file: str, method: str, parameters: dict):
+    """
+    Write parameters of a method in the model parameters file, checked
+    against its configuration first.
+    """
+    with open(model_parameters_file, 'r') as json_file:
+        data = json.load(json_file)
+    data[method] = dict(data.get(method) or {}, **parameters)
+    MLConfig(**data)
+    with open(model_parameters_file, 'w') as json_file:
+        json.dump(data, json_file, indent=4)
+
+
+def tune_model(global_parameters_file, model_parameters_file, space_file, method=None, n_iter=0, folds=5, jobs=-1,
+               tolerance=0., write='true'):
+    global_parameters = read_global_parameters(global_parameters_file)
+    model_parameters = read_models_parameters(model_parameters_file)
+    method = method or global_parameters["classification"]["method"]
+    main_dir = global_parameters["user_choices"]["main_dir"]
+    seed = global_parameters["training_parameters"]["random_seed"]
+    with open(space_file, 'r') as json_file:
+        space = json.load(json_file)
+    check_space(method, space)
+
+    # the samples of the last run
+    store = sample_store.get_store_path(global_parameters)
+    if not op.exists(store):
+        raise FileNotFoundError('No samples in {}, run the step 1 of ALCD first'.format(store))
+    x, y, _ = sample_store.load_sample_store(store, mmap=False)
+    samples_sqlite = op.join(main_dir, 'Samples', global_parameters["general"]["training_samples_extracted"])
+    groups = sample_store.load_samples_origins(samples_sqlite) if op.exists(samples_sqlite) else None
+    if groups is not None and len(groups) != len(y):
+        groups = None
+
+    print('  Tuning of {} on {} samples'.format(method, len(y)))
+    classifier = OTB_workflow.get_scikit_classifier(method, model_parameters)
+    candidates = search_parameters(classifier, space, x, y, groups, int(n_iter), int(folds), int(jobs), seed)
+    chosen = choose_candidate(candidates, float(tolerance))
+    for candidate in sorted(candidates, key=lambda candidate: -candidate["accuracy"]):
+        print('{:.4f} (+/- {:.4f}) training {:.2f} s, prediction {:.2f} s: {}'.format(
+            candidate["accuracy"], candidate["accuracy_std"], candidate["training_time_s"],
+            candidate["prediction_time_s"], candidate["parameters"]))
+    print('Chosen parameters: {}'.format(chosen["parameters"]))
+
+    with open(op.join(main_dir, 'Statistics', 'tuning_{}.json'.format(method)), 'w') as json_file:
+        json.dump({"method": method, "samples_nb": int(len(y)), "folds": int(folds), "space": space,
+                   "candidates": candidates, "chosen": chosen}, json_file, indent=3)
+    if str(write).lower() in ('yes', 'true', 't', 'y', '1'):
+        write_parameters(model_parameters_file, method, chosen["parameters"])
+        print('Written in {}'.format(model_parameters_file))
+    return chosen
+
+
+def getarguments():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-global_parameters', dest='global_parameters_file',
+                        help='str, path to json file which parametrize ALCD', required=True)
+    parser.add_argument('-model_parameters', dest='model_parameters_file',
+                        help='str, path to json file which contain classifier parameters', required=True)
+    parser.add_argument('-space', dest='space_file', required=True,
+                        help='str, path to json file with the values or distribution of each parameter')
+    parser.add_argument('-method', dest='method', default=None,
+                        help='str, scikit method to tune, the one of the global parameters by default')
+    parser.add_argument('-n_iter', dest='n_iter', type=int, default=0,
+                        help='Int, number of random candidates, all the combinations if 0')
+    parser.add_argument('-folds', dest='folds', type=int, default=5,
+                        help='Int, number of folds of the cross-validation')
+    parser.add_argument('-jobs', dest='jobs', type=int, default=-1,
+                        help='Int, number of parallel fits, all the cores if -1')
+    parser.add_argument('-tolerance', dest='tolerance', type=float, default=0.,
+                        help='Float, accuracy the fastest candidate can lose compared to the best one')
+    parser.add_argument('-write', dest='write', default='true',
+                        help='Bool, write the chosen parameters in the model parameters file')
+    results = parser.parse_args()
+    return vars(results)
+
+
+def main():
+    """
+    It parses the command line arguments and calls the tune_model function.
+    """
+    args = getarguments()
+    tune_model(**args)
+
+
+if __name__ == '__main__':
+    main()